@@ -0,0 +1,195 @@
+"""
+Benchmarks the request path of each cog offline, against a local stand-in for the upstream APIs.
+
+Record fixtures once, against the live APIs (needs the API keys in config.ini):
+
+    python -m benchmarks.cog_paths --record
+
+Then benchmark as often as needed, from the repository root so that config.ini is found:
+
+    python -m benchmarks.cog_paths --iterations 200 --concurrency 10 --latency 80 --jitter 20 --cold
+
+Each path is driven through the cog's own code with a fake interaction, through the real upstream client, so the
+response cache, request coalescing and per-host limits all behave as they do in production. --cold empties the
+in-memory response cache before every call, to measure the path as if each request were the first. Results can be
+appended to a JSON lines file with --output, tagged with the current commit, to track them across commits.
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import time
+
+from benchmarks.fakes import FakeInteraction, make_bot
+from benchmarks.fixtures import FixtureStore
+from benchmarks.reporting import print_table, summarize
+from benchmarks.standin import StandInUpstream
+from dua.dua import Dua
+from hadith.hadith import HadithCommands, Reference
+from hadith.transmitter_biographies import Biographies
+from quran.morphology import QuranMorphology
+from quran.quran import QuranRequest
+from quran.quran_info import QuranReference
+from salaah.salaah_times import PrayerTimes
+from tafsir.arabic_tafsir import ArabicTafsir, ArabicTafsirRequest
+from tafsir.tafsir import Tafsir
+from utils.http_client import upstream
+from utils.response_cache import response_cache
+
+
+async def quran_path(cogs, interaction, ref):
+    await QuranRequest(interaction=interaction, ref=ref, is_arabic=False, translation_key='haleem').process_request()
+
+
+async def aquran_path(cogs, interaction, ref):
+    await QuranRequest(interaction=interaction, ref=ref, is_arabic=True).process_request()
+
+
+async def hadith_path(cogs, interaction, collection, number):
+    await cogs[HadithCommands].abstract_hadith(interaction, collection, Reference(number), 'en')
+
+
+async def tafsir_path(cogs, interaction, ref, tafsir):
+    spec = await cogs[Tafsir].process_request(ref=ref, tafsir=tafsir, page=1)
+    await cogs[Tafsir].send_embed(interaction, spec)
+
+
+async def atafsir_path(cogs, interaction, ref, tafsir):
+    reference = QuranReference(ref=ref)
+    await cogs[ArabicTafsir].send(interaction, ArabicTafsirRequest(reference.surah, reference.ayat_list, tafsir))
+
+
+async def dua_path(cogs, interaction, subject):
+    await cogs[Dua]._dua(interaction, subject)
+
+
+async def prayer_times_path(cogs, interaction, location):
+    await cogs[PrayerTimes]._prayer_times(interaction, location, calculation_method=4)
+
+
+async def biography_path(cogs, interaction, name):
+    await cogs[Biographies]._biography(interaction, name)
+
+
+async def morphology_path(cogs, interaction, ref):
+    await cogs[QuranMorphology]._morphology(interaction, ref)
+
+
+# Each path, with the arguments it is called with in turn.
+PATHS = {
+    'quran': (quran_path, [('2:255',), ('1:1-7',), ('112:1-4',)]),
+    'aquran': (aquran_path, [('2:255',), ('1:1-7',), ('112:1-4',)]),
+    'hadith': (hadith_path, [('bukhari', '1'), ('muslim', '8'), ('bukhari', '6018')]),
+    'tafsir': (tafsir_path, [('2:255', 'jalalayn'), ('1:1', 'ibnkathir'), ('112:1', 'maarifulquran')]),
+    'atafsir': (atafsir_path, [('2:255', 'tabari'), ('1:1', 'qurtubi'), ('112:1', 'saadi')]),
+    'dua': (dua_path, [('anxiety',), ('travel',), ('entering mosque',)]),
+    'prayertimes': (prayer_times_path, [('London',), ('Makkah',), ('Jakarta',)]),
+    'biography': (biography_path, [('عبد الله بن عباس',), ('أبو هريرة',)]),
+    'morphology': (morphology_path, [('1:1:1',), ('2:255:3',), ('112:1:2',)]),
+}
+
+
+async def load_cogs() -> dict:
+    bot = make_bot()
+    cogs = {cog_class: cog_class(bot) for cog_class in
+            (HadithCommands, Tafsir, ArabicTafsir, Dua, PrayerTimes, Biographies, QuranMorphology)}
+    # Prayer times are labelled with the names of the calculation methods, which the cog fetches on load.
+    try:
+        await cogs[PrayerTimes].update_calculation_methods()
+    except Exception as e:
+        print(f'Could not load the prayer time calculation methods: {type(e).__name__}: {e}')
+    return cogs
+
+
+async def run_path(cogs: dict, name: str, iterations: int, concurrency: int, cold: bool) -> dict:
+    path, argument_sets = PATHS[name]
+    latencies = []
+    failures = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(i: int):
+        nonlocal failures
+        async with semaphore:
+            if cold:
+                response_cache.clear()
+            interaction = FakeInteraction()
+            start = time.perf_counter()
+            try:
+                await path(cogs, interaction, *argument_sets[i % len(argument_sets)])
+            except Exception as e:
+                failures += 1
+                if failures == 1:
+                    print(f'{name} failed: {type(e).__name__}: {e}')
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call(i) for i in range(iterations)))
+    return {**summarize(latencies, time.perf_counter() - start), 'failures': failures}
+
+
+async def record(store: FixtureStore, names: list):
+    """ Runs every path once per argument set against the live APIs, saving each response as a fixture. """
+    upstream.response_hooks.append(store.save)
+    cogs = await load_cogs()
+    for name in names:
+        path, argument_sets = PATHS[name]
+        for arguments in argument_sets:
+            try:
+                await path(cogs, FakeInteraction(), *arguments)
+            except Exception as e:
+                print(f'{name}{arguments} failed: {type(e).__name__}: {e}')
+    print(f'Recorded fixtures to {store.directory}')
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Benchmarks each cog\'s request path against recorded fixtures.')
+    parser.add_argument('--record', action='store_true', help='Record fixtures from the live APIs instead.')
+    parser.add_argument('--paths', nargs='+', choices=list(PATHS), default=list(PATHS))
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=50, help='Stand-in upstream latency, in milliseconds.')
+    parser.add_argument('--jitter', type=float, default=0, help='Random variation of the latency, in milliseconds.')
+    parser.add_argument('--cold', action='store_true', help='Empty the response cache before every call.')
+    parser.add_argument('--fixtures', help='Directory of recorded fixtures.')
+    parser.add_argument('--output', help='A JSON lines file to append the results to.')
+    args = parser.parse_args()
+
+    store = FixtureStore(args.fixtures) if args.fixtures else FixtureStore()
+    # Responses must come from the live APIs or the fixtures, never from an earlier run's disk cache.
+    upstream.use_disk_cache = False
+    await upstream.start()
+    standin = None
+    try:
+        if args.record:
+            return await record(store, args.paths)
+
+        standin = StandInUpstream(store, latency=args.latency / 1000, jitter=args.jitter / 1000)
+        await standin.start()
+        standin.install(upstream)
+        cogs = await load_cogs()
+        results = {name: await run_path(cogs, name, args.iterations, args.concurrency, args.cold) for name in args.paths}
+    finally:
+        if standin is not None:
+            await standin.close()
+        await upstream.close()
+
+    print_table(results)
+    if standin.missing:
+        print(f'{len(standin.missing)} URLs had no fixture, e.g. {next(iter(standin.missing))}. '
+              f'Run with --record to capture them.')
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'commit': current_commit(), 'time': time.time(), 'arguments': vars(args),
+                                'results': results}) + '\n')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+"""
+Stand-ins for the parts of discord.py that the cogs touch, so command code can run without a gateway connection.
+Messages are recorded instead of being sent, and views attached to them are stopped straight away so that their
+timeouts do not pile up over a benchmark.
+"""
+import itertools
+import random
+from types import SimpleNamespace
+
+import discord
+from discord.ext import commands
+
+_ids = itertools.count(10 ** 17)
+CHANNEL_ID = 4 * 10 ** 17
+
+
+def record_message(messages: list, content=None, **kwargs):
+    view = kwargs.get('view')
+    if isinstance(view, discord.ui.View):
+        view.stop()
+    messages.append({'content': content, **kwargs})
+
+
+class FakeResponse:
+    def __init__(self, interaction: 'FakeInteraction'):
+        self.interaction = interaction
+        self.deferred = False
+        self.responded = False
+
+    def is_done(self) -> bool:
+        return self.deferred or self.responded
+
+    async def defer(self, *, ephemeral: bool = False, thinking: bool = False):
+        self.deferred = True
+
+    async def send_message(self, content=None, **kwargs):
+        self.responded = True
+        record_message(self.interaction.messages, content, **kwargs)
+
+    async def edit_message(self, content=None, **kwargs):
+        self.responded = True
+        record_message(self.interaction.messages, content, **kwargs)
+
+
+class FakeFollowup:
+    def __init__(self, interaction: 'FakeInteraction'):
+        self.interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        record_message(self.interaction.messages, content, **kwargs)
+
+
+class FakeInteraction:
+    """ Has the attributes of discord.Interaction that the cogs use. """
+
+    def __init__(self, guild_id: int = None, user_id: int = None):
+        self.id = next(_ids)
+        self.created_at = discord.utils.utcnow()
+        self.guild_id = guild_id if guild_id is not None else next(_ids)
+        self.user = SimpleNamespace(id=user_id if user_id is not None else next(_ids))
+        self.command = None
+        self.messages = []
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+    async def edit_original_response(self, **kwargs):
+        record_message(self.messages, **kwargs)
+
+    async def original_response(self):
+        return SimpleNamespace(edit=self.edit_original_response)
+
+
+def make_bot() -> commands.Bot:
+    """ A bot that is never connected, for cogs that need one to register their commands with. """
+    return commands.Bot(command_prefix='-', intents=discord.Intents.none())
+
+
+def interaction_payload(application_id: int, token: str, data: dict, interaction_type: int = 2, guild_id: int = None,
+                        user_id: int = None, locale: str = 'en-US') -> dict:
+    """ An INTERACTION_CREATE payload as the gateway delivers it, created now. Without a guild it comes from a DM. """
+    now = discord.utils.utcnow()
+    user = {'id': str(user_id if user_id is not None else next(_ids)), 'username': 'benchmark', 'discriminator': '0000',
+            'avatar': None}
+    permissions = str(discord.Permissions.text().value)
+    payload = {
+        'id': str(discord.utils.time_snowflake(now) + random.randrange(1 << 22)),
+        'application_id': str(application_id),
+        'type': interaction_type,
+        'token': token,
+        'version': 1,
+        'locale': locale,
+        'data': {'id': '1', 'type': 1, **data},
+        'app_permissions': permissions,
+    }
+    if guild_id is not None:
+        payload['guild_id'] = str(guild_id)
+        payload['context'] = 0
+        payload['channel'] = {'id': str(CHANNEL_ID), 'type': 0, 'guild_id': str(guild_id), 'name': 'benchmark',
+                              'position': 0, 'permission_overwrites': [], 'nsfw': False, 'parent_id': None}
+        payload['member'] = {'user': user, 'roles': [], 'joined_at': now.isoformat(), 'deaf': False, 'mute': False,
+                             'flags': 0, 'permissions': permissions}
+    else:
+        payload['context'] = 1
+        payload['channel'] = {'id': str(CHANNEL_ID), 'type': 1, 'recipients': [user]}
+        payload['user'] = user
+    return payload
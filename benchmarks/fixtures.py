@@ -0,0 +1,52 @@
+import base64
+import hashlib
+import json
+import os
+
+from yarl import URL
+
+# Recorded upstream responses, one JSON file per URL under a directory per host.
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+class FixtureStore:
+    def __init__(self, directory: str = DEFAULT_DIRECTORY):
+        self.directory = directory
+
+    def path_for(self, url: str) -> str:
+        digest = hashlib.sha256(url.encode()).hexdigest()[:20]
+        return os.path.join(self.directory, URL(url).host, f'{digest}.json')
+
+    def save(self, response):
+        """ Records an UpstreamResponse. Text bodies are stored as they are, so fixtures can be read and edited. """
+        try:
+            body, encoding = response.body.decode('utf-8'), 'utf-8'
+        except UnicodeDecodeError:
+            body, encoding = base64.b64encode(response.body).decode(), 'base64'
+
+        path = self.path_for(response.url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'url': response.url,
+                'status': response.status,
+                'content_type': response.headers.get('Content-Type', 'application/octet-stream'),
+                'encoding': encoding,
+                'body': body,
+            }, f, ensure_ascii=False, indent=1)
+
+    def load_all(self) -> dict:
+        """ Returns every fixture keyed by URL, with its body decoded to bytes. """
+        fixtures = {}
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                with open(os.path.join(root, name), encoding='utf-8') as f:
+                    fixture = json.load(f)
+                if fixture['encoding'] == 'base64':
+                    fixture['body'] = base64.b64decode(fixture['body'])
+                else:
+                    fixture['body'] = fixture['body'].encode('utf-8')
+                fixtures[fixture['url']] = fixture
+        return fixtures
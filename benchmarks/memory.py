@@ -0,0 +1,236 @@
+"""
+Measures the memory held by each open paginated message and cache entry, and checks it against a budget.
+
+Paginated messages are stateless: their buttons carry all they need in their custom_ids, and their content is kept
+in a bounded page cache instead. This sends `--views` page buttons as the cogs do, checking that discord.py keeps
+nothing for them, and fills fresh caches with `--entries` entries, measuring with tracemalloc how many bytes each one
+adds. Run from the repository root:
+
+    python -m benchmarks.memory --views 100000 --entries 100000
+
+It exits non-zero if anything is over its budget in BUDGETS. --top shows where the memory of each goes, for finding
+out why a budget was exceeded. Budgets are set with headroom over what was measured when they were last reviewed;
+raise one only on purpose, with a reason, as all of them are multiplied by the number of open messages or entries.
+"""
+import argparse
+import asyncio
+import copy
+import gc
+import itertools
+import sys
+import tracemalloc
+
+from multidict import CIMultiDict
+from yarl import URL
+
+from benchmarks.fakes import make_bot
+from benchmarks.micro import (ARABIC_SENTENCE, ENGLISH_SENTENCE, arabic_hadith_html, arabic_tafsir_page,
+                              english_hadith_html)
+from benchmarks.reporting import print_table
+from hadith.hadith import HadithSpecifics, Reference
+from hadith.transmitter_biographies import Biography
+from tafsir.arabic_tafsir import ArabicTafsirRequest
+from tafsir.tafsir import TafsirRequest
+from utils.http_client import UpstreamResponse
+from utils.pagination import ContentCache, Paginator, page_view
+from utils.response_cache import FOREVER, ResponseCache
+from utils.settings_cache import ABSENT, SettingsCache
+
+# Bytes each open message or cache entry may add, including the text it holds.
+BUDGETS = {
+    'Open paginated message': 64,
+    'ContentCache (hadith)': 8_500,
+    'ContentCache (tafsir)': 18_000,
+    'ContentCache (Arabic tafsir)': 34_000,
+    'ContentCache (biography)': 30_000,
+    'ResponseCache (hadith JSON)': 21_000,
+    'ResponseCache (tafsir HTML)': 61_000,
+    'SettingsCache': 450,
+}
+
+RESPONSE_HEADERS = {
+    'Content-Type': 'application/json; charset=utf-8',
+    'Date': 'Mon, 01 Jan 2024 00:00:00 GMT',
+    'Server': 'cloudflare',
+    'ETag': 'W/"5f2a-1c9b2d5e"',
+    'Cache-Control': 'public, max-age=86400',
+    'Vary': 'Accept-Encoding',
+}
+
+
+def own(text: str) -> str:
+    """ A copy of a string that is not shared with the original, as if it had been fetched separately. """
+    return text.encode().decode()
+
+
+def own_pages(pages: Paginator) -> Paginator:
+    """ A copy of pages with their own text, counted as when their first page is shown. """
+    clone = Paginator(own(pages.text), pages.width, pages.break_long_words)
+    len(clone)
+    return clone
+
+
+def unshare(request):
+    """ A copy of a request object with its own text and reference, as each command builds one from scratch. """
+    clone = copy.copy(request)
+    for name, value in vars(clone).items():
+        if isinstance(value, str):
+            setattr(clone, name, own(value))
+        elif isinstance(value, Paginator):
+            setattr(clone, name, own_pages(value))
+    if hasattr(clone, 'ref'):
+        clone.ref = copy.copy(clone.ref)
+    if hasattr(clone, 'text') and request.text is getattr(request.pages, 'text', None):
+        # As the pages are of the text, the two share it.
+        clone.text = clone.pages.text
+    return clone
+
+
+class Documents:
+    """ Builds the content of paginated messages as the cogs do, processed once up front and then copied for each. """
+
+    def __init__(self):
+        hadith = {'hadithNumber': '1', 'hadith': [
+            {'body': english_hadith_html(sentences=12), 'chapterTitle': 'How the Divine Revelation started', 'grades': []},
+            {'body': arabic_hadith_html(notes=20), 'chapterTitle': 'كيف كان بدء الوحى', 'grades': []},
+        ]}
+        self.hadith = HadithSpecifics('bukhari', Reference('1'), 'en')
+        self.hadith.process_hadith(hadith)
+
+        self.tafsir = TafsirRequest('jalalayn', '2:255', 1)
+        self.tafsir.pages = Paginator(ENGLISH_SENTENCE * 40, 2000, break_long_words=False)
+        self.tafsir.text = self.tafsir.pages.text
+        self.tafsir.num_pages = len(self.tafsir.pages)
+        self.tafsir.tafsir_author = 'Jalal ad-Din al-Maḥalli and Jalal ad-Din as-Suyuti'
+        self.tafsir.make_embed()
+
+        self.arabic_tafsir = ArabicTafsirRequest(2, 255, 'tabari')
+        self.arabic_tafsir.url = 'https://tafsir.app/tabari/2/255'
+        self.arabic_tafsir.process_text(arabic_tafsir_page(paragraphs=20))
+
+        self.biography = Paginator(ARABIC_SENTENCE * 60, 2040, break_long_words=False)
+
+    def hadith_document(self, i: int):
+        return unshare(self.hadith)
+
+    def tafsir_document(self, i: int):
+        tafsir = unshare(self.tafsir)
+        tafsir.make_embed()
+        return tafsir
+
+    def arabic_tafsir_document(self, i: int):
+        return unshare(self.arabic_tafsir)
+
+    def biography_document(self, i: int):
+        return Biography(own('أبو هريرة الدوسي اليماني'), own_pages(self.biography))
+
+
+def open_messages(state, count: int) -> list:
+    """ Sends the page buttons of `count` messages, as far as discord.py's view store is concerned. """
+    message_ids = itertools.count(10 ** 18)
+    for i in range(count):
+        view = page_view('hadith', f'bukhari|en|{i}', i % 10 + 1)
+        # As when a message with the view is sent.
+        if not view.is_finished():
+            state.store_view(view, next(message_ids))
+    return []
+
+
+def fill_content_cache(count: int, document) -> ContentCache:
+    cache = ContentCache(max_entries=count, max_bytes=sys.maxsize)
+    for i in range(count):
+        cache.put('benchmark', str(i), document(i))
+    return cache
+
+
+def fill_response_cache(count: int, body: bytes, url: str) -> ResponseCache:
+    cache = ResponseCache(max_entries=count, max_bytes=sys.maxsize, default_ttl=FOREVER, negative_ttl=300,
+                          max_stale=0, ttls={})
+    for i in range(count):
+        target = url.format(i)
+        response = UpstreamResponse(url=target, status=200, body=body + str(i).encode(),
+                                    headers=CIMultiDict(RESPONSE_HEADERS))
+        cache.put(URL(target), response)
+    return cache
+
+
+def fill_settings_cache(count: int) -> SettingsCache:
+    cache = SettingsCache(max_entries=count, ttl=600, max_stale=3600)
+    for i in range(count):
+        # Most guilds never change a default, so their lookups cache the absence of a row.
+        cache.put('server_translations', 2 * 10 ** 17 + i, 'haleem' if i % 4 == 0 else ABSENT)
+    return cache
+
+
+def measure(build, count: int, top: int) -> tuple:
+    """ Returns the bytes added per item by `build(count)`, and the allocation sites that added the most. """
+    gc.collect()
+    before = tracemalloc.take_snapshot() if top else None
+    start = tracemalloc.get_traced_memory()[0]
+    kept = build(count)
+    gc.collect()
+    added = tracemalloc.get_traced_memory()[0] - start
+    sites = tracemalloc.take_snapshot().compare_to(before, 'lineno')[:top] if top else []
+    return added / count, sites, kept
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description='Measures the memory held per live view and cache entry.')
+    parser.add_argument('--views', type=int, default=10000, help='How many paginated messages to open.')
+    parser.add_argument('--entries', type=int, default=10000, help='How many entries to put in each cache.')
+    parser.add_argument('--only', default='', help='Only measure items whose name contains this.')
+    parser.add_argument('--top', type=int, default=0, help='Show this many of the largest allocation sites of each.')
+    args = parser.parse_args()
+
+    tracemalloc.start(5 if args.top else 1)
+    state = make_bot()._connection
+    documents = Documents()
+    hadith_json = (english_hadith_html(sentences=12) + arabic_hadith_html(notes=20)).encode() * 2
+    tafsir_html = arabic_tafsir_page(paragraphs=40).encode()
+
+    items = {
+        'Open paginated message': (lambda count: open_messages(state, count), args.views),
+        'ContentCache (hadith)': (lambda count: fill_content_cache(count, documents.hadith_document), args.entries),
+        'ContentCache (tafsir)': (lambda count: fill_content_cache(count, documents.tafsir_document), args.entries),
+        'ContentCache (Arabic tafsir)': (
+            lambda count: fill_content_cache(count, documents.arabic_tafsir_document), args.entries),
+        'ContentCache (biography)': (
+            lambda count: fill_content_cache(count, documents.biography_document), args.entries),
+        'ResponseCache (hadith JSON)': (
+            lambda count: fill_response_cache(count, hadith_json, 'https://api.sunnah.com/v1/collections/bukhari/hadiths/{}'),
+            args.entries),
+        'ResponseCache (tafsir HTML)': (
+            lambda count: fill_response_cache(count, tafsir_html, 'https://tafsir.app/tabari/2/{}'), args.entries),
+        'SettingsCache': (fill_settings_cache, args.entries),
+    }
+
+    rows = {}
+    over_budget = []
+    for name, (build, count) in items.items():
+        if args.only not in name:
+            continue
+        each, sites, kept = measure(build, count, args.top)
+        # Freed before the next build, so that the two are never alive at once.
+        del kept
+        gc.collect()
+
+        budget = BUDGETS[name]
+        rows[name] = {'count': count, 'bytes_each': each, 'budget': budget, 'total_mb': each * count / 2 ** 20,
+                      'status': 'OK' if each <= budget else 'OVER'}
+        if each > budget:
+            over_budget.append(name)
+        if sites:
+            print(f'\n{name}, largest allocation sites per item:')
+            for site in sites:
+                print(f'  {site.size_diff / count:>10.0f} B  {site.traceback[0]}')
+
+    print()
+    print_table(rows)
+    if over_budget:
+        print(f'\nOver budget: {", ".join(over_budget)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
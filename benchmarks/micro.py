@@ -0,0 +1,221 @@
+"""
+Microbenchmarks of the pure functions that run on every request, with regression checks against stored baselines.
+
+Run from the repository root so that config.ini is found. Record baselines on the machine the checks will run on:
+
+    python -m benchmarks.micro --save
+
+and later, e.g. before merging a change, fail if any function got more than 10% slower:
+
+    python -m benchmarks.micro --threshold 10
+
+Each function is timed with timeit, taking the fastest of several repeats, which is the least noisy estimate of what
+the code itself costs. Inputs are generated to look like the worst of what the bot really handles: long tafsir pages
+full of Qur'an quotes and footnotes, and Arabic hadith with many bracketed notes. Timings only compare meaningfully
+on the same machine and Python version, so those are stored with the baselines and a mismatch is warned about.
+
+Pagination is also compared against textwrap.wrap, which it replaced, on tafsirs as long as the longest ones, such as
+al-Razi's and al-Tabari's, which run to a million characters for some verses:
+
+    python -m benchmarks.micro --filter "1M chars"
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import textwrap
+import timeit
+
+from benchmarks.cog_paths import current_commit
+from benchmarks.reporting import print_table
+from hadith.hadith import HadithSpecifics
+from quran.quran_info import QuranReference, SurahNameTransformer
+from salaah.praytimes import PrayTimes
+from tafsir.arabic_tafsir import ArabicTafsirRequest
+from utils.pagination import Paginator
+from utils.utils import convert_to_arabic_number
+
+# Characters in the longest tafsirs of a single verse.
+LONGEST_TAFSIR = 1_000_000
+DEFAULT_BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'micro_baselines.json')
+
+ARABIC_SENTENCE = ('قال أبو جعفر: يعني بذلك جل ثناؤه أن الله الذي له عبادة الخلق لا إله إلا هو الحي القيوم، '
+                   'الذي لا يموت ولا يزول، والقائم بأمر خلقه في أرزاقهم وآجالهم وأعمالهم. ')
+QURAN_QUOTE = '{اللَّهُ لَا إِلَهَ إِلَّا هُوَ الْحَيُّ الْقَيُّومُ}'
+HADITH_QUOTE = '«مَنْ قَرَأَ آيَةَ الْكُرْسِيِّ فِي دُبُرِ كُلِّ صَلَاةٍ لَمْ يَمْنَعْهُ مِنْ دُخُولِ الْجَنَّةِ إِلَّا الْمَوْتُ»'
+ENGLISH_SENTENCE = ('Allah - there is no deity except Him, the Ever-Living, the Sustainer of existence. Neither '
+                    'drowsiness overtakes Him nor sleep. To Him belongs whatever is in the heavens and the earth. ')
+
+
+def arabic_tafsir_page(paragraphs: int = 60, footnotes: int = 1) -> str:
+    """ A tafsir.app page as long as the longest tafsirs, with quotes, asides and footnotes in every paragraph. """
+    body = []
+    for i in range(paragraphs):
+        notes = ''.join(f'[[أخرجه الطبري في تفسيره رقم {i + 1}.{j + 1}]] ' for j in range(footnotes))
+        body.append(f'{ARABIC_SENTENCE}{QURAN_QUOTE} {ARABIC_SENTENCE}(وهو قول ابن عباس) {HADITH_QUOTE} {notes}#')
+    return f'<html><body><div id="preloaded">{"".join(body)}</div></body></html>'
+
+
+def arabic_hadith_html(notes: int = 40) -> str:
+    parts = [f'حَدَّثَنَا الْحُمَيْدِيُّ عَبْدُ اللَّهِ بْنُ الزُّبَيْرِ [{i}] قَالَ حَدَّثَنَا سُفْيَانُ [انظر الحديث رقم {i}] '
+             for i in range(notes)]
+    return f'<p>{"".join(parts)}</p><b>صحيح</b>'
+
+
+def english_hadith_html(sentences: int = 30) -> str:
+    parts = [f'<p>Narrated <b>`Umar bin Al-Khattab</b>: I heard Allah\'s Messenger (ﷺ) saying, '
+             f'<i>"The reward of deeds depends upon the intentions"</i> ({i}). See <a href="/bukhari/{i}">here</a>.</p>'
+             for i in range(sentences)]
+    return ''.join(parts)
+
+
+def first_page(pages: Paginator) -> str:
+    """ What a command does with its pages: shows the first, with the number of pages in the footer. """
+    len(pages)
+    return pages[0]
+
+
+def run_coroutine(coroutine):
+    """ Runs a coroutine that never suspends, without the cost of an event loop. """
+    try:
+        coroutine.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError('The coroutine suspended')
+
+
+def build_benchmarks() -> dict:
+    """ Each benchmark's name and a function that runs it once. Inputs are built here, outside of the timings. """
+    tafsir_page = arabic_tafsir_page()
+    tafsir = ArabicTafsirRequest(2, 255, 'tabari')
+    tafsir.process_text(tafsir_page)
+    # Pages of tafsirs that cite a source after every sentence.
+    footnoted = ArabicTafsirRequest(2, 255, 'tabari')
+    footnoted.process_text(arabic_tafsir_page(paragraphs=10, footnotes=6))
+
+    arabic_hadith = arabic_hadith_html()
+    english_hadith = english_hadith_html()
+    english_text = ENGLISH_SENTENCE * 200
+    arabic_text = ARABIC_SENTENCE * 150
+    hadith_text = HadithSpecifics.format_hadith_text(english_hadith, 'en') * 3
+
+    longest = ArabicTafsirRequest(2, 255, 'razi')
+    longest.process_text(arabic_tafsir_page(paragraphs=LONGEST_TAFSIR // len(arabic_tafsir_page(paragraphs=1))))
+    longest_arabic = longest.pages.text
+    longest_english = ENGLISH_SENTENCE * (LONGEST_TAFSIR // len(ENGLISH_SENTENCE))
+
+    pray_times = PrayTimes()
+    pray_times.setMethod('MWL')
+    pray_times.adjust({'highLats': 'AngleBased', 'asr': 'Standard'})
+    transformer = SurahNameTransformer()
+
+    return {
+        'PrayTimes.getTimes': lambda: pray_times.getTimes((2024, 3, 11), (51.5072, -0.1276), 0),
+        'PrayTimes.getTimes (high latitude)': lambda: pray_times.getTimes((2024, 6, 21), (64.1466, -21.9426), 0),
+        'QuranReference.process_ref': lambda: QuranReference('2:255'),
+        'QuranReference.process_ref (range)': lambda: QuranReference('2:255-260', allow_multiple_verses=True),
+        'QuranReference.process_ref (reveal order)': lambda: QuranReference('96:1', reveal_order=True),
+        'SurahNameTransformer.transform (number)': lambda: run_coroutine(transformer.transform(None, '112')),
+        'SurahNameTransformer.transform (English)': lambda: run_coroutine(transformer.transform(None, 'Al-Baqarah')),
+        'SurahNameTransformer.transform (Arabic)': lambda: run_coroutine(transformer.transform(None, 'الإخلاص')),
+        'ArabicTafsirRequest.process_text': lambda: tafsir.process_text(tafsir_page),
+        'ArabicTafsirRequest.process_footnotes': footnoted.process_footnotes,
+        'HadithSpecifics.format_hadith_text (Arabic)': lambda: HadithSpecifics.format_hadith_text(arabic_hadith, 'ar'),
+        'HadithSpecifics.format_hadith_text (English)': lambda: HadithSpecifics.format_hadith_text(english_hadith, 'en'),
+        'convert_to_arabic_number': lambda: convert_to_arabic_number('2:255'),
+        'Paginator (tafsir)': lambda: first_page(Paginator(english_text, 2000, break_long_words=False)),
+        'Paginator (Arabic tafsir)': lambda: first_page(Paginator(arabic_text, 2034, break_long_words=True)),
+        'Paginator (hadith)': lambda: first_page(Paginator(hadith_text, 1024)),
+        'Paginator (tafsir, 1M chars)': lambda: first_page(Paginator(longest_english, 2000, break_long_words=False)),
+        'Paginator, every page (tafsir, 1M chars)': lambda: list(Paginator(longest_english, 2000, break_long_words=False)),
+        'textwrap.wrap (tafsir, 1M chars)': lambda: textwrap.wrap(longest_english, 2000, break_long_words=False),
+        'Paginator (Arabic tafsir, 1M chars)': lambda: first_page(Paginator(longest_arabic, 2034, break_long_words=True)),
+        'Paginator, every page (Arabic tafsir, 1M chars)': lambda: list(Paginator(longest_arabic, 2034, break_long_words=True)),
+        'textwrap.wrap (Arabic tafsir, 1M chars)': lambda: textwrap.wrap(longest_arabic, 2034, break_long_words=True),
+    }
+
+
+def measure(function, repeat: int) -> float:
+    """ Seconds per call: the fastest of `repeat` runs, each long enough (at least 0.2s) to time reliably. """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def environment() -> dict:
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'processor': platform.processor(),
+            'system': platform.system()}
+
+
+def load_baselines(path: str):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_baselines(path: str, timings: dict):
+    baselines = load_baselines(path) or {'timings': {}}
+    # Functions that were not run this time keep their old baselines.
+    baselines['timings'].update(timings)
+    baselines.update(environment=environment(), commit=current_commit(),
+                     saved_at=datetime.datetime.now(datetime.timezone.utc).isoformat())
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baselines, f, ensure_ascii=False, indent=1, sort_keys=True)
+    print(f'Saved baselines for {len(timings)} functions to {path}')
+
+
+def compare(timings: dict, baselines: dict, threshold: float) -> tuple:
+    """ Returns a table row for each function, and the names of those that are more than `threshold`% slower. """
+    rows = {}
+    regressions = []
+    for name, seconds in timings.items():
+        baseline = baselines['timings'].get(name) if baselines else None
+        if baseline is None:
+            rows[name] = {'per_call_us': seconds * 1e6, 'baseline_us': '-', 'change_%': '-'}
+            continue
+        change = (seconds / baseline - 1) * 100
+        rows[name] = {'per_call_us': seconds * 1e6, 'baseline_us': baseline * 1e6, 'change_%': change}
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Times the hot pure functions and checks them for regressions.')
+    parser.add_argument('--save', action='store_true', help='Store the timings as the new baselines.')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='Fail if a function is more than this many percent slower than its baseline.')
+    parser.add_argument('--baselines', default=DEFAULT_BASELINES)
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--filter', default='', help='Only run benchmarks whose name contains this.')
+    args = parser.parse_args()
+
+    benchmarks = {name: function for name, function in build_benchmarks().items() if args.filter in name}
+    timings = {name: measure(function, args.repeat) for name, function in benchmarks.items()}
+
+    if args.save:
+        print_table({name: {'per_call_us': seconds * 1e6} for name, seconds in timings.items()})
+        save_baselines(args.baselines, timings)
+        return 0
+
+    baselines = load_baselines(args.baselines)
+    if baselines is None:
+        print(f'No baselines at {args.baselines}; run with --save to record them.')
+    elif baselines.get('environment') != environment():
+        print(f'Warning: the baselines were recorded on {baselines.get("environment")}, '
+              f'not {environment()}, so the comparison may not be meaningful.')
+
+    rows, regressions = compare(timings, baselines, args.threshold)
+    print_table(rows)
+    if regressions:
+        print(f'\n{len(regressions)} functions regressed by more than {args.threshold:g}%: {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""
+Replays a trace of interactions against the real IslamBot, to find how many interactions per second one process
+can handle.
+
+Traces are recorded in production by enabling [Interaction Recording] in config.ini. The bot is started as it is in
+production, with every cog loaded, but logs in to a local stand-in for Discord's REST API and never connects to the
+gateway: interactions are decoded and dispatched as if they had just arrived over it, through the command tree,
+deadlines and tracing. Upstream APIs are answered from the fixtures recorded by benchmarks/cog_paths.py.
+
+    python -m benchmarks.replay interactions.jsonl --speed 1 2 4 8 16
+
+replays the trace once at each speed in turn, compressing the gaps between interactions by that factor, and reports
+for each the rate offered and sustained, the latency of every command, event loop lag and memory growth. The speed at
+which sustained throughput stops keeping up with the offered rate, or latency climbs, is the capacity of a process.
+Without a recorded trace, --synthetic RATE generates one with Poisson arrivals over a rough mix of commands.
+
+Run it from the repository root, so that config.ini and the fixtures are found.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import tracemalloc
+
+import discord
+
+from benchmarks.cog_paths import current_commit
+from benchmarks.fakes import interaction_payload
+from benchmarks.fixtures import FixtureStore
+from benchmarks.reporting import print_table, summarize
+from benchmarks.standin import StandInDiscord, StandInUpstream
+from main import IslamBot
+from utils import deadlines, interaction_recorder
+from utils.http_client import upstream
+from utils.loop_monitor import loop_monitor
+
+# Talks to top.gg on load, which has no stand-in.
+SKIPPED_EXTENSIONS = {'miscellaneous.TopGG'}
+
+# Buckets are mapped back onto made-up IDs, so that each bucket is a distinct guild or user with its own settings.
+GUILD_ID_BASE = 2 * 10 ** 17
+USER_ID_BASE = 3 * 10 ** 17
+
+# Values for options that were redacted when the trace was recorded.
+DEFAULT_FILL = {'location': 'London'}
+
+
+def option(name: str, value, type: int = 3) -> dict:
+    return {'name': name, 'type': type, 'value': value}
+
+
+def subcommand(name: str, *options) -> dict:
+    return {'name': name, 'type': 1, 'options': list(options)}
+
+
+# A rough mix of commands for synthetic traces, by weight. Record a trace for the real proportions.
+SYNTHETIC_MIX = [
+    (20, 2, {'name': 'quran', 'options': [option('surah', '2'), option('start_verse', 255, 4)]}),
+    (10, 2, {'name': 'aquran', 'options': [option('surah', '1'), option('start_verse', 1, 4),
+                                           option('end_verse', 7, 4)]}),
+    (15, 2, {'name': 'hadith', 'options': [option('hadith_collection', 'bukhari'), option('hadith_number', '1')]}),
+    (10, 2, {'name': 'tafsir', 'options': [subcommand('get', option('surah', '2'), option('verse_number', 255, 4),
+                                                      option('tafsir_name', 'jalalayn'))]}),
+    (10, 2, {'name': 'atafsir', 'options': [subcommand('get', option('surah', '2'), option('verse_number', 255, 4),
+                                                       option('tafsir_name', 'tabari'))]}),
+    (10, 2, {'name': 'dua', 'options': [option('topic', 'anxiety')]}),
+    (5, 4, {'name': 'dua', 'options': [{**option('topic', 'anx'), 'focused': True}]}),
+    (10, 2, {'name': 'prayertimes', 'options': [subcommand('get', option('location', 'London'))]}),
+    (5, 2, {'name': 'biography', 'options': [option('name', 'أبو هريرة')]}),
+    (5, 2, {'name': 'morphology', 'options': [option('surah', '1'), option('verse', 1, 4),
+                                              option('word_number', 1, 4)]}),
+]
+
+
+def load_trace(path: str) -> list:
+    with open(path, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    entries.sort(key=lambda entry: entry['t'])
+    start = entries[0]['t'] if entries else 0
+    for entry in entries:
+        entry['t'] -= start
+    return entries
+
+
+def synthetic_trace(rate: float, duration: float, guilds: int = 1000, users: int = 10000, seed: int = 0) -> list:
+    """ Poisson arrivals at `rate` per second, for `duration` seconds, drawn from SYNTHETIC_MIX. """
+    rng = random.Random(seed)
+    weights = [weight for weight, _, _ in SYNTHETIC_MIX]
+    entries = []
+    t = rng.expovariate(rate)
+    while t < duration:
+        _, interaction_type, data = rng.choices(SYNTHETIC_MIX, weights)[0]
+        entries.append({'t': t, 'type': interaction_type, 'data': {'type': 1, **data},
+                        'guild': rng.randrange(guilds), 'user': rng.randrange(users), 'locale': 'en-US'})
+        t += rng.expovariate(rate)
+    return entries
+
+
+def command_name(entry: dict) -> str:
+    """ The qualified name of the command, e.g. "tafsir get", with autocompletes marked as such. """
+    names = [entry['data']['name']]
+    options = entry['data'].get('options', [])
+    while options and options[0].get('type') in (1, 2):
+        names.append(options[0]['name'])
+        options = options[0].get('options', [])
+    name = ' '.join(names)
+    return f'{name} (autocomplete)' if entry['type'] == 4 else name
+
+
+def fill_options(options: list, fill: dict) -> list:
+    filled = []
+    for opt in options:
+        opt = dict(opt)
+        if 'options' in opt:
+            opt['options'] = fill_options(opt['options'], fill)
+        if opt.get('value') == interaction_recorder.REDACTED:
+            opt['value'] = fill.get(opt['name'], '')
+        filled.append(opt)
+    return filled
+
+
+def build_payload(entry: dict, application_id: int, token: str, fill: dict) -> dict:
+    """ An INTERACTION_CREATE payload for a trace entry, created now. """
+    data = {**entry['data'], 'options': fill_options(entry['data'].get('options', []), fill)}
+    guild_id = GUILD_ID_BASE + entry['guild'] if entry.get('guild') is not None else None
+    return interaction_payload(application_id, token, data, entry['type'], guild_id=guild_id,
+                               user_id=USER_ID_BASE + (entry.get('user') or 0), locale=entry.get('locale', 'en-US'))
+
+
+def rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        # Peak rather than current on platforms without /proc, which is still an upper bound on growth.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Replay:
+    def __init__(self, bot: IslamBot, discord_api: StandInDiscord, fill: dict):
+        self.bot = bot
+        self.discord_api = discord_api
+        self.fill = fill
+        self.pending = {}
+        self.dispatched = {}
+        self.latencies = {}
+        self.errors = {}
+        self.finished_at = None
+
+        bot.add_listener(self.on_app_command_completion)
+        on_error = bot.tree.on_error
+
+        async def record_error(interaction: discord.Interaction, error: discord.app_commands.AppCommandError):
+            self.finish(interaction.id, error=True)
+            await on_error(interaction, error)
+
+        bot.tree.on_error = record_error
+
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        self.finish(interaction.id)
+
+    def finish(self, interaction_id: int, error: bool = False, at: float = None):
+        started = self.pending.pop(interaction_id, None)
+        if started is None:
+            return
+        name, start = started
+        at = at if at is not None else time.perf_counter()
+        self.latencies.setdefault(name, []).append(at - start)
+        if error:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        self.finished_at = max(self.finished_at, at)
+
+    def dispatch(self, entry: dict, token: str):
+        payload = build_payload(entry, self.bot.application_id, token, self.fill)
+        # Encoded and decoded again, as it would be on the way in over the gateway.
+        payload = json.loads(json.dumps(payload))
+        interaction_id = int(payload['id'])
+        self.dispatched[interaction_id] = time.perf_counter()
+        self.pending[interaction_id] = (command_name(entry), self.dispatched[interaction_id])
+        self.bot._connection.parsers['INTERACTION_CREATE'](payload)
+
+    def check_autocompletes(self):
+        # Autocompletes have no completion event, so they are done once they have responded.
+        for interaction_id, (name, _) in list(self.pending.items()):
+            if name.endswith('(autocomplete)') and interaction_id in self.discord_api.first_responses:
+                self.finish(interaction_id, at=self.discord_api.first_responses[interaction_id])
+
+    async def run(self, trace: list, speed: float, drain_timeout: float) -> tuple:
+        self.pending.clear()
+        self.dispatched.clear()
+        self.latencies.clear()
+        self.errors.clear()
+        self.discord_api.first_responses.clear()
+        shed_before = deadlines.stats.shed
+        loop_monitor.lags.clear()
+        rss_before = rss_bytes()
+        traced_before = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        late = []
+
+        start = time.perf_counter()
+        self.finished_at = start
+        for i, entry in enumerate(trace):
+            due = start + entry['t'] / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # How far behind schedule the loop was in getting to this interaction.
+            late.append(max(0.0, time.perf_counter() - due))
+            token = f'replay-{i}'
+            self.dispatch(entry, token)
+        dispatched_at = time.perf_counter()
+
+        # Let the interactions still in flight finish, or give up on them.
+        give_up_at = time.perf_counter() + drain_timeout
+        while time.perf_counter() < give_up_at:
+            self.check_autocompletes()
+            if len(self.pending) <= deadlines.stats.shed - shed_before:
+                break
+            await asyncio.sleep(0.05)
+        self.check_autocompletes()
+
+        shed = deadlines.stats.shed - shed_before
+        elapsed = max(self.finished_at, dispatched_at) - start
+        completed = sum(len(latencies) for latencies in self.latencies.values())
+        overall = summarize(sum(self.latencies.values(), []))
+        responses = [self.discord_api.first_responses[i] - started for i, started in self.dispatched.items()
+                     if i in self.discord_api.first_responses]
+        lag = loop_monitor.lag_quantiles()
+        summary = {
+            'interactions': len(trace),
+            'offered_per_second': len(trace) / (trace[-1]['t'] / speed) if trace and trace[-1]['t'] else 0.0,
+            'completed_per_second': completed / elapsed if elapsed else 0.0,
+            'errors': sum(self.errors.values()),
+            'shed': shed,
+            'unfinished': len(self.pending) - shed,
+            'p50_ms': overall['p50_ms'],
+            'p99_ms': overall['p99_ms'],
+            'first_response_p99_ms': summarize(responses)['p99_ms'],
+            'dispatch_late_max_ms': max(late, default=0) * 1000,
+            'loop_lag_p99_ms': lag.get('p99', 0) * 1000,
+            'rss_growth_mb': (rss_bytes() - rss_before) / 2 ** 20,
+        }
+        if tracemalloc.is_tracing():
+            summary['traced_growth_mb'] = (tracemalloc.get_traced_memory()[0] - traced_before) / 2 ** 20
+        commands = {name: {**summarize(latencies), 'errors': self.errors.get(name, 0)}
+                    for name, latencies in sorted(self.latencies.items())}
+        return summary, commands
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Replays a trace of interactions against the bot.')
+    parser.add_argument('trace', nargs='?', help='A trace recorded with [Interaction Recording].')
+    parser.add_argument('--synthetic', type=float, metavar='RATE',
+                        help='Generate a trace with this many interactions per second instead.')
+    parser.add_argument('--duration', type=float, default=60, help='Length of a synthetic trace, in seconds.')
+    parser.add_argument('--speed', type=float, nargs='+', default=[1.0],
+                        help='Replay the trace once at each of these speeds, in turn.')
+    parser.add_argument('--limit', type=int, help='Only replay the first this many interactions.')
+    parser.add_argument('--drain-timeout', type=float, default=30,
+                        help='How long to wait for interactions in flight after the last is dispatched.')
+    parser.add_argument('--latency', type=float, default=50, help='Stand-in upstream latency, in milliseconds.')
+    parser.add_argument('--jitter', type=float, default=0, help='Random variation of the latency, in milliseconds.')
+    parser.add_argument('--discord-latency', type=float, default=50,
+                        help='Stand-in Discord REST latency, in milliseconds.')
+    parser.add_argument('--fill', nargs='*', default=[], metavar='OPTION=VALUE',
+                        help='Values for redacted options, e.g. location=Makkah.')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='Also report Python heap growth. Slows everything down considerably.')
+    parser.add_argument('--fixtures', help='Directory of recorded fixtures.')
+    parser.add_argument('--output', help='A JSON lines file to append the results to.')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        trace = synthetic_trace(args.synthetic, args.duration)
+    elif args.trace:
+        trace = load_trace(args.trace)
+    else:
+        parser.error('give a trace to replay, or --synthetic RATE')
+    trace = trace[:args.limit] if args.limit else trace
+    fill = {**DEFAULT_FILL, **dict(item.split('=', 1) for item in args.fill)}
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    store = FixtureStore(args.fixtures) if args.fixtures else FixtureStore()
+    standin = StandInUpstream(store, latency=args.latency / 1000, jitter=args.jitter / 1000)
+    discord_api = StandInDiscord(latency=args.discord_latency / 1000)
+    await standin.start()
+    await discord_api.start()
+    standin.install(upstream)
+    discord_api.install()
+    # Responses must come from the fixtures, never from an earlier run's disk cache.
+    upstream.use_disk_cache = False
+
+    bot = IslamBot()
+    bot.initial_extensions = [ext for ext in bot.initial_extensions if ext not in SKIPPED_EXTENSIONS]
+    results = {}
+    try:
+        await bot.login('replay')
+        if not loop_monitor.running:
+            loop_monitor.start()
+        replay = Replay(bot, discord_api, fill)
+        for speed in args.speed:
+            summary, commands = await replay.run(trace, speed, args.drain_timeout)
+            results[f'{speed:g}x'] = {'summary': summary, 'commands': commands}
+            print(f'\nAt {speed:g}x:')
+            print_table(commands)
+    finally:
+        await bot.close()
+        await discord_api.close()
+        await standin.close()
+
+    print()
+    print_table({speed: result['summary'] for speed, result in results.items()})
+    if standin.missing:
+        print(f'{len(standin.missing)} URLs had no fixture, e.g. {next(iter(standin.missing))}. '
+              f'Record them with python -m benchmarks.cog_paths --record.')
+    if discord_api.unexpected:
+        print(f'Discord requests the stand-in did not handle: {dict(discord_api.unexpected)}')
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'commit': current_commit(), 'time': time.time(), 'arguments': vars(args),
+                                'results': results}) + '\n')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
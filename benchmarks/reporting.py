@@ -0,0 +1,39 @@
+import statistics
+
+
+def percentile(values: list, pct: float) -> float:
+    """ Nearest-rank percentile of a list of numbers. """
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: list, elapsed: float = None) -> dict:
+    """ Summarises a list of latencies in seconds. If the wall-clock time is given, throughput is included too. """
+    summary = {
+        'count': len(latencies),
+        'mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000 if latencies else 0,
+    }
+    if elapsed:
+        summary['per_second'] = len(latencies) / elapsed
+    return summary
+
+
+def print_table(rows: dict):
+    """ Prints one summary per row name, with a column per summary field. """
+    if not rows:
+        return
+    fields = list(next(iter(rows.values())).keys())
+    widths = [max(12, len(field) + 2) for field in fields]
+    name_width = max(len(name) for name in rows) + 2
+    print('name'.ljust(name_width) + ''.join(field.rjust(width) for field, width in zip(fields, widths)))
+    for name, summary in rows.items():
+        cells = ''.join(f'{summary[field]:{width}.2f}' if isinstance(summary[field], float)
+                        else str(summary[field]).rjust(width) for field, width in zip(fields, widths))
+        print(name.ljust(name_width) + cells)
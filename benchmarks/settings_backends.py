@@ -0,0 +1,97 @@
+"""
+Compares settings lookup latency between the storage backends.
+
+Run from the repository root so that config.ini is found:
+
+    python -m benchmarks.settings_backends --rows 10000 --lookups 5000
+
+SQLite is always measured, using a temporary file. MySQL is measured when the [MySQL] section points at a
+reachable server. Both use a scratch table that is dropped afterwards, and lookups bypass the settings cache.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.reporting import print_table, summarize
+from utils.storage_backends import MySQLBackend, SQLiteBackend
+
+TABLE = 'benchmark_settings'
+KEY_COLUMN = 'server'
+COLUMNS = ('translation', 'tafsir', 'atafsir')
+
+
+async def prepare(backend, rows: int):
+    async with backend.acquire() as connection:
+        if backend.name == 'mysql':
+            async with connection.cursor() as cursor:
+                await cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+                await cursor.execute(f"CREATE TABLE {TABLE} ({KEY_COLUMN} BIGINT NOT NULL PRIMARY KEY, "
+                                     f"{', '.join(f'{column} VARCHAR(64) NULL' for column in COLUMNS)})")
+    await backend.ensure_table(TABLE, KEY_COLUMN, COLUMNS)
+
+    keys = random.sample(range(10 ** 17, 10 ** 18), rows)
+    for i in range(0, rows, 1000):
+        await backend.upsert_rows(TABLE, KEY_COLUMN, COLUMNS, [(key, 'haleem', 'jalalayn', 'tabari') for key in keys[i:i + 1000]])
+    return keys
+
+
+async def drop(backend):
+    async with backend.acquire() as connection:
+        if backend.name == 'mysql':
+            async with connection.cursor() as cursor:
+                await cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        else:
+            await connection.execute(f"DROP TABLE IF EXISTS {TABLE}")
+            await connection.commit()
+
+
+async def measure(backend, keys: list, lookups: int) -> dict:
+    # Half of the lookups are for keys with no row, like guilds that never changed a default.
+    targets = [random.choice(keys) if i % 2 else random.randrange(10 ** 16) for i in range(lookups)]
+    latencies = []
+    start = time.perf_counter()
+    for key in targets:
+        lookup_start = time.perf_counter()
+        await backend.fetch_row(TABLE, KEY_COLUMN, key, COLUMNS)
+        latencies.append(time.perf_counter() - lookup_start)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+async def run(rows: int, lookups: int):
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite = SQLiteBackend()
+        sqlite.path = os.path.join(directory, 'benchmark.db')
+        await sqlite.start()
+        keys = await prepare(sqlite, rows)
+        results['sqlite'] = await measure(sqlite, keys, lookups)
+        await drop(sqlite)
+        await sqlite.close()
+
+    try:
+        mysql = MySQLBackend()
+    except KeyError:
+        print('config.ini has no [MySQL] section; only SQLite was measured.')
+    else:
+        await mysql.start()
+        if mysql.pool is not None:
+            keys = await prepare(mysql, rows)
+            results['mysql'] = await measure(mysql, keys, lookups)
+            await drop(mysql)
+        else:
+            print('MySQL is not reachable; only SQLite was measured.')
+        await mysql.close()
+
+    print_table(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--lookups', type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.lookups))
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+import discord
+from aiohttp import web
+from yarl import URL
+
+from benchmarks.fixtures import FixtureStore
+
+
+class StandInUpstream:
+    """
+    A local aiohttp server that answers for every upstream host from recorded fixtures, after a configurable
+    delay. The upstream client is pointed at it with `install`, which rewrites https://host/path?query to
+    http://127.0.0.1:<port>/https/host/path?query.
+    """
+
+    def __init__(self, store: FixtureStore, latency: float = 0.05, jitter: float = 0.0, host_latency: dict = None):
+        self.fixtures = store.load_all()
+        self.latency = latency
+        self.jitter = jitter
+        self.host_latency = host_latency or {}
+        self.missing = set()
+        self.served = 0
+        self.runner = None
+        self.base_url = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        app = web.Application()
+        app.router.add_get('/{scheme}/{host}/{path:.*}', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = URL(f'http://{host}:{port}')
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def rewrite(self, url: URL) -> URL:
+        query = f'?{url.raw_query_string}' if url.raw_query_string else ''
+        return URL(f'{self.base_url}/{url.scheme}/{url.host}{url.raw_path}{query}', encoded=True)
+
+    def install(self, client):
+        client.url_rewriter = self.rewrite
+
+    async def handle(self, request: web.Request) -> web.Response:
+        info = request.match_info
+        url = str(URL(f"{info['scheme']}://{info['host']}/{request.raw_path.split('/', 3)[3]}", encoded=True))
+        delay = self.host_latency.get(info['host'], self.latency)
+        await asyncio.sleep(max(0.0, delay + random.uniform(-self.jitter, self.jitter)))
+
+        fixture = self.fixtures.get(url)
+        if fixture is None:
+            self.missing.add(url)
+            return web.Response(status=404, text=f'No fixture recorded for {url}')
+
+        self.served += 1
+        return web.Response(status=fixture['status'], body=fixture['body'],
+                            headers={'Content-Type': fixture['content_type']})
+
+
+class StandInDiscord:
+    """
+    A local aiohttp server that answers the Discord REST calls the bot makes, after a configurable delay. discord.py
+    is pointed at it with `install`. Interaction responses are acknowledged, and the time of the first one for each
+    interaction is kept in `first_responses`, as that is when Discord would stop showing "application did not respond".
+    """
+
+    APPLICATION_ID = 10 ** 17
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.first_responses = {}
+        self.requests = Counter()
+        self.unexpected = Counter()
+        self.runner = None
+        self.base_url = None
+        self.bot_user = {'id': str(self.APPLICATION_ID), 'username': 'IslamBot', 'discriminator': '0000',
+                         'avatar': None, 'bot': True}
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        app = web.Application()
+        app.router.add_get('/api/v10/users/@me', self.current_user)
+        app.router.add_get('/api/v10/oauth2/applications/@me', self.application)
+        app.router.add_post('/api/v10/interactions/{interaction_id}/{token}/callback', self.callback)
+        app.router.add_route('*', '/api/v10/webhooks/{application_id}/{token}', self.webhook_message)
+        app.router.add_route('*', '/api/v10/webhooks/{application_id}/{token}/messages/{message_id}',
+                             self.webhook_message)
+        app.router.add_route('*', '/{path:.*}', self.unknown)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = URL(f'http://{host}:{port}')
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def install(self):
+        # Both the bot's own requests and the interaction webhooks build their URLs from Route.BASE.
+        discord.http.Route.BASE = f'{self.base_url}/api/v10'
+
+    async def _delay(self, request: web.Request):
+        self.requests[f'{request.method} {request.match_info.route.resource.canonical}'] += 1
+        await request.read()
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    @staticmethod
+    def _json(data, status: int = 200) -> web.Response:
+        # discord.py only decodes bodies labelled exactly application/json, without a charset.
+        return web.Response(status=status, body=json.dumps(data).encode(), headers={'Content-Type': 'application/json'})
+
+    async def current_user(self, request: web.Request) -> web.Response:
+        await self._delay(request)
+        return self._json(self.bot_user)
+
+    async def application(self, request: web.Request) -> web.Response:
+        await self._delay(request)
+        return self._json({
+            'id': str(self.APPLICATION_ID), 'name': 'IslamBot', 'icon': None, 'description': '', 'bot_public': True,
+            'bot_require_code_grant': False, 'verify_key': '', 'owner': self.bot_user, 'flags': 0,
+        })
+
+    async def callback(self, request: web.Request) -> web.Response:
+        self.first_responses.setdefault(int(request.match_info['interaction_id']), time.perf_counter())
+        await self._delay(request)
+        return web.Response(status=204)
+
+    async def webhook_message(self, request: web.Request) -> web.Response:
+        await self._delay(request)
+        if request.method == 'DELETE':
+            return web.Response(status=204)
+        return self._json({
+            'id': str(discord.utils.time_snowflake(discord.utils.utcnow())), 'channel_id': '1', 'type': 0,
+            'author': self.bot_user, 'content': '', 'timestamp': discord.utils.utcnow().isoformat(),
+            'edited_timestamp': None, 'tts': False, 'mention_everyone': False, 'mentions': [], 'mention_roles': [],
+            'attachments': [], 'embeds': [], 'pinned': False, 'webhook_id': request.match_info['application_id'],
+        })
+
+    async def unknown(self, request: web.Request) -> web.Response:
+        self.unexpected[f'{request.method} {request.path}'] += 1
+        return self._json({'message': 'Not handled by the stand-in', 'code': 0}, status=404)
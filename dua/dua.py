@@ -4,6 +4,7 @@ import discord
 from discord.ext import commands
 from fuzzywuzzy import process, fuzz
 
+from utils.errors import respond_to_interaction_error
 from utils.utils import get_site_source
 
 URL = 'https://ahadith.co.uk/hisnulmuslim-dua-{}'
@@ -156,6 +157,8 @@ class Dua(commands.Cog):
         if isinstance(error, KeyError):
             await interaction.followup.send(
                 f":warning: **Could not find dua for this topic.** Type </dualist:967584174586355741> for a list of dua topics.")
+        else:
+            await respond_to_interaction_error(interaction, error)
 
 
 async def setup(bot):
@@ -1,20 +1,15 @@
-import configparser
 import random
 import re
-import textwrap
 
-import aiohttp
 import discord
 import html2text
 from discord.ext import commands
 
-from utils import utils
+from utils import pagination, utils
+from utils.errors import respond_to_interaction_error
+from utils.http_client import upstream
 from utils.slash_utils import generate_choices_from_dict
 
-config = configparser.ConfigParser()
-config.read('config.ini')
-API_KEY = config['APIs']['sunnah.com']
-
 ICON = 'https://sunnah.com/images/hadith_icon2_huge.png'
 
 english_hadith_collections = {
@@ -55,8 +50,6 @@ arabic_hadith_collections = {
     'virtues': 'تصر لفضائل الآيات والسور'
 }
 
-HEADERS = {"X-API-Key": API_KEY}
-
 CLEAN_ARABIC_REGEXP = re.compile(r'(\[+?[^\[]+?\])')
 
 
@@ -101,13 +94,12 @@ class HadithSpecifics:
         else:
             self.url = f'https://api.sunnah.com/v1/collections/{self.collection}/hadiths/{self.ref.hadith_number}'
 
-        async with aiohttp.ClientSession(headers=HEADERS) as session:
-            async with session.get(self.url) as resp:
-                if resp.status == 200:
-                    hadith_list = await resp.json()
-                    return self.process_hadith(hadith_list)
-                elif resp.status == 404:
-                    raise InvalidHadith
+        # The sunnah.com API key is attached by the upstream client.
+        response = await upstream.fetch(self.url)
+        if response.status == 200:
+            return self.process_hadith(response.json())
+        elif response.status == 404:
+            raise InvalidHadith
 
     def process_hadith(self, hadith_list):
 
@@ -174,7 +166,9 @@ class HadithSpecifics:
 
             self.text = self.text[:-2]  # remove the extra comma and space from above line from the last word
 
-        self.pages = textwrap.wrap(self.text, 1024)
+        self.pages = pagination.Paginator(self.text, 1024)
+        # The pages are offsets into their own copy of the text, so keep only that one.
+        self.text = self.pages.text
 
         if self.lang == 'en':
             self.formatted_collection = self.format_english_collection_name(self.collection)
@@ -184,6 +178,13 @@ class HadithSpecifics:
         em = self.make_embed()
         return em
 
+    @property
+    def page_key(self) -> str:
+        """ Identifies the hadith well enough to fetch it again when its pages are turned. """
+        if self.ref.type == 'normal':
+            return f'{self.collection}|{self.lang}|{self.ref.book_number}:{self.ref.hadith_number}'
+        return f'{self.collection}|{self.lang}|{self.ref.hadith_number}'
+
     def make_embed(self):
 
         page = self.pages[self.page - 1]
@@ -244,8 +245,25 @@ class HadithCommands(commands.Cog):
         )
         self.bot.tree.add_command(self.ctx_menu)
 
+    async def cog_load(self) -> None:
+        pagination.register(self.bot, pagination.PageSource('hadith', self.load_hadith, self.render_page,
+                                                            lambda hadith: len(hadith.pages)))
+
     async def cog_unload(self) -> None:
         self.bot.tree.remove_command(self.ctx_menu.name, type=self.ctx_menu.type)
+        pagination.unregister('hadith')
+
+    @staticmethod
+    async def load_hadith(key: str) -> HadithSpecifics:
+        collection, lang, ref = key.split('|', 2)
+        hadith = HadithSpecifics(collection, Reference(ref), lang)
+        await hadith.fetch_hadith()
+        return hadith
+
+    @staticmethod
+    def render_page(hadith: HadithSpecifics, page: int) -> discord.Embed:
+        hadith.page = page
+        return hadith.make_embed()
 
     async def abstract_hadith(self, interaction: discord.Interaction, collection_name, ref, lang):
         hadith = HadithSpecifics(collection_name, ref, lang)
@@ -258,7 +276,7 @@ class HadithCommands(commands.Cog):
             return await interaction.response.send_message(embed=embed)
 
         # If there are multiple pages, construct buttons for their navigation.
-        hadith_ui_view = HadithNavigator(hadith, interaction)
+        hadith_ui_view = pagination.paginate('hadith', hadith.page_key, hadith)
         await interaction.response.send_message(embed=embed, view=hadith_ui_view)
 
     async def _rhadith(self, interaction: discord.Interaction):
@@ -301,6 +319,13 @@ class HadithCommands(commands.Cog):
     async def slash_rahadith(self, interaction: discord.Interaction):
         await self._rahadith(interaction)
 
+    @hadith.error
+    @ahadith.error
+    @rhadith.error
+    @slash_rahadith.error
+    async def on_hadith_error(self, interaction: discord.Interaction, error: discord.app_commands.AppCommandError):
+        await respond_to_interaction_error(interaction, error)
+
     # See https://github.com/Rapptz/discord.py/issues/7823#issuecomment-1086830458 for why we can't use the
     # context menu annotation in cogs.
     async def get_hadith_text(self, interaction: discord.Interaction, message: discord.Message):
@@ -335,36 +360,5 @@ class HadithCommands(commands.Cog):
             await interaction.response.send_message("Could not find a valid `sunnah.com` link in this message.", ephemeral=True)
 
 
-class HadithNavigator(discord.ui.View):
-    def __init__(self, hadith: HadithSpecifics, interaction: discord.Interaction):
-        super().__init__(timeout=300)
-        self.hadith = hadith
-        self.original_interaction = interaction
-
-    async def on_timeout(self):
-        for child in self.children:
-            child.disabled = True
-        await self.original_interaction.edit_original_response(view=self, content=":warning: This message has timed out.")
-
-    @discord.ui.button(label='Previous Page', style=discord.ButtonStyle.grey, emoji='⬅')
-    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if self.hadith.page > 1:
-            self.hadith.page -= 1
-        else:
-            self.hadith.page = self.hadith.num_pages
-
-        em = self.hadith.make_embed()
-        await interaction.response.edit_message(embed=em)
-
-    @discord.ui.button(label='Next Page', style=discord.ButtonStyle.green, emoji='➡')
-    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if self.hadith.page < self.hadith.num_pages:
-            self.hadith.page += 1
-        else:
-            self.hadith.page = 1
-        em = self.hadith.make_embed()
-        await interaction.response.edit_message(embed=em)
-
-
 async def setup(bot):
     await bot.add_cog(HadithCommands(bot))
@@ -1,10 +1,15 @@
 import configparser
 
-import aiohttp
 import discord
 from discord.ext import commands, tasks
 
 from hijri_calendar.hijri_calendar import HijriCalendar
+from utils.database_utils import DBHandler, GuildSettings, preload_settings
+from utils.deadlines import DeadlineCommandTree
+from utils.http_client import upstream
+from utils.loop_monitor import loop_monitor
+from utils.sampling_profiler import sampling_profiler
+from utils.settings_writer import settings_writer
 
 config = configparser.ConfigParser()
 config.read('config.ini')
@@ -30,7 +35,8 @@ async def before_presence_update():
 
 class IslamBot(commands.AutoShardedBot):
     def __init__(self) -> None:
-        super().__init__(command_prefix='-', description=description, case_insensitive=True, intents=intents)
+        super().__init__(command_prefix='-', description=description, case_insensitive=True, intents=intents,
+                         tree_cls=DeadlineCommandTree)
         self.initial_extensions = [
             "quran.quran",
             "quran.mushaf",
@@ -44,27 +50,55 @@ class IslamBot(commands.AutoShardedBot):
             "tafsir.tafsir",
             "miscellaneous.reload",
             "miscellaneous.help",
+            "miscellaneous.stats",
+            "miscellaneous.profile",
             "miscellaneous.TopGG" # Remove if using the bot locally
         ]
 
     async def setup_hook(self):
-        self.session = aiohttp.ClientSession()
+        if config.getboolean('Loop Monitor', 'enabled', fallback=True):
+            loop_monitor.start()
+        if config.getboolean('Sampling Profiler', 'enabled', fallback=True):
+            sampling_profiler.start()
+        # Every cog fetches through this shared client, so connections are pooled and kept alive across commands.
+        await upstream.start()
+        await DBHandler.open_backend()
+        if config.getboolean('MySQL', 'migrate_legacy_guild_settings', fallback=False):
+            await GuildSettings.migrate_legacy_tables()
+        if config.getboolean('Settings Cache', 'preload', fallback=False):
+            await preload_settings(config.getint('Settings Cache', 'preload_chunk_size', fallback=5000))
+        if config.getboolean('Settings Writes', 'write_behind', fallback=True):
+            settings_writer.start(DBHandler.backend)
         for ext in self.initial_extensions:
             await self.load_extension(ext)
 
+    async def close(self):
+        await super().close()
+        await settings_writer.stop()
+        await DBHandler.close_backend()
+        await upstream.close()
+        await loop_monitor.stop()
+        sampling_profiler.stop()
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        # Queued, so guilds removed in quick succession are deleted in one batch.
+        await GuildSettings(guild.id).delete_all()
+
     async def on_ready(self):
-        print(f'Logged in as {bot.user.name} ({bot.user.id}) on {len(bot.guilds)} servers')
+        print(f'Logged in as {self.user.name} ({self.user.id}) on {len(self.guilds)} servers')
 
         # Sync commands globally
-        await bot.tree.sync(guild=None)
+        await self.tree.sync(guild=None)
 
         # If you are using the bot locally, uncomment the below and comment out the statement above so that commands
         # only sync to your server. Global syncs are slow to propagate and are strictly rate-limited.
-        # await bot.tree.sync(guild=discord.Object(308241121165967362))
+        # await self.tree.sync(guild=discord.Object(308241121165967362))
 
         # Starting this in the setup hook causes a deadlock as before_presence_update calls wait_until_ready()
         update_presence.start()
 
 
-bot = IslamBot()
-bot.run(token)
+# Guarded so that benchmarks/replay.py can import IslamBot and drive it without connecting to Discord.
+if __name__ == '__main__':
+    bot = IslamBot()
+    bot.run(token)
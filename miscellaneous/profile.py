@@ -0,0 +1,131 @@
+import asyncio
+import cProfile
+import io
+import marshal
+import pstats
+import tracemalloc
+
+import discord
+from discord.ext import commands
+
+from utils.stack_sampler import StackSampler, format_collapsed
+
+# How often the stack is sampled for the collapsed-stack output of a CPU profile.
+SAMPLE_INTERVAL = 0.005
+
+
+class Profile(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        # Profiles of the same kind would interfere with each other, so only one of each runs at a time.
+        self.cpu_lock = asyncio.Lock()
+        self.memory_lock = asyncio.Lock()
+
+    group = discord.app_commands.Group(name="profile", description="🔒 Bot owner only commands.")
+
+    async def is_owner(self, interaction: discord.Interaction) -> bool:
+        app = await self.bot.application_info()
+        if interaction.user.id == app.owner.id:
+            return True
+        await interaction.response.send_message("🔒 **You do not have permission to use this command**.", ephemeral=True)
+        return False
+
+    @group.command(name="cpu", description="🔒 Bot owner only command. Profiles the bot's CPU usage for a while.")
+    @discord.app_commands.describe(seconds="How long to profile for.", top="How many functions to list.")
+    async def profile_cpu(self, interaction: discord.Interaction,
+                          seconds: discord.app_commands.Range[int, 1, 600] = 30,
+                          top: discord.app_commands.Range[int, 5, 200] = 40):
+        if not await self.is_owner(interaction):
+            return
+        if self.cpu_lock.locked():
+            return await interaction.response.send_message(":warning: A CPU profile is already running.", ephemeral=True)
+
+        await interaction.response.defer(thinking=True, ephemeral=True)
+        async with self.cpu_lock:
+            profiler = cProfile.Profile()
+            sampler = StackSampler(SAMPLE_INTERVAL)
+            sampler.start()
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+                sampler.stop()
+
+        profiler.create_stats()
+        # Dumped first, as pstats.Stats takes the stats out of the profiler.
+        dump = marshal.dumps(profiler.stats)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+        samples = sampler.take_samples()
+
+        await interaction.followup.send(
+            f":white_check_mark: Profiled for {seconds}s ({sum(samples.values())} stack samples).",
+            files=[
+                # Open with pstats.Stats('profile.pstats') or a viewer such as snakeviz.
+                discord.File(io.BytesIO(dump), filename='profile.pstats'),
+                discord.File(io.BytesIO(summary.getvalue().encode()), filename='profile.txt'),
+                # One "stack count" line per stack, for flamegraph.pl or speedscope.
+                discord.File(io.BytesIO(format_collapsed(samples).encode()), filename='stacks.collapsed.txt'),
+            ],
+            ephemeral=True,
+        )
+
+    @group.command(name="memory", description="🔒 Bot owner only command. Shows where memory is allocated.")
+    @discord.app_commands.describe(seconds="How long to wait between the two snapshots that are compared.",
+                                   top="How many allocation sites to list.")
+    async def profile_memory(self, interaction: discord.Interaction,
+                             seconds: discord.app_commands.Range[int, 1, 600] = 60,
+                             top: discord.app_commands.Range[int, 5, 200] = 25):
+        if not await self.is_owner(interaction):
+            return
+        if self.memory_lock.locked():
+            return await interaction.response.send_message(":warning: A memory profile is already running.",
+                                                           ephemeral=True)
+
+        await interaction.response.defer(thinking=True, ephemeral=True)
+        async with self.memory_lock:
+            # Tracing slows every allocation down, so it is only left on if it was on before.
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start(25)
+            try:
+                before = tracemalloc.take_snapshot()
+                await asyncio.sleep(seconds)
+                after = tracemalloc.take_snapshot()
+                traced, peak = tracemalloc.get_traced_memory()
+            finally:
+                if started_tracing:
+                    tracemalloc.stop()
+
+        # Leave out tracemalloc's own allocations.
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        before, after = before.filter_traces(filters), after.filter_traces(filters)
+
+        report = io.StringIO()
+        report.write(f'Traced memory: {traced / 1024 / 1024:.1f} MiB, peak {peak / 1024 / 1024:.1f} MiB\n')
+        if started_tracing:
+            report.write('Tracing was started for this profile, so only allocations made during it are seen.\n')
+
+        report.write(f'\nGrowth over {seconds}s, by line:\n')
+        for stat in after.compare_to(before, 'lineno')[:top]:
+            report.write(f'{stat}\n')
+
+        report.write('\nLargest allocation sites, by line:\n')
+        for stat in after.statistics('lineno')[:top]:
+            report.write(f'{stat}\n')
+
+        report.write('\nLargest allocation sites, with their tracebacks:\n')
+        for stat in after.statistics('traceback')[:min(top, 10)]:
+            report.write(f'\n{stat.count} blocks, {stat.size / 1024:.1f} KiB\n')
+            report.write('\n'.join(stat.traceback.format(limit=10)) + '\n')
+
+        await interaction.followup.send(
+            f":white_check_mark: Compared snapshots {seconds}s apart.",
+            file=discord.File(io.BytesIO(report.getvalue().encode()), filename='memory.txt'),
+            ephemeral=True,
+        )
+
+
+async def setup(bot):
+    await bot.add_cog(Profile(bot))
@@ -0,0 +1,163 @@
+import configparser
+
+import discord
+from aiohttp import web
+from discord.ext import commands
+
+from utils import pagination, tracing
+from utils.circuit_breaker import BreakerState
+from utils.disk_cache import disk_cache
+from utils.http_client import upstream
+from utils.loop_monitor import loop_monitor
+from utils.metrics import (CACHE_HIT_RATIO, CACHE_LOOKUPS, COMMAND_LATENCY, PAGE_CACHE_ENTRIES, SHARD_LATENCY,
+                           UPSTREAM_BREAKER_OPEN, UPSTREAM_LATENCY, UPSTREAM_QUEUE, registry)
+from utils.response_cache import response_cache
+from utils.settings_cache import settings_cache
+from utils.upstream_gateway import Lane
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+
+def cache_lookups() -> dict:
+    """ Hits and misses of each cache, keyed by cache name. """
+    response = {'hits': 0, 'stale_hits': 0, 'misses': 0}
+    for stats in response_cache.source_stats.values():
+        response['hits'] += stats.hits + stats.negative_hits
+        response['stale_hits'] += stats.stale_hits
+        response['misses'] += stats.misses
+
+    return {
+        'settings': {'hits': settings_cache.hits, 'stale_hits': settings_cache.stale_hits,
+                     'misses': settings_cache.misses},
+        'response': response,
+        'disk': {'hits': disk_cache.stats.hits, 'misses': disk_cache.stats.misses},
+        'pages': {'hits': pagination.content_cache.hits, 'misses': pagination.content_cache.misses},
+    }
+
+
+def collect_cache_lookups() -> dict:
+    return {(cache, result): count for cache, results in cache_lookups().items() for result, count in results.items()}
+
+
+def collect_cache_hit_ratios() -> dict:
+    ratios = {}
+    for cache, results in cache_lookups().items():
+        total = sum(results.values())
+        ratios[(cache,)] = (total - results['misses']) / total if total else 0
+    return ratios
+
+
+def collect_upstream_queues() -> dict:
+    return {(host, lane.name.lower()): len(gate.queues[lane])
+            for host, gate in upstream.gateway.gates.items() for lane in Lane}
+
+
+def collect_open_breakers() -> dict:
+    return {(host,): int(breaker.state == BreakerState.OPEN) for host, breaker in upstream.breakers.breakers.items()}
+
+
+class Stats(commands.Cog):
+    """ Records command latencies, finishes traces and serves every metric over HTTP and through /stats. """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.enabled = config.getboolean('Metrics', 'enabled', fallback=True)
+        self.host = config.get('Metrics', 'host', fallback='127.0.0.1')
+        self.port = config.getint('Metrics', 'port', fallback=9100)
+        self.runner = None
+        self.original_on_error = None
+
+    async def cog_load(self):
+        CACHE_LOOKUPS.set_callback('caches', collect_cache_lookups)
+        CACHE_HIT_RATIO.set_callback('caches', collect_cache_hit_ratios)
+        SHARD_LATENCY.set_callback('bot', lambda: {(shard_id,): latency for shard_id, latency in self.bot.latencies})
+        UPSTREAM_QUEUE.set_callback('gateway', collect_upstream_queues)
+        UPSTREAM_BREAKER_OPEN.set_callback('breakers', collect_open_breakers)
+        PAGE_CACHE_ENTRIES.set_callback('pages', lambda: {(): len(pagination.content_cache.entries)})
+
+        # Failed commands never dispatch on_app_command_completion, so they are recorded from the tree's error handler.
+        self.original_on_error = self.bot.tree.on_error
+
+        async def on_error(interaction: discord.Interaction, error: discord.app_commands.AppCommandError):
+            self.record_command(interaction, 'error')
+            await self.original_on_error(interaction, error)
+
+        self.bot.tree.on_error = on_error
+
+        if self.enabled:
+            app = web.Application()
+            app.router.add_get('/metrics', self.serve_metrics)
+            self.runner = web.AppRunner(app, access_log=None)
+            await self.runner.setup()
+            try:
+                await web.TCPSite(self.runner, self.host, self.port).start()
+            except OSError as e:
+                print(f'Could not serve metrics on {self.host}:{self.port}: {e}')
+                await self.runner.cleanup()
+                self.runner = None
+
+    async def cog_unload(self):
+        self.bot.tree.on_error = self.original_on_error
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def serve_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+    @staticmethod
+    def record_command(interaction: discord.Interaction, outcome: str):
+        if interaction.command is None:
+            return
+        latency = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+        COMMAND_LATENCY.observe(latency, command=interaction.command.qualified_name, outcome=outcome)
+        tracing.finish_trace(interaction.command.qualified_name, outcome)
+
+    @commands.Cog.listener()
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        self.record_command(interaction, 'success')
+
+    @discord.app_commands.command(name="stats", description="🔒 Bot owner only command. Shows performance metrics.")
+    async def stats(self, interaction: discord.Interaction):
+        app = await self.bot.application_info()
+        if interaction.user.id != app.owner.id:
+            return await interaction.response.send_message("🔒 **You do not have permission to use this command**.",
+                                                           ephemeral=True)
+
+        em = discord.Embed(title="Performance", colour=0x558a25)
+
+        commands_by_count = sorted(COMMAND_LATENCY.summaries().items(), key=lambda item: item[1][0], reverse=True)
+        em.add_field(name="Commands (count, mean, p95)", value='\n'.join(
+            f"`{command}` {outcome}: {count}, {mean:.2f}s, ≤{COMMAND_LATENCY.quantile(0.95, command=command, outcome=outcome)}s"
+            for (command, outcome), (count, mean) in commands_by_count[:10]
+        ) or "None yet", inline=False)
+
+        upstream_by_count = sorted(UPSTREAM_LATENCY.summaries().items(), key=lambda item: item[1][0], reverse=True)
+        em.add_field(name="Upstream (count, mean)", value='\n'.join(
+            f"`{host}` {status}: {count}, {mean:.2f}s" for (host, status), (count, mean) in upstream_by_count[:10]
+        ) or "None yet", inline=False)
+
+        em.add_field(name="Cache hit ratios", value='\n'.join(
+            f"{cache}: {ratio:.0%}" for (cache,), ratio in collect_cache_hit_ratios().items()
+        ), inline=True)
+        page_cache = pagination.content_cache
+        em.add_field(name="Cached pages",
+                     value=f"{len(page_cache.entries)}/{page_cache.max_entries}\n"
+                           f"{page_cache.total_bytes / 2 ** 20:.1f}/{page_cache.max_bytes / 2 ** 20:.0f} MB", inline=True)
+        em.add_field(name="Shard latency", value='\n'.join(
+            f"{shard_id}: {latency * 1000:.0f}ms" for shard_id, latency in self.bot.latencies
+        ) or "None", inline=True)
+
+        lag = loop_monitor.lag_quantiles()
+        blocking = loop_monitor.blocking_sites().most_common(3)
+        em.add_field(name="Event loop lag", value='\n'.join(
+            [f"{q}: {seconds * 1000:.1f}ms" for q, seconds in lag.items()] +
+            [f"`{site}`: blocked {count}x" for site, count in blocking]
+        ) or "Not measured", inline=False)
+
+        await interaction.response.send_message(embed=em, ephemeral=True)
+
+
+async def setup(bot):
+    await bot.add_cog(Stats(bot))
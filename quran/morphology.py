@@ -1,7 +1,6 @@
 import re
 
 import discord
-from aiohttp import ClientSession
 from discord.ext import commands
 
 from quran.quran_info import QuranReference, SurahNameTransformer
@@ -36,7 +35,6 @@ class QuranMorphology(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.session = ClientSession(loop=bot.loop)
         self.morphologyURL = 'http://corpus.quran.com/wordmorphology.jsp?location=({}:{}:{})'
         self.syntaxURL = 'http://corpus.quran.com/treebank.jsp?chapter={}&verse={}&token={}'
 
@@ -4,16 +4,38 @@ import discord
 from discord.ext import commands
 
 from quran.quran_info import QuranReference, SurahNameTransformer
-from utils.errors import respond_to_interaction_error
+from quran.text_backends import quran_text
+from utils import pagination
+from utils.errors import DeadlineExceeded, respond_to_interaction_error
 from utils.utils import convert_to_arabic_number
 
 ICON_URL = 'https://cdn6.aptoide.com/imgs/6/a/6/6a6336c9503e6bd4bdf98fda89381195_icon.png'
+MUSHAF_PAGES = 604
 
 
 class Mushaf(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    async def cog_load(self) -> None:
+        pagination.register(self.bot, pagination.PageSource(
+            'mushaf', self.load_style, lambda show_tajweed, page: self.get_mushaf_image(page, show_tajweed),
+            lambda show_tajweed: MUSHAF_PAGES))
+
+    async def cog_unload(self) -> None:
+        pagination.unregister('mushaf')
+
+    @staticmethod
+    async def load_style(key: str) -> bool:
+        # Every page is a URL, so all that needs remembering is which mushaf is shown.
+        return key == 'tajweed'
+
+    @staticmethod
+    def page_buttons(interaction: discord.Interaction, page: int, show_tajweed: bool) -> discord.ui.View:
+        # Only the sender of the command can change the page.
+        return pagination.paginate('mushaf', 'tajweed' if show_tajweed else 'plain', show_tajweed, page=page,
+                                   owner=interaction.user.id)
+
     @staticmethod
     def get_mushaf_image(page: int, show_tajweed: bool = False) -> discord.Embed:
         formatted_page = str(page).zfill(3)
@@ -32,15 +54,16 @@ class Mushaf(commands.Cog):
     async def _mushaf_from_ref(self, interaction: discord.Interaction, ref, show_tajweed: bool = False,
                                reveal_order: bool = False) -> discord.Embed:
         reference = QuranReference(ref=ref, reveal_order=reveal_order)
-        async with self.bot.session.get(f'https://api.alquran.cloud/ayah/{reference.surah}:{reference.ayat_list}') as resp:
-            if resp.status != 200:
-                return await interaction.followup.send(
-                    "**Could not retrieve the mushaf image**. Please try again later.")
-            data = await resp.json()
-            page = int(data['data']['page'])
+        try:
+            page = await quran_text.verse_page(reference.surah, reference.ayat_list)
+        except DeadlineExceeded:
+            raise
+        except Exception:
+            return await interaction.followup.send(
+                "**Could not retrieve the mushaf image**. Please try again later.")
 
         em = self.get_mushaf_image(page, show_tajweed)
-        mushaf_ui_view = MushafNavigator(page, show_tajweed, interaction)
+        mushaf_ui_view = self.page_buttons(interaction, page, show_tajweed)
         await interaction.followup.send(embed=em, view=mushaf_ui_view)
 
     group = discord.app_commands.Group(name="mushaf", description="View a specific page of verse on the mushaf.")
@@ -70,7 +93,7 @@ class Mushaf(commands.Cog):
     async def by_page(self, interaction: discord.Interaction, page: discord.app_commands.Range[int, 1, 604], show_tajweed: bool = False):
         await interaction.response.defer(thinking=True)
         em = self.get_mushaf_image(page=page, show_tajweed=show_tajweed)
-        mushaf_ui_view = MushafNavigator(page, show_tajweed, interaction)
+        mushaf_ui_view = self.page_buttons(interaction, page, show_tajweed)
         await interaction.followup.send(embed=em, view=mushaf_ui_view)
 
     @discord.app_commands.command(name="rmushaf", description="Sends a random page from the mushaf.")
@@ -79,9 +102,9 @@ class Mushaf(commands.Cog):
     @discord.app_commands.describe(show_tajweed="Should the mushaf highlight where tajweed rules apply?")
     async def rmushaf(self, interaction: discord.Interaction, show_tajweed: bool = False):
         await interaction.response.defer(thinking=True)
-        page = random.randint(1, 604)
+        page = random.randint(1, MUSHAF_PAGES)
         em = self.get_mushaf_image(page=page, show_tajweed=show_tajweed)
-        mushaf_ui_view = MushafNavigator(page, show_tajweed, interaction)
+        mushaf_ui_view = self.page_buttons(interaction, page, show_tajweed)
         await interaction.followup.send(embed=em, view=mushaf_ui_view)
 
     @by_ayah.error
@@ -91,42 +114,5 @@ class Mushaf(commands.Cog):
         await respond_to_interaction_error(interaction, error)
 
 
-class MushafNavigator(discord.ui.View):
-    def __init__(self, page: int, show_tajweed: bool, interaction: discord.Interaction):
-        super().__init__()
-        self.page = page
-        self.show_tajweed = show_tajweed
-        self.original_interaction = interaction
-
-    async def on_timeout(self):
-        for child in self.children:
-            child.disabled = True
-        await self.original_interaction.edit_original_response(view=self, content=":warning: This message has timed out.")
-
-    @discord.ui.button(label='Previous Page', style=discord.ButtonStyle.grey, emoji='⬅')
-    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id != self.original_interaction.user.id:
-            return await interaction.response.send_message(content="Only the sender of the command can change the page.", ephemeral=True)
-
-        if self.page > 1:
-            self.page -= 1
-        else:
-            self.page = 604
-        em = Mushaf.get_mushaf_image(self.page, self.show_tajweed)
-        await interaction.response.edit_message(embed=em)
-
-    @discord.ui.button(label='Next Page', style=discord.ButtonStyle.green, emoji='➡')
-    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id != self.original_interaction.user.id:
-            return await interaction.response.send_message(content="Only the sender of the command can change the page.", ephemeral=True)
-
-        if self.page < 604:
-            self.page += 1
-        else:
-            self.page = 1
-        em = Mushaf.get_mushaf_image(self.page, self.show_tajweed)
-        await interaction.response.edit_message(embed=em)
-
-
 async def setup(bot):
     await bot.add_cog(Mushaf(bot))
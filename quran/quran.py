@@ -5,6 +5,7 @@ import discord
 from discord.ext import commands
 
 from quran.quran_info import *
+from quran.text_backends import quran_text
 from utils import utils
 from utils.database_utils import ServerTranslation
 from utils.errors import InvalidTranslation, respond_to_interaction_error
@@ -181,7 +182,6 @@ class QuranRequest:
             self.translation = Translation(translation_key)
 
         self.regular_url = 'https://api.quran.com/api/v4/quran/translations/{}?verse_key={}:{}'
-        self.arabic_url = 'https://api.quran.com/api/v4/quran/verses/uthmani?verse_key={}'
         self.footnote_url = 'https://api.qurancdn.com/api/qdc/foot_notes/{}' # unofficial API
         self.verse_ayah_dict = {}
         self.footnotes = []
@@ -225,8 +225,7 @@ class QuranRequest:
 
     async def get_arabic_verses(self):
         for ayah in self.ref.ayat_list:
-            json = await get_site_json(self.arabic_url.format(f'{self.ref.surah}:{ayah}'))
-            text = json['verses'][0]['text_uthmani']
+            text = await quran_text.arabic_verse(self.ref.surah, ayah)
 
             # Truncate verses longer than 1024 characters
             if len(text) > 1024:
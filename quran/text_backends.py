@@ -0,0 +1,286 @@
+"""
+Where Arabic verse text and mushaf page numbers come from.
+
+Several interchangeable backends are kept, each with rolling latency and error statistics, and every lookup
+goes to the fastest healthy one. Arabic text lookups are hedged: if the chosen backend has not answered
+within its usual (p95) latency, the next one is asked too and whichever answers first is used. Only backends with
+quran.com's edition of the text serve it, so that a verse reads the same whichever of them answers: alquran.cloud's
+Uthmani text is spelled differently and starts the first verse of most surahs with the Bismillah, so it is only used
+for page numbers.
+
+Translations are not covered, as the translation IDs the bot uses are specific to quran.com.
+
+A local store can be built once with `python -m quran.text_backends <path>` and enabled with
+`local_path` in the [Quran Text] section, after which no network call is needed at all.
+"""
+import asyncio
+import configparser
+import json
+import os
+import statistics
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from utils.errors import DeadlineExceeded
+from utils.http_client import upstream
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+WINDOW = config.getint('Quran Text', 'window', fallback=200)
+MAX_ERROR_RATE = config.getfloat('Quran Text', 'max_error_rate', fallback=0.5)
+# Used as the hedge delay until a backend has answered enough requests for its p95 to mean anything.
+DEFAULT_HEDGE_DELAY = config.getfloat('Quran Text', 'hedge_delay', fallback=1.0)
+MIN_SAMPLES = 20
+# The edition of the Arabic text shown, which the bot has always taken from quran.com.
+TEXT_EDITION = 'quran.com'
+# Local stores written before they recorded their edition hold alquran.cloud's text.
+LEGACY_EDITION = 'alquran.cloud'
+
+
+class BackendError(Exception):
+    pass
+
+
+@dataclass
+class BackendStats:
+    latencies: deque = field(default_factory=lambda: deque(maxlen=WINDOW))
+    outcomes: deque = field(default_factory=lambda: deque(maxlen=WINDOW))
+
+    def record(self, seconds: float, ok: bool):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(seconds)
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0
+
+    @property
+    def healthy(self) -> bool:
+        return self.error_rate < MAX_ERROR_RATE
+
+    @property
+    def p50(self) -> float:
+        # Backends without samples sort first, so that each gets tried and measured.
+        return statistics.median(self.latencies) if self.latencies else 0
+
+    @property
+    def p95(self) -> float:
+        if len(self.latencies) < MIN_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        return statistics.quantiles(self.latencies, n=20)[-1]
+
+
+class QuranTextBackend:
+    name = None
+    # Whose edition of the Arabic text arabic_verse returns.
+    text_edition = None
+
+    def __init__(self):
+        self.stats = BackendStats()
+
+    async def arabic_verse(self, surah: int, ayah: int) -> str:
+        """ Returns the Uthmani text of a verse. """
+        raise NotImplementedError
+
+    async def verse_page(self, surah: int, ayah: int) -> int:
+        """ Returns the page of the Madani mushaf that a verse is on. """
+        raise NotImplementedError
+
+
+class QuranComBackend(QuranTextBackend):
+    name = 'quran.com'
+    text_edition = 'quran.com'
+
+    async def _get_json(self, url: str) -> dict:
+        response = await upstream.fetch(url)
+        if response.status != 200:
+            raise BackendError(f'{self.name} returned {response.status}')
+        return response.json()
+
+    async def arabic_verse(self, surah: int, ayah: int) -> str:
+        data = await self._get_json(f'https://api.quran.com/api/v4/quran/verses/uthmani?verse_key={surah}:{ayah}')
+        return data['verses'][0]['text_uthmani']
+
+    async def verse_page(self, surah: int, ayah: int) -> int:
+        data = await self._get_json(f'https://api.quran.com/api/v4/verses/by_key/{surah}:{ayah}')
+        return int(data['verse']['page_number'])
+
+
+class AlQuranCloudBackend(QuranComBackend):
+    name = 'alquran.cloud'
+    text_edition = 'alquran.cloud'
+
+    async def arabic_verse(self, surah: int, ayah: int) -> str:
+        data = await self._get_json(f'https://api.alquran.cloud/v1/ayah/{surah}:{ayah}/quran-uthmani')
+        return data['data']['text']
+
+    async def verse_page(self, surah: int, ayah: int) -> int:
+        data = await self._get_json(f'https://api.alquran.cloud/v1/ayah/{surah}:{ayah}/quran-uthmani')
+        return int(data['data']['page'])
+
+
+class LocalBackend(QuranTextBackend):
+    """
+    Serves verses from a JSON file holding the edition of its text and, under "verses", a map of "surah:ayah" to
+    {"text": ..., "page": ...}.
+    """
+
+    name = 'local'
+
+    def __init__(self, path: str):
+        super().__init__()
+        with open(path, encoding='utf-8') as f:
+            store = json.load(f)
+        if 'verses' in store:
+            self.text_edition = store['edition']
+            self.verses = store['verses']
+        else:
+            self.text_edition = LEGACY_EDITION
+            self.verses = store
+
+    def _verse(self, surah: int, ayah: int) -> dict:
+        try:
+            return self.verses[f'{surah}:{ayah}']
+        except KeyError:
+            raise BackendError(f'{surah}:{ayah} is not in the local store')
+
+    async def arabic_verse(self, surah: int, ayah: int) -> str:
+        return self._verse(surah, ayah)['text']
+
+    async def verse_page(self, surah: int, ayah: int) -> int:
+        return int(self._verse(surah, ayah)['page'])
+
+
+class QuranTextRouter:
+    def __init__(self, backends: list):
+        self.backends = backends
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    @classmethod
+    def from_config(cls) -> 'QuranTextRouter':
+        backends = []
+        local_path = config.get('Quran Text', 'local_path', fallback=None)
+        if local_path and os.path.exists(local_path):
+            backends.append(LocalBackend(local_path))
+        backends += [QuranComBackend(), AlQuranCloudBackend()]
+        return cls(backends)
+
+    def ranked(self) -> list:
+        """ Healthy backends fastest first, followed by unhealthy ones in order of error rate. """
+        healthy = sorted((b for b in self.backends if b.stats.healthy), key=lambda b: b.stats.p50)
+        unhealthy = sorted((b for b in self.backends if not b.stats.healthy), key=lambda b: b.stats.error_rate)
+        return healthy + unhealthy
+
+    async def _call(self, backend: QuranTextBackend, method: str, *args):
+        start = time.monotonic()
+        try:
+            result = await getattr(backend, method)(*args)
+        except (asyncio.CancelledError, DeadlineExceeded):
+            raise
+        except Exception:
+            backend.stats.record(time.monotonic() - start, ok=False)
+            raise
+        backend.stats.record(time.monotonic() - start, ok=True)
+        return result
+
+    async def verse_page(self, surah: int, ayah: int) -> int:
+        last_error = None
+        for backend in self.ranked():
+            try:
+                return await self._call(backend, 'verse_page', surah, ayah)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                last_error = e
+        raise last_error
+
+    async def arabic_verse(self, surah: int, ayah: int) -> str:
+        """
+        Asks the fastest backend, and the next one too if the first has not answered within its p95 latency or
+        fails. The first successful answer wins; the slower request is abandoned.
+        """
+        candidates = [backend for backend in self.ranked() if backend.text_edition == TEXT_EDITION]
+        pending = set()
+        hedges = set()
+        last_error = None
+        try:
+            while candidates or pending:
+                if candidates:
+                    backend = candidates.pop(0)
+                    if pending:
+                        self.hedged += 1
+                    task = asyncio.create_task(self._call(backend, 'arabic_verse', surah, ayah))
+                    if pending:
+                        hedges.add(task)
+                    pending.add(task)
+                    timeout = backend.stats.p95 if candidates else None
+                else:
+                    timeout = None
+
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task in hedges:
+                            self.hedge_wins += 1
+                        return task.result()
+                    if isinstance(task.exception(), DeadlineExceeded):
+                        raise task.exception()
+                    last_error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise last_error
+
+    def get_stats(self) -> dict:
+        return {
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'backends': {
+                backend.name: {
+                    'samples': len(backend.stats.outcomes),
+                    'p50': backend.stats.p50,
+                    'p95': backend.stats.p95,
+                    'error_rate': backend.stats.error_rate,
+                    'healthy': backend.stats.healthy,
+                }
+                for backend in self.backends
+            },
+        }
+
+
+quran_text = QuranTextRouter.from_config()
+
+
+async def build_local_store(path: str):
+    """
+    Downloads the whole Uthmani text from quran.com and the page numbers from alquran.cloud, one request each, and
+    writes them out for LocalBackend.
+    """
+    await upstream.start()
+    try:
+        text_response = await upstream.fetch('https://api.quran.com/api/v4/quran/verses/uthmani')
+        page_response = await upstream.fetch('https://api.alquran.cloud/v1/quran/quran-uthmani')
+        pages = {
+            f"{surah['number']}:{ayah['numberInSurah']}": ayah['page']
+            for surah in page_response.json()['data']['surahs']
+            for ayah in surah['ayahs']
+        }
+        verses = {
+            verse['verse_key']: {'text': verse['text_uthmani'], 'page': pages[verse['verse_key']]}
+            for verse in text_response.json()['verses']
+        }
+    finally:
+        await upstream.close()
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'edition': TEXT_EDITION, 'verses': verses}, f, ensure_ascii=False)
+    print(f'Wrote {len(verses)} verses to {path}')
+
+
+if __name__ == '__main__':
+    asyncio.run(build_local_store(sys.argv[1] if len(sys.argv) > 1 else 'quran-uthmani.json'))
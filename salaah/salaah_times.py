@@ -8,6 +8,9 @@ from discord.ext import commands, tasks
 
 from salaah.praytimes import PrayTimes
 from utils.database_utils import UserPrayerCalculationMethod
+from utils.errors import DeadlineExceeded
+from utils.http_client import upstream
+from utils.upstream_gateway import Lane
 
 ICON = 'https://images-na.ssl-images-amazon.com/images/I/51q8CGXOltL.png'
 METHODS_URL = 'https://api.aladhan.com/v1/methods'
@@ -44,32 +47,33 @@ class PrayerTimes(commands.Cog):
     # The calculation methods (infrequently) update, so dynamically add new methods
     @tasks.loop(hours=1)
     async def update_calculation_methods(self):
-        async with self.bot.session.get(METHODS_URL, headers=headers) as resp:
-            data = await resp.json()
-            data = data['data'].values()
-            # There's an entry ('CUSTOM') with no 'name' value, so we need to ignore it:
-            self.calculation_methods = {method['id']: method['name'] for method in data if int(method['id']) != 99}
+        response = await upstream.fetch(METHODS_URL, headers=headers, lane=Lane.BACKGROUND)
+        data = response.json()['data'].values()
+        # There's an entry ('CUSTOM') with no 'name' value, so we need to ignore it:
+        self.calculation_methods = {method['id']: method['name'] for method in data if int(method['id']) != 99}
 
     async def get_prayertimes(self, location, calculation_method) -> PrayerTimesResponse:
         url = PRAYER_TIMES_URL.format(location, calculation_method, '0')
 
-        async with self.bot.session.get(url, headers=headers) as resp:
-            data = await resp.json()
-            fajr = data['data']['timings']['Fajr']
-            sunrise = data['data']['timings']['Sunrise']
-            dhuhr = data['data']['timings']['Dhuhr']
-            asr = data['data']['timings']['Asr']
-            maghrib = data['data']['timings']['Maghrib']
-            isha = data['data']['timings']['Isha']
-            imsak = data['data']['timings']['Imsak']
-            midnight = data['data']['timings']['Midnight']
-            date = data['data']['date']['readable']
+        data = (await upstream.fetch(url, headers=headers)).json()
+        fajr = data['data']['timings']['Fajr']
+        sunrise = data['data']['timings']['Sunrise']
+        dhuhr = data['data']['timings']['Dhuhr']
+        asr = data['data']['timings']['Asr']
+        maghrib = data['data']['timings']['Maghrib']
+        isha = data['data']['timings']['Isha']
+        imsak = data['data']['timings']['Imsak']
+        midnight = data['data']['timings']['Midnight']
+        date = data['data']['date']['readable']
 
         url = PRAYER_TIMES_URL.format(location, calculation_method, '1')
 
-        async with self.bot.session.get(url, headers=headers) as resp:
-            data = await resp.json()
+        try:
+            data = (await upstream.fetch(url, headers=headers)).json()
             asr_hanafi = data['data']['timings']['Asr']
+        except DeadlineExceeded:
+            # Better to answer without the Hanafi Asr time than not at all.
+            asr_hanafi = None
 
         return PrayerTimesResponse(fajr, sunrise, dhuhr, asr, asr_hanafi, maghrib, isha, imsak, midnight, date)
 
@@ -77,11 +81,10 @@ class PrayerTimes(commands.Cog):
         async def get_information(location):
             url = "http://api.aladhan.com/v1/hijriCalendarByAddress"
             params = {"address": location}
-            async with self.bot.session.get(url, headers=headers, params=params) as resp:
-                data = await resp.json()
-                meta = data['data'][0]['meta']
-                coordinates = (meta['latitude'], meta['longitude'])
-                timezone_name = meta['timezone']
+            data = (await upstream.fetch(url, headers=headers, params=params)).json()
+            meta = data['data'][0]['meta']
+            coordinates = (meta['latitude'], meta['longitude'])
+            timezone_name = meta['timezone']
             time = dt.datetime.now(gettz(timezone_name))
             timezone_offset = time.utcoffset() / timedelta(hours=1)
             return coordinates, time, timezone_offset
@@ -162,6 +165,8 @@ class PrayerTimes(commands.Cog):
         time_format = "%I:%M %p" if twelve_hour else "%H:%M"
 
         for name, time_str in prayer_times.items():
+            if time_str is None:
+                continue
             if twelve_hour:
                 time_str = dt.strptime(time_str, "%H:%M").strftime(time_format)
             em.add_field(name=f'**{name}**', value=time_str, inline=True)
@@ -1,5 +1,4 @@
 import re
-import textwrap
 
 import discord
 from bs4 import BeautifulSoup
@@ -7,6 +6,7 @@ from discord.ext import commands
 from fuzzywuzzy import process, fuzz
 
 from quran.quran_info import QuranReference, SurahNameTransformer
+from utils import pagination, tracing
 from utils.database_utils import ServerArabicTafsir
 from utils.errors import InvalidArabicTafsir, respond_to_interaction_error
 from utils.slash_utils import get_key_from_value
@@ -191,7 +191,8 @@ class ArabicTafsirRequest:
     async def fetch_text(self):
         self.url = f'https://tafsir.app/{self.website_id}/{self.surah}/{self.ayah}'
         content = str(await get_site_source(self.url))
-        self.process_text(content)
+        with tracing.span('tafsir.process_text'):
+            self.process_text(content)
 
     '''
     Gets, formats and paginates the tafsir text.
@@ -220,7 +221,7 @@ class ArabicTafsirRequest:
         text = re.sub(cleanb, '', text)
 
         # Paginate the text, set the embed text to the current page and calculate how many pages were made:
-        self.pages = textwrap.wrap(text, 2034, break_long_words=True)
+        self.pages = pagination.Paginator(text, 2034, break_long_words=True)
         self.num_pages = len(self.pages)
 
     def process_footnotes(self):
@@ -249,7 +250,8 @@ class ArabicTafsirRequest:
 
     def make_embed(self):
         ref = convert_to_arabic_number(f'{self.surah}:{self.ayah}')
-        text, footer = self.process_footnotes()
+        with tracing.span('tafsir.process_footnotes'):
+            text, footer = self.process_footnotes()
 
         text = text.replace('#', '\n')
         text = f'```py\n{text}\n```'
@@ -267,15 +269,36 @@ class ArabicTafsir(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    async def cog_load(self) -> None:
+        pagination.register(self.bot, pagination.PageSource('atafsir', self.load_tafsir, self.render_page,
+                                                            lambda tafsir: tafsir.num_pages, discord.ButtonStyle.red))
+
+    async def cog_unload(self) -> None:
+        pagination.unregister('atafsir')
+
+    @staticmethod
+    async def load_tafsir(key: str) -> ArabicTafsirRequest:
+        tafsir_id, surah, ayah = key.split('|')
+        tafsir = ArabicTafsirRequest(int(surah), int(ayah), tafsir_id)
+        await tafsir.fetch_text()
+        return tafsir
+
+    @staticmethod
+    def render_page(tafsir: ArabicTafsirRequest, page: int) -> discord.Embed:
+        tafsir.page = page
+        return tafsir.make_embed()
+
     async def send(self, interaction: discord.Interaction, tafsir: ArabicTafsirRequest):
         await tafsir.fetch_text()
-        em = tafsir.make_embed()
-        if tafsir.num_pages == 1:
-            return await interaction.followup.send(embed=em)
+        with tracing.span('tafsir.make_embed'):
+            em = tafsir.make_embed()
+        with tracing.span('discord.followup'):
+            if tafsir.num_pages == 1:
+                return await interaction.followup.send(embed=em)
 
-        # If there are multiple pages, construct buttons for their navigation.
-        tafsir_ui_view = ArabicTafsirNavigator(tafsir, interaction)
-        await interaction.followup.send(embed=em, view=tafsir_ui_view)
+            # If there are multiple pages, construct buttons for their navigation.
+            tafsir_ui_view = pagination.paginate('atafsir', f'{tafsir.id}|{tafsir.surah}|{tafsir.ayah}', tafsir)
+            await interaction.followup.send(embed=em, view=tafsir_ui_view)
 
     group = discord.app_commands.Group(
         name="atafsir",
@@ -333,35 +356,5 @@ class ArabicTafsir(commands.Cog):
         await respond_to_interaction_error(interaction, error)
 
 
-class ArabicTafsirNavigator(discord.ui.View):
-    def __init__(self, tafsir: ArabicTafsirRequest, interaction: discord.Interaction):
-        super().__init__(timeout=600)
-        self.tafsir = tafsir
-        self.original_interaction = interaction
-
-    async def on_timeout(self):
-        for child in self.children:
-            child.disabled = True
-        await self.original_interaction.edit_original_response(view=self, content=":warning: This message has timed out.")
-
-    @discord.ui.button(label='Previous Page', style=discord.ButtonStyle.red, emoji='⬅')
-    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if self.tafsir.page > 1:
-            self.tafsir.page -= 1
-        else:
-            self.tafsir.page = self.tafsir.num_pages
-        em = self.tafsir.make_embed()
-        await interaction.response.edit_message(embed=em)
-
-    @discord.ui.button(label='Next Page', style=discord.ButtonStyle.green, emoji='➡')
-    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if self.tafsir.page < self.tafsir.num_pages:
-            self.tafsir.page += 1
-        else:
-            self.tafsir.page = 1
-        em = self.tafsir.make_embed()
-        await interaction.response.edit_message(embed=em)
-
-
 async def setup(bot):
     await bot.add_cog(ArabicTafsir(bot))
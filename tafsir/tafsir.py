@@ -1,10 +1,10 @@
 import re
-import textwrap
 
 import discord
 from discord.ext import commands
 
 from quran.quran_info import Surah, QuranReference, SurahNameTransformer
+from utils import deadlines, pagination
 from utils.database_utils import ServerTafsir
 from utils.errors import InvalidTafsir, respond_to_interaction_error
 from utils.slash_utils import generate_choices_from_dict
@@ -108,6 +108,8 @@ class TafsirRequest:
         self.query_tafsir(tafsir)
 
         self.ref = QuranReference(ref=ref, reveal_order=reveal_order)
+        # Taken before fetching, which can move the reference on to the next surah.
+        self.page_key = f'{self.tafsir}|{self.ref.surah}:{self.ref.ayat_list}'
         self.make_url()
 
     # this is the function to implement better tafsir retrieval
@@ -189,7 +191,9 @@ class TafsirRequest:
                 text = source[(source.index(char1) + len(char1)):source.index(char2)]
                 self.text = u"{}".format(text).replace('`', '\\`').rstrip()
 
-        self.pages = textwrap.wrap(self.text, 2000, break_long_words=False)
+        self.pages = pagination.Paginator(self.text, 2000, break_long_words=False)
+        # The pages are offsets into their own copy of the text, so keep only that one.
+        self.text = self.pages.text
         self.num_pages = len(self.pages)
 
     def make_embed(self):
@@ -212,11 +216,28 @@ class Tafsir(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    async def cog_load(self) -> None:
+        pagination.register(self.bot, pagination.PageSource('tafsir', self.load_tafsir, self.render_page,
+                                                            lambda spec: spec.num_pages, discord.ButtonStyle.red))
+
+    async def cog_unload(self) -> None:
+        pagination.unregister('tafsir')
+
+    async def load_tafsir(self, key: str) -> TafsirRequest:
+        tafsir, ref = key.split('|', 1)
+        return await self.process_request(ref=ref, tafsir=tafsir, page=1)
+
+    @staticmethod
+    def render_page(spec: TafsirRequest, page: int) -> discord.Embed:
+        spec.page = page
+        spec.make_embed()
+        return spec.embed
+
     async def send_embed(self, interaction: discord.Interaction, spec: TafsirRequest):
         if spec.num_pages == 1:
             return await interaction.followup.send(embed=spec.embed)
         else:
-            tafsir_ui_view = TafsirNavigator(spec, interaction)
+            tafsir_ui_view = pagination.paginate('tafsir', spec.page_key, spec)
             await interaction.followup.send(embed=spec.embed, view=tafsir_ui_view)
 
     async def process_request(self, ref: str, tafsir: str, page: int, reveal_order: bool = False):
@@ -226,6 +247,7 @@ class Tafsir(commands.Cog):
         except IndexError:
             # If no entry was found in the default tafsir (Maarif-ul-Quran), fall back to Tafsir al-Jalalayn.
             if tafsir == 'maarifulquran':
+                deadlines.check()
                 return await self.process_request(ref=ref, tafsir='jalalayn', page=page, reveal_order=reveal_order)
             else:
                 raise NoText
@@ -292,35 +314,5 @@ class Tafsir(commands.Cog):
             await respond_to_interaction_error(interaction, error)
 
 
-class TafsirNavigator(discord.ui.View):
-    def __init__(self, tafsir: TafsirRequest, interaction: discord.Interaction):
-        super().__init__(timeout=300)
-        self.tafsir = tafsir
-        self.original_interaction = interaction
-
-    async def on_timeout(self):
-        for child in self.children:
-            child.disabled = True
-        await self.original_interaction.edit_original_response(view=self, content=":warning: This message has timed out.")
-
-    @discord.ui.button(label='Previous Page', style=discord.ButtonStyle.red, emoji='⬅')
-    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if self.tafsir.page > 1:
-            self.tafsir.page -= 1
-        else:
-            self.tafsir.page = self.tafsir.num_pages
-        self.tafsir.make_embed()
-        await interaction.response.edit_message(embed=self.tafsir.embed)
-
-    @discord.ui.button(label='Next Page', style=discord.ButtonStyle.green, emoji='➡')
-    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if self.tafsir.page < self.tafsir.num_pages:
-            self.tafsir.page += 1
-        else:
-            self.tafsir.page = 1
-        self.tafsir.make_embed()
-        await interaction.response.edit_message(embed=self.tafsir.embed)
-
-
 async def setup(bot):
     await bot.add_cog(Tafsir(bot))
@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+
+import pymysql
+
+from utils import storage_backends
+from utils.database_utils import DBHandler, ServerTafsir, settings_tables
+from utils.storage_backends import MySQLBackend, StorageBackend
+
+
+class FailingBackend(MySQLBackend):
+    def __init__(self, error: Exception):
+        # Without MySQLBackend's, which needs connection settings in config.ini.
+        StorageBackend.__init__(self)
+        self.error = error
+
+    async def fetch_row(self, table_name: str, key_column: str, key, columns) -> tuple:
+        raise self.error
+
+
+class ReadErrorTests(unittest.IsolatedAsyncioTestCase):
+    def tearDown(self):
+        DBHandler.backend = None
+
+    async def read_with(self, error: Exception, guild_id: int) -> MySQLBackend:
+        DBHandler.backend = FailingBackend(error)
+        self.assertEqual(await ServerTafsir(guild_id).get(), 'maarifulquran')
+        return DBHandler.backend
+
+    async def test_missing_table_does_not_take_the_backend_down(self):
+        backend = await self.read_with(pymysql.err.ProgrammingError(1146, "Table 'guild_settings' doesn't exist"), 1)
+        self.assertTrue(backend.is_available())
+
+    async def test_lost_connection_takes_the_backend_down(self):
+        backend = await self.read_with(pymysql.err.OperationalError(2013, 'Lost connection to MySQL server'), 2)
+        self.assertFalse(backend.is_available())
+
+
+class UnreachableAtStartBackend(StorageBackend):
+    """ A backend that cannot be reached until `reachable` is set. """
+
+    name = 'test'
+
+    def __init__(self):
+        super().__init__()
+        self.reachable = False
+        self.tables = set()
+
+    async def start(self):
+        pass
+
+    async def ping(self):
+        if not self.reachable:
+            raise ConnectionRefusedError
+
+    async def table_exists(self, table_name: str) -> bool:
+        await self.ping()
+        return table_name in self.tables
+
+    async def ensure_table(self, table_name: str, key_column: str, columns):
+        await self.ping()
+        self.tables.add(table_name)
+
+
+class EnsureTableTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncTearDown(self):
+        await DBHandler.close_backend()
+
+    async def test_tables_are_created_once_the_backend_is_reachable(self):
+        backend = UnreachableAtStartBackend()
+        await DBHandler.open_backend(backend)
+        self.assertEqual(backend.tables, set())
+
+        interval = storage_backends.health_check_interval
+        storage_backends.health_check_interval = 0
+        self.addCleanup(setattr, storage_backends, 'health_check_interval', interval)
+        backend.reachable = True
+        backend.start_health_check()
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+        self.assertEqual(backend.tables, {handler.table_name for handler in settings_tables()})
+        self.assertEqual(DBHandler.ensured_tables, backend.tables)
+
+
+if __name__ == '__main__':
+    unittest.main()
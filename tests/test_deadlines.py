@@ -0,0 +1,33 @@
+import asyncio
+import unittest
+
+import discord
+
+from benchmarks.fakes import FakeInteraction
+from utils import deadlines, tracing
+
+
+async def check(tree: deadlines.DeadlineCommandTree, interaction: FakeInteraction):
+    """ Runs the tree's check as discord.py does, returning the trace it leaves for the command. """
+    await tree.interaction_check(interaction)
+    return tracing.current_trace.get()
+
+
+class DeadlineCommandTreeTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tree = deadlines.DeadlineCommandTree(discord.Client(intents=discord.Intents.none()))
+
+    @unittest.skipUnless(tracing.enabled, 'tracing is disabled in config.ini')
+    async def test_commands_are_traced(self):
+        interaction = FakeInteraction()
+        interaction.type = discord.InteractionType.application_command
+        self.assertIsNotNone(await asyncio.create_task(check(self.tree, interaction)))
+
+    async def test_autocomplete_is_not_traced(self):
+        interaction = FakeInteraction()
+        interaction.type = discord.InteractionType.autocomplete
+        self.assertIsNone(await asyncio.create_task(check(self.tree, interaction)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import tempfile
+import time
+import unittest
+
+from utils.disk_cache import LAST_USED_RESOLUTION, DiskCache
+
+
+class DiskCacheTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = DiskCache(os.path.join(directory.name, 'cache.db'), max_bytes=2 ** 20, compress_threshold=16)
+        await self.cache.start()
+        self.addAsyncCleanup(self.cache.close)
+
+    async def last_used(self, url: str) -> float:
+        async with self.cache.connection.execute("SELECT last_used FROM responses WHERE url = ?", (url,)) as cursor:
+            return (await cursor.fetchone())[0]
+
+    async def test_compressed_bodies_are_read_back(self):
+        body = b'{"text": "' + b'a' * 1000 + b'"}'
+        await self.cache.put('https://example.com/a', 200, body, [['Content-Type', 'application/json']])
+        entry = await self.cache.get('https://example.com/a')
+        self.assertEqual(entry.body, body)
+        self.assertEqual(entry.headers, [['Content-Type', 'application/json']])
+
+    async def test_reads_are_not_written_until_the_next_write(self):
+        await self.cache.put('https://example.com/a', 200, b'a' * 100, [])
+        stale = time.time() - 2 * LAST_USED_RESOLUTION
+        await self.cache.connection.execute("UPDATE responses SET last_used = ?", (stale,))
+        await self.cache.connection.commit()
+
+        changes = self.cache.connection.total_changes
+        for _ in range(3):
+            self.assertIsNotNone(await self.cache.get('https://example.com/a'))
+        self.assertEqual(self.cache.connection.total_changes, changes)
+        self.assertEqual(await self.last_used('https://example.com/a'), stale)
+
+        await self.cache.put('https://example.com/b', 200, b'b' * 100, [])
+        self.assertGreater(await self.last_used('https://example.com/a'), stale)
+
+
+if __name__ == '__main__':
+    unittest.main()
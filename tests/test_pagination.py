@@ -0,0 +1,153 @@
+import unittest
+
+import discord
+
+from benchmarks.fakes import FakeInteraction
+from utils import pagination
+from utils.pagination import EXPIRED, LOAD_FAILED, NOT_OWNER, PageButton, PageSource
+
+
+class Document:
+    def __init__(self, pages: int):
+        self.pages = pages
+
+
+class FakeBot:
+    def add_dynamic_items(self, *items):
+        pass
+
+
+async def press(view: discord.ui.View, direction: str, interaction: FakeInteraction) -> PageButton:
+    """ Handles a press of one of the view's buttons as discord.py would, from its custom_id alone. """
+    custom_id = next(child.custom_id for child in view.children if child.custom_id.split(':')[2] == direction)
+    match = PageButton.__discord_ui_compiled_template__.fullmatch(custom_id)
+    button = await PageButton.from_custom_id(interaction, None, match)
+    if await button.interaction_check(interaction):
+        await button.callback(interaction)
+    return button
+
+
+class PageButtonTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.loads = []
+        self.load_error = None
+        pagination.content_cache.clear()
+        pagination.register(FakeBot(), PageSource('test', self.load, self.render, lambda document: document.pages))
+
+    def tearDown(self):
+        pagination.unregister('test')
+        pagination.content_cache.clear()
+
+    async def load(self, key: str) -> Document:
+        self.loads.append(key)
+        if self.load_error is not None:
+            raise self.load_error
+        return Document(int(key))
+
+    @staticmethod
+    def render(document: Document, page: int) -> discord.Embed:
+        if not 1 <= page <= document.pages:
+            raise IndexError('page out of range')
+        return discord.Embed(description=f'{page}/{document.pages}')
+
+    @staticmethod
+    def shown(interaction: FakeInteraction) -> str:
+        return interaction.messages[-1]['embed'].description
+
+    async def test_next_page(self):
+        interaction = FakeInteraction()
+        await press(pagination.paginate('test', '3', Document(3)), 'n', interaction)
+        self.assertEqual(self.shown(interaction), '2/3')
+        self.assertEqual(self.loads, [])
+
+    async def test_previous_on_the_first_page_wraps_to_the_last(self):
+        interaction = FakeInteraction()
+        await press(pagination.paginate('test', '3', Document(3)), 'p', interaction)
+        self.assertEqual(self.shown(interaction), '3/3')
+
+    async def test_next_on_the_last_page_wraps_to_the_first(self):
+        interaction = FakeInteraction()
+        await press(pagination.paginate('test', '3', Document(3), page=3), 'n', interaction)
+        self.assertEqual(self.shown(interaction), '1/3')
+
+    async def test_new_buttons_carry_the_new_page(self):
+        interaction = FakeInteraction()
+        await press(pagination.paginate('test', '3', Document(3)), 'n', interaction)
+        await press(interaction.messages[-1]['view'], 'n', interaction)
+        self.assertEqual(self.shown(interaction), '3/3')
+
+    async def test_evicted_content_is_loaded_again(self):
+        view = pagination.paginate('test', '4', Document(4))
+        pagination.content_cache.clear()
+        interaction = FakeInteraction()
+        await press(view, 'n', interaction)
+        self.assertEqual(self.loads, ['4'])
+        self.assertTrue(interaction.response.deferred)
+        self.assertEqual(self.shown(interaction), '2/4')
+
+    async def test_load_failure_is_reported(self):
+        view = pagination.paginate('test', '4', Document(4))
+        pagination.content_cache.clear()
+        self.load_error = RuntimeError('upstream is down')
+        interaction = FakeInteraction()
+        await press(view, 'n', interaction)
+        self.assertEqual(interaction.messages, [{'content': LOAD_FAILED, 'ephemeral': True}])
+
+    async def test_rebuilt_content_without_pages_is_reported_and_not_cached(self):
+        view = pagination.paginate('test', '0', Document(1))
+        pagination.content_cache.clear()
+        interaction = FakeInteraction()
+        await press(view, 'n', interaction)
+        self.assertEqual(interaction.messages, [{'content': LOAD_FAILED, 'ephemeral': True}])
+        self.assertEqual(pagination.content_cache.entries, {})
+
+    async def test_hashed_key_expires_with_its_content(self):
+        key = '9' * pagination.MAX_CUSTOM_ID
+        view = pagination.paginate('test', key, Document(2))
+        self.assertTrue(all(len(child.custom_id) <= pagination.MAX_CUSTOM_ID for child in view.children))
+
+        interaction = FakeInteraction()
+        await press(view, 'n', interaction)
+        self.assertEqual(self.shown(interaction), '2/2')
+
+        pagination.content_cache.clear()
+        interaction = FakeInteraction()
+        await press(view, 'n', interaction)
+        self.assertEqual(interaction.messages, [{'content': EXPIRED, 'ephemeral': True}])
+        self.assertEqual(self.loads, [])
+
+    async def test_unregistered_kind_expires_even_when_cached(self):
+        view = pagination.paginate('test', '3', Document(3))
+        pagination.unregister('test')
+        interaction = FakeInteraction()
+        await press(view, 'n', interaction)
+        self.assertEqual(interaction.messages, [{'content': EXPIRED, 'ephemeral': True}])
+
+    async def test_only_the_owner_can_turn_the_pages(self):
+        view = pagination.paginate('test', '3', Document(3), owner=42)
+        stranger = FakeInteraction(user_id=7)
+        await press(view, 'n', stranger)
+        self.assertEqual(stranger.messages, [{'content': NOT_OWNER, 'ephemeral': True}])
+
+        owner = FakeInteraction(user_id=42)
+        await press(view, 'n', owner)
+        self.assertEqual(self.shown(owner), '2/3')
+
+    async def test_cache_evicts_the_least_recently_used_once_over_its_bytes(self):
+        cache = pagination.ContentCache(max_entries=10, max_bytes=3 * pagination.document_size(Document('x' * 1000)))
+        for key in 'abc':
+            cache.put('test', key, Document('x' * 1000))
+        cache.get('test', 'a')
+        cache.put('test', 'd', Document('x' * 1000))
+        self.assertEqual(list(cache.entries), [('test', 'c'), ('test', 'a'), ('test', 'd')])
+        self.assertLessEqual(cache.total_bytes, cache.max_bytes)
+
+        self.assertFalse(cache.put('test', 'e', Document('x' * 10000)))
+        self.assertNotIn(('test', 'e'), cache.entries)
+
+    async def test_views_are_not_kept_by_discord_py(self):
+        self.assertTrue(pagination.paginate('test', '3', Document(3)).is_finished())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import random
+import textwrap
+import unittest
+
+from utils.pagination import Paginator, is_mark
+
+ARABIC_WORDS = 'قال أبو جعفر: يعني بذلك جل ثناؤه أن الله الذي له عبادة الخلق لا إله إلا هو الحي القيوم،'.split()
+ENGLISH_WORDS = 'Allah - there is no deity except Him, the Ever-Living, the Sustainer of existence.'.split()
+ODD_WORDS = ['x' * 50, 'ي' * 300, 'a\n\nb', '  ', 'q\tz', '\t', 'a\r\nb', 'well-known', '\x0b\x0c']
+LEADING = ['', ' ', '\t', '\n ', ' ' * 40, ' ' * 2040]
+WIDTHS = [(1024, True), (2000, False), (2034, True), (2040, False), (37, True), (37, False), (200, True)]
+
+
+class PaginatorTests(unittest.TestCase):
+    def assertMatchesTextwrap(self, text: str, widths: list = WIDTHS):
+        for width, break_long_words in widths:
+            with self.subTest(text=text[:60], width=width, break_long_words=break_long_words):
+                expected = textwrap.wrap(text, width, break_long_words=break_long_words, break_on_hyphens=False)
+                self.assertEqual(list(Paginator(text, width, break_long_words)), expected)
+
+    def test_matches_textwrap_on_random_text(self):
+        generator = random.Random(0)
+        words = ARABIC_WORDS + ENGLISH_WORDS + ODD_WORDS
+        for _ in range(500):
+            text = ' '.join(generator.choice(words) for _ in range(generator.randint(0, 300)))
+            self.assertMatchesTextwrap(generator.choice(LEADING) + text)
+
+    def test_matches_textwrap_on_edge_cases(self):
+        for text in ['', ' ', '\t\n', 'a', '  leading', 'trailing  ', '\tindented', ' ' * 3 + 'x' * 60 + ' end',
+                     'x' * 37, 'x' * 38, 'a ' * 19, 'line\r\nbreaks\rand\x0cfeeds']:
+            self.assertMatchesTextwrap(text)
+
+    def test_matches_textwrap_when_the_first_word_does_not_fit_after_leading_whitespace(self):
+        for text, width in [(' well-knownb  ', 11), ('\ta\tع\n ', 6), ('   abcdefghij xy', 5), ('  ab', 1),
+                            (' ' * 50 + 'x' * 45 + ' end', 37)]:
+            self.assertMatchesTextwrap(text, [(width, True), (width, False)])
+            self.assertNotIn('', Paginator(text, width))
+
+    def test_long_words_are_not_split_from_their_marks(self):
+        text = 'بِسْمِ' * 400
+        for width in range(2030, 2040):
+            pages = list(Paginator(text, width))
+            self.assertEqual(''.join(pages), text)
+            self.assertTrue(all(len(page) <= width and not is_mark(page[0]) for page in pages))
+
+    def test_pages_are_found_only_as_far_as_asked(self):
+        text = ' '.join(ENGLISH_WORDS) * 1000
+        pages = Paginator(text, 100)
+        self.assertEqual(pages[1], textwrap.wrap(text, 100, break_on_hyphens=False)[1])
+        self.assertEqual(len(pages.bounds), 2)
+
+    def test_indexing(self):
+        pages = Paginator('one two three four', 8)
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(pages[-1], 'four')
+        self.assertEqual(pages[1:], ['three', 'four'])
+        with self.assertRaises(IndexError):
+            pages[3]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import asyncio
+import time
+import unittest
+
+from utils import deadlines
+from utils.errors import DeadlineExceeded
+from utils.singleflight import SingleFlight
+
+
+class FixedDeadline:
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+
+async def call_with_deadline(flights: SingleFlight, deadline, factory):
+    deadlines.current_deadline.set(deadline)
+    return await flights.run('key', factory)
+
+
+class SingleFlightTests(unittest.IsolatedAsyncioTestCase):
+    async def test_callers_with_different_deadlines_each_get_their_own_outcome(self):
+        flights = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(deadlines.remaining())
+            await asyncio.sleep(0.3)
+            return 'result'
+
+        # The short deadline arrives first, so it starts the shared call.
+        short = asyncio.create_task(call_with_deadline(flights, FixedDeadline(0.1), fetch))
+        await asyncio.sleep(0)
+        long = asyncio.create_task(call_with_deadline(flights, FixedDeadline(5), fetch))
+
+        with self.assertRaises(DeadlineExceeded):
+            await short
+        self.assertEqual(await long, 'result')
+        self.assertEqual(len(calls), 1)
+
+    async def test_cancelling_one_caller_leaves_the_call_running_for_the_others(self):
+        flights = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(None)
+            await asyncio.sleep(0.05)
+            return 'result'
+
+        first = asyncio.create_task(call_with_deadline(flights, None, fetch))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(call_with_deadline(flights, None, fetch))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+        self.assertEqual(await second, 'result')
+        self.assertEqual(len(calls), 1)
+
+    async def test_call_is_bounded_by_the_latest_deadline(self):
+        flights = SingleFlight()
+        seen = []
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            seen.append(deadlines.remaining())
+            return 'result'
+
+        first = asyncio.create_task(call_with_deadline(flights, FixedDeadline(1), fetch))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(call_with_deadline(flights, FixedDeadline(10), fetch))
+
+        self.assertEqual(await asyncio.gather(first, second), ['result', 'result'])
+        self.assertGreater(seen[0], 5)
+
+    async def test_caller_joining_a_call_without_deadline_is_still_bounded(self):
+        flights = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.3)
+            return 'result'
+
+        background = asyncio.create_task(call_with_deadline(flights, None, fetch))
+        await asyncio.sleep(0)
+        command = asyncio.create_task(call_with_deadline(flights, FixedDeadline(0.1), fetch))
+
+        with self.assertRaises(DeadlineExceeded):
+            await command
+        self.assertEqual(await background, 'result')
+
+    async def test_call_does_not_see_the_first_callers_context(self):
+        flights = SingleFlight()
+
+        async def fetch():
+            return deadlines.current_deadline.get()
+
+        deadline = FixedDeadline(1)
+        shared = await call_with_deadline(flights, deadline, fetch)
+        self.assertIsInstance(shared, deadlines.SharedDeadline)
+        self.assertEqual(shared.deadlines, [deadline])
+
+    async def test_errors_of_the_call_reach_every_caller(self):
+        flights = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            raise asyncio.TimeoutError
+
+        callers = [asyncio.create_task(call_with_deadline(flights, FixedDeadline(5), fetch)) for _ in range(2)]
+        for caller in callers:
+            with self.assertRaises(asyncio.TimeoutError):
+                await caller
+
+
+if __name__ == '__main__':
+    unittest.main()
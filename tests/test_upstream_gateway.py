@@ -0,0 +1,77 @@
+import asyncio
+import time
+import unittest
+
+from utils import deadlines
+from utils.errors import DeadlineExceeded
+from utils.upstream_gateway import HostGate, HostLimits, Lane, UpstreamGateway
+
+
+def make_gate(max_concurrent: int = 1) -> HostGate:
+    return HostGate(HostLimits(max_concurrent=max_concurrent, background_max_concurrent=1, rate=0, burst=1))
+
+
+class HostGateTests(unittest.IsolatedAsyncioTestCase):
+    async def test_waiter_cancelled_as_a_slot_is_released_gives_up_its_place(self):
+        gate = make_gate()
+        await gate.acquire(Lane.INTERACTIVE)
+        waiter = asyncio.create_task(gate.acquire(Lane.INTERACTIVE))
+        await asyncio.sleep(0)
+
+        # The release finds the cancelled waiter at the front of the queue and drops it, before the waiter resumes.
+        waiter.cancel()
+        gate.release(Lane.INTERACTIVE)
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+
+        self.assertEqual(gate.active, [0, 0])
+        self.assertFalse(gate.queues[Lane.INTERACTIVE])
+        await asyncio.wait_for(gate.acquire(Lane.INTERACTIVE), 1)
+
+    async def test_waiter_cancelled_after_being_granted_a_slot_hands_it_on(self):
+        gate = make_gate()
+        await gate.acquire(Lane.INTERACTIVE)
+        granted = asyncio.create_task(gate.acquire(Lane.INTERACTIVE))
+        await asyncio.sleep(0)
+        next_waiter = asyncio.create_task(gate.acquire(Lane.INTERACTIVE))
+        await asyncio.sleep(0)
+
+        # The slot goes to the first waiter, which is cancelled before it can take it.
+        gate.release(Lane.INTERACTIVE)
+        granted.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await granted
+
+        await asyncio.wait_for(next_waiter, 1)
+        self.assertEqual(gate.active, [1, 0])
+
+
+class FixedDeadline:
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+
+class UpstreamGatewayTests(unittest.IsolatedAsyncioTestCase):
+    async def test_wait_for_a_slot_is_bounded_by_the_deadline(self):
+        gateway = UpstreamGateway()
+        gate = gateway.gates['example.com'] = make_gate()
+        await gate.acquire(Lane.INTERACTIVE)
+
+        async def request():
+            deadlines.current_deadline.set(FixedDeadline(deadlines.min_attempt + 0.1))
+            async with gateway.slot('example.com'):
+                pass
+
+        start = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            await asyncio.wait_for(asyncio.create_task(request()), 5)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(gate.active, [1, 0])
+        self.assertFalse(gate.queues[Lane.INTERACTIVE])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import configparser
+import time
+from dataclasses import dataclass
+from enum import Enum
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+
+class BreakerState(Enum):
+    CLOSED = 'closed'        # Requests flow normally
+    OPEN = 'open'            # The host is failing; requests are refused without being sent
+    HALF_OPEN = 'half_open'  # A few probe requests are let through to see whether the host has recovered
+
+
+@dataclass
+class CircuitBreaker:
+    """
+    Tracks the health of one upstream host.
+
+    The breaker opens after `failure_threshold` consecutive failures, where a response slower than
+    `slow_threshold` seconds also counts as a failure. After `reset_timeout` seconds it half-opens and lets
+    up to `half_open_probes` requests through: a successful probe closes it again, a failed one reopens it.
+    """
+
+    host: str
+    failure_threshold: int
+    slow_threshold: float
+    reset_timeout: float
+    half_open_probes: int = 1
+
+    state: BreakerState = BreakerState.CLOSED
+    consecutive_failures: int = 0
+    opened_at: float = 0
+    probes_in_flight: int = 0
+
+    times_opened: int = 0
+    rejected: int = 0
+    failures: int = 0
+    slow_calls: int = 0
+
+    @classmethod
+    def from_config(cls, host: str) -> 'CircuitBreaker':
+        # A [Circuit Breaker <host>] section overrides the defaults in [Circuit Breaker].
+        section = f'Circuit Breaker {host}' if config.has_section(f'Circuit Breaker {host}') else 'Circuit Breaker'
+
+        def get(option, fallback):
+            return config.get(section, option, fallback=config.get('Circuit Breaker', option, fallback=fallback))
+
+        return cls(
+            host=host,
+            failure_threshold=int(get('failure_threshold', 5)),
+            slow_threshold=float(get('slow_threshold', 8)),
+            reset_timeout=float(get('reset_timeout', 30)),
+            half_open_probes=int(get('half_open_probes', 1)),
+        )
+
+    def allow(self) -> bool:
+        """ Returns whether a request may be sent now. Every allowed request must be followed by a `record_` call. """
+        if self.state == BreakerState.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = BreakerState.HALF_OPEN
+            self.probes_in_flight = 0
+
+        if self.state == BreakerState.CLOSED:
+            return True
+        if self.state == BreakerState.HALF_OPEN and self.probes_in_flight < self.half_open_probes:
+            self.probes_in_flight += 1
+            return True
+
+        self.rejected += 1
+        return False
+
+    def record_success(self, seconds: float):
+        if seconds >= self.slow_threshold:
+            self.slow_calls += 1
+            return self.record_failure()
+
+        self.consecutive_failures = 0
+        if self.state == BreakerState.HALF_OPEN:
+            self.state = BreakerState.CLOSED
+            self.probes_in_flight = 0
+
+    def record_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.state == BreakerState.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def record_cancelled(self):
+        """ Frees the probe slot of a request that was cancelled before it completed. """
+        if self.state == BreakerState.HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+
+    def _open(self):
+        if self.state != BreakerState.OPEN:
+            self.times_opened += 1
+            print(f'Circuit breaker for {self.host} opened after {self.consecutive_failures} consecutive failures')
+        self.state = BreakerState.OPEN
+        self.opened_at = time.monotonic()
+        self.probes_in_flight = 0
+
+    def get_stats(self) -> dict:
+        return {
+            'state': self.state.value,
+            'consecutive_failures': self.consecutive_failures,
+            'times_opened': self.times_opened,
+            'rejected': self.rejected,
+            'failures': self.failures,
+            'slow_calls': self.slow_calls,
+        }
+
+
+class CircuitBreakers:
+    """ One CircuitBreaker per upstream host, created on first use. """
+
+    def __init__(self):
+        self.breakers = {}
+
+    def get(self, host: str) -> CircuitBreaker:
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker.from_config(host)
+        return breaker
+
+    def get_stats(self) -> dict:
+        return {host: breaker.get_stats() for host, breaker in self.breakers.items()}
@@ -1,82 +1,246 @@
 import asyncio
 import configparser
+import time
 
-import aiomysql
+from utils import tracing
+from utils.metrics import DB_LATENCY
+from utils.settings_cache import ABSENT, settings_cache
+from utils.settings_writer import settings_writer
+from utils.storage_backends import StorageBackend, create_backend
 
 config = configparser.ConfigParser()
 config.read('config.ini')
 
-host = config['MySQL']['host']
-user = config['MySQL']['user']
-password = config['MySQL']['password']
-database = config['MySQL']['database']
-
-loop = asyncio.get_event_loop()
+query_timeout = config.getfloat('MySQL', 'query_timeout', fallback=3)
+# After a failed read, skip the database for this long instead of waiting on it again for every command.
+retry_after = config.getfloat('MySQL', 'retry_after', fallback=30)
 
 
 class DBHandler:
-    def __init__(self, table_name: str, column1: str, column2: str, default_value, key):
+    backend: StorageBackend = None
+    # Settings tables known to exist, so that the health check only retries the others.
+    ensured_tables: set = set()
+
+    def __init__(self, table_name: str, column1: str, column2: str, default_value, key, columns: dict = None):
         self.table_name = table_name
         self.column1 = column1  # e.g in the prayer times table, user is column1
         self.column2 = column2  # and calculation_method is column2
         self.default_value = default_value  # would be 4 in the prayer times table
         self.key = key
+        # Every value column in the table, mapped to its default. Rows are read and cached whole, so tables
+        # holding several settings per key (like the guild settings table) only cost one query per key.
+        self.columns = columns if columns is not None else {column2: default_value}
 
     @classmethod
-    async def create_connection(cls):
-        connection = await aiomysql.connect(host=host, user=user, password=password, db=database,
-                                            loop=loop, autocommit=True)
-        return connection
+    async def open_backend(cls, backend: StorageBackend = None):
+        """ Opens the storage backend selected in config.ini. Called from the bot's setup hook. """
+        cls.backend = backend or create_backend()
+        cls.ensured_tables = set()
+        # Tables that cannot be created now, e.g. because the database is down, are created once it is back.
+        cls.backend.on_healthy = cls.ensure_tables
+        await cls.backend.start()
+        await cls.ensure_tables()
 
-    async def _get_data(self):
-        try:
-            connection = await self.create_connection()
-        except:
-            return self.default_value
+    @classmethod
+    async def ensure_tables(cls):
+        """ Creates the settings tables that have not been created yet. """
+        for handler in settings_tables():
+            if handler.table_name in cls.ensured_tables:
+                continue
+            try:
+                await handler.ensure_table()
+                cls.ensured_tables.add(handler.table_name)
+            except Exception as e:
+                print(f'Could not create {handler.table_name}: {e}')
+
+    async def ensure_table(self):
+        await self.backend.ensure_table(self.table_name, self.column1, self.columns)
 
-        try:
-            async with connection.cursor() as cursor:
-                await cursor.execute(f"SELECT {self.column2} "
-                                     f"FROM {self.table_name} "
-                                     f"WHERE {self.column1} = {self.key}")
-                result = await cursor.fetchone()
-                connection.close()
+    @classmethod
+    async def close_backend(cls):
+        if cls.backend is not None:
+            await cls.backend.close()
+            cls.backend = None
 
-                if result is None:
-                    return self.default_value
+    @classmethod
+    def get_backend_stats(cls) -> dict:
+        return cls.backend.get_stats() if cls.backend else {}
 
-                return result[0]
-        except:
-            connection.close()
-            return self.default_value
+    async def _get_data(self):
+        row = await self._get_row()
+        return self._value_or_default(row, self.column2)
+
+    async def _get_many(self, columns=None) -> dict:
+        """ Returns several settings for this key at once, falling back to each column's default. """
+        row = await self._get_row()
+        return {column: self._value_or_default(row, column) for column in (columns or self.columns)}
+
+    async def _get_row(self):
+        with tracing.span('settings.get', table=self.table_name):
+            if settings_cache.is_preloaded(self.table_name):
+                settings_cache.hits += 1
+                return settings_cache.get_preloaded(self.table_name, self.key)
+
+            row = await self._read_row()
+            return settings_writer.overlay(self.table_name, self.key, row, self.columns)
+
+    async def _read_row(self):
+        entry = settings_cache.get(self.table_name, self.key)
+        if entry is not None and settings_cache.is_fresh(entry):
+            settings_cache.hits += 1
+            return entry.value
+
+        settings_cache.misses += 1
+        if self.backend is None or not self.backend.is_available():
+            return self._stale_row(entry)
+
+        generation = settings_cache.generation
+        try:
+            result = await asyncio.wait_for(self._select(), timeout=query_timeout)
+        except Exception as e:
+            if self.backend.is_connection_error(e):
+                self.backend.mark_unavailable(retry_after)
+            else:
+                print(f'Could not read from {self.table_name}: {type(e).__name__}: {e}')
+            return self._stale_row(entry)
+
+        row = ABSENT if result is None else dict(zip(self.columns, result))
+        settings_cache.put(self.table_name, self.key, row, generation=generation)
+        return row
+
+    async def _select(self):
+        with tracing.span('db.fetch_row'), DB_LATENCY.time(operation='fetch_row'):
+            return await self.backend.fetch_row(self.table_name, self.column1, self.key, self.columns)
+
+    def _value_or_default(self, row, column):
+        if row is ABSENT or row.get(column) is None:
+            return self.columns[column]
+        return row[column]
+
+    def _stale_row(self, entry):
+        if entry is not None and settings_cache.is_servable_when_stale(entry):
+            settings_cache.stale_hits += 1
+            return entry.value
+        return ABSENT
 
     async def _update_data(self, value):
-        connection = await self.create_connection()
-        async with connection.cursor() as cursor:
-            create_sql = f"INSERT INTO {self.table_name} ({self.column1}, {self.column2}) " \
-                         "VALUES (%s, %s) " \
-                         f"ON DUPLICATE KEY UPDATE {self.column1}=%s, {self.column2}=%s"
-            await cursor.execute(create_sql, (self.key, value, self.key, value))
-            connection.close()
-
-    async def _delete_data(self):
-        connection = await self.create_connection()
-        async with connection.cursor() as cursor:
-            delete_sql = f"DELETE FROM {self.table_name} WHERE {self.column1}=%s"
-            await cursor.execute(delete_sql, self.key)
-            connection.close()
+        return await self._update_many({self.column2: value})
 
+    async def _update_many(self, values: dict):
+        """ Sets several settings for this key in a single upsert. """
+        if settings_writer.running:
+            settings_writer.enqueue_update(self.table_name, self.column1, self.key, self.columns, values)
+        else:
+            with DB_LATENCY.time(operation='upsert'):
+                await self.backend.upsert_rows(self.table_name, self.column1, list(values), [(self.key, *values.values())])
+        settings_cache.apply_update(self.table_name, self.key, values, self.columns)
 
-class ServerTranslation(DBHandler):
-    def __init__(self, guild_id: int):
+    async def _delete_data(self):
+        # Only clear this setting if the row holds others.
+        if len(self.columns) > 1:
+            return await self._update_many({self.column2: None})
+        return await self._delete_row()
+
+    async def _delete_row(self):
+        if settings_writer.running:
+            settings_writer.enqueue_delete(self.table_name, self.column1, self.key, self.columns)
+        else:
+            with DB_LATENCY.time(operation='delete'):
+                await self.backend.delete_rows(self.table_name, self.column1, [self.key])
+        settings_cache.apply_delete(self.table_name, self.key)
+
+    async def _preload(self, chunk_size: int):
+        """ Streams every row of this handler's table into the settings cache, a chunk at a time. """
+        start = time.perf_counter()
+        rows = {}
+        async for chunk in self.backend.iterate_rows(self.table_name, self.column1, self.columns, chunk_size):
+            for key, *values in chunk:
+                # Keys are Discord snowflakes; normalise them in case the column is stored as text.
+                rows[int(key)] = dict(zip(self.columns, values))
+
+        settings_cache.load_table(self.table_name, rows, time.perf_counter() - start)
+        stats = settings_cache.preload_stats[self.table_name]
+        print(f"Preloaded {stats['rows']} rows from {self.table_name} in {stats['seconds']:.2f}s "
+              f"(~{stats['bytes'] / 1024:.0f} KiB)")
+
+
+GUILD_SETTINGS_TABLE = config.get('MySQL', 'guild_settings_table_name', fallback='') or 'guild_settings'
+
+# Every per-guild setting and its default. To add a new one, add a nullable column to the guild settings table.
+GUILD_SETTINGS = {
+    'translation': 'haleem',
+    'tafsir': 'maarifulquran',
+    'atafsir': 'tabari',
+}
+
+# The tables that held guild settings before they were consolidated, with the setting each one stored.
+LEGACY_GUILD_SETTINGS_TABLES = {
+    'translation': config.get('MySQL', 'server_translations_table_name', fallback=''),
+    'tafsir': config.get('MySQL', 'server_tafsir_table_name', fallback=''),
+    'atafsir': config.get('MySQL', 'server_atafsir_table_name', fallback=''),
+}
+
+
+class GuildSettings(DBHandler):
+    def __init__(self, guild_id: int, setting: str = None):
         super().__init__(
-            table_name=config['MySQL']['server_translations_table_name'],
+            table_name=GUILD_SETTINGS_TABLE,
             column1='server',
-            column2='translation',
-            default_value='haleem',
-            key=guild_id
+            column2=setting,
+            default_value=GUILD_SETTINGS.get(setting),
+            key=guild_id,
+            columns=GUILD_SETTINGS,
         )
 
+    async def ensure_table(self):
+        # Deployments upgrading from the per-setting tables get their settings copied over when the table is first
+        # created, without having to turn on migrate_legacy_guild_settings.
+        created = not await self.backend.table_exists(self.table_name)
+        await super().ensure_table()
+        if created and await self.legacy_tables():
+            await self.migrate_legacy_tables()
+
+    async def get_all(self, *settings) -> dict:
+        return await self._get_many(settings)
+
+    async def update_all(self, **settings):
+        return await self._update_many(settings)
+
+    async def delete_all(self):
+        return await self._delete_row()
+
+    @classmethod
+    async def legacy_tables(cls) -> dict:
+        """ The old per-setting tables that are configured and exist, keyed by the setting each one stored. """
+        if cls.backend.name != 'mysql':
+            return {}
+        return {setting: table for setting, table in LEGACY_GUILD_SETTINGS_TABLES.items()
+                if table and await cls.backend.table_exists(table)}
+
+    @classmethod
+    async def migrate_legacy_tables(cls):
+        """
+        Creates the guild settings table if needed and copies in every row from the old per-setting tables.
+        Values already present in the guild settings table are kept, so this is safe to run more than once.
+        """
+        if cls.backend.name != 'mysql':
+            return print('The legacy guild settings tables only exist in MySQL; nothing to migrate.')
+
+        await cls.backend.ensure_table(GUILD_SETTINGS_TABLE, 'server', GUILD_SETTINGS)
+        legacy_tables = await cls.legacy_tables()
+        async with cls.backend.acquire() as connection:
+            async with connection.cursor() as cursor:
+                for setting, legacy_table in legacy_tables.items():
+                    await cursor.execute(f"INSERT INTO {GUILD_SETTINGS_TABLE} (server, {setting}) "
+                                         f"SELECT server, {setting} FROM {legacy_table} "
+                                         f"ON DUPLICATE KEY UPDATE {setting}=COALESCE({GUILD_SETTINGS_TABLE}.{setting}, VALUES({setting}))")
+                    print(f'Migrated {cursor.rowcount} rows from {legacy_table} into {GUILD_SETTINGS_TABLE}')
+
+
+class ServerTranslation(GuildSettings):
+    def __init__(self, guild_id: int):
+        super().__init__(guild_id, setting='translation')
+
     async def get(self) -> str:
         return await self._get_data()
 
@@ -87,15 +251,9 @@ class ServerTranslation(DBHandler):
         return await self._delete_data()
 
 
-class ServerTafsir(DBHandler):
+class ServerTafsir(GuildSettings):
     def __init__(self, guild_id: int):
-        super().__init__(
-            table_name=config['MySQL']['server_tafsir_table_name'],
-            column1='server',
-            column2='tafsir',
-            default_value='maarifulquran',
-            key=guild_id,
-        )
+        super().__init__(guild_id, setting='tafsir')
 
     async def get(self) -> str:
         return await self._get_data()
@@ -107,15 +265,9 @@ class ServerTafsir(DBHandler):
         return await self._delete_data()
 
 
-class ServerArabicTafsir(DBHandler):
+class ServerArabicTafsir(GuildSettings):
     def __init__(self, guild_id: int):
-        super().__init__(
-            table_name=config['MySQL']['server_atafsir_table_name'],
-            column1='server',
-            column2='atafsir',
-            default_value='tabari',
-            key=guild_id,
-        )
+        super().__init__(guild_id, setting='atafsir')
 
     async def get(self) -> str:
         return await self._get_data()
@@ -130,7 +282,7 @@ class ServerArabicTafsir(DBHandler):
 class UserPrayerCalculationMethod(DBHandler):
     def __init__(self, user_id):
         super().__init__(
-            table_name=config['MySQL']['user_prayer_times_table_name'],
+            table_name=config.get('MySQL', 'user_prayer_times_table_name', fallback='') or 'user_prayer_times',
             column1='user_id',
             column2='calculation_method_id',
             default_value=4,
@@ -145,3 +297,18 @@ class UserPrayerCalculationMethod(DBHandler):
 
     async def delete(self):
         return await self._delete_data()
+
+
+def settings_tables() -> list:
+    """ One handler per settings table, for work that covers whole tables rather than a single key. """
+    return [GuildSettings(None), UserPrayerCalculationMethod(None)]
+
+
+async def preload_settings(chunk_size: int = 5000):
+    """ Loads every settings table into memory, after which reads for them never reach the database. """
+    for handler in settings_tables():
+        try:
+            await handler._preload(chunk_size)
+        except Exception as e:
+            # Reads for this table keep going through the database and the TTL cache.
+            print(f'Could not preload {handler.table_name}: {e}')
@@ -0,0 +1,107 @@
+import configparser
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import timedelta
+
+import discord
+
+from utils import interaction_recorder, tracing
+from utils.errors import DeadlineExceeded
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+# Discord's limits: the first response (or a defer) within 3 seconds, and follow-ups while the token is valid.
+INITIAL_RESPONSE_WINDOW = 3
+INTERACTION_TOKEN_LIFETIME = 15 * 60
+
+# How long a deferred command may take before we give up on it. Users stop waiting long before the token expires.
+response_budget = min(config.getfloat('Deadlines', 'response_budget', fallback=60), INTERACTION_TOKEN_LIFETIME)
+# The least time worth starting an upstream attempt with.
+min_attempt = config.getfloat('Deadlines', 'min_attempt', fallback=0.5)
+# Interactions that reach us with less than this left to respond are dropped without running the command.
+shed_below = config.getfloat('Deadlines', 'shed_below', fallback=0.5)
+
+current_deadline = ContextVar('current_deadline', default=None)
+
+
+@dataclass
+class Deadline:
+    """
+    The time left to answer an interaction. Until the interaction has been responded to or deferred this is
+    what remains of Discord's 3 second window; after that it is `response_budget` from when it was created.
+    """
+
+    interaction: discord.Interaction
+
+    def remaining(self) -> float:
+        budget = response_budget if self.interaction.response.is_done() else INITIAL_RESPONSE_WINDOW
+        expires_at = self.interaction.created_at + timedelta(seconds=budget)
+        return (expires_at - discord.utils.utcnow()).total_seconds()
+
+
+@dataclass
+class SharedDeadline:
+    """
+    The deadline of work shared by several callers: the latest of theirs, so that it is not given up on while any of
+    them is still waiting. A caller without a deadline (e.g. a task loop) lifts it altogether.
+    """
+
+    deadlines: list
+
+    def remaining(self) -> float:
+        return max(float('inf') if deadline is None else deadline.remaining() for deadline in self.deadlines)
+
+
+@dataclass
+class DeadlineStats:
+    shed: int = 0
+    exceeded: int = 0
+
+
+stats = DeadlineStats()
+
+
+def remaining() -> float:
+    """ Seconds left to answer the interaction being handled, or infinity outside of one (e.g. in a task loop). """
+    deadline = current_deadline.get()
+    return float('inf') if deadline is None else deadline.remaining()
+
+
+def can_attempt(extra: float = 0) -> bool:
+    """ Whether there is time for an upstream attempt after waiting `extra` seconds. """
+    return remaining() - extra >= min_attempt
+
+
+def exceeded() -> DeadlineExceeded:
+    """ Records that a request ran out of time, and returns the error to raise for it. """
+    stats.exceeded += 1
+    return DeadlineExceeded()
+
+
+def check():
+    """ Raises DeadlineExceeded if there is no longer time for another upstream attempt. """
+    if not can_attempt():
+        raise exceeded()
+
+
+class DeadlineCommandTree(discord.app_commands.CommandTree):
+    """
+    Records every interaction, attaches a deadline and a trace to it, and sheds those that can no longer be answered
+    in time.
+    """
+
+    async def interaction_check(self, interaction: discord.Interaction, /) -> bool:
+        # Recorded before shedding, so a replayed trace carries the full load that arrived.
+        interaction_recorder.record(interaction)
+        deadline = Deadline(interaction)
+        if deadline.remaining() < shed_below:
+            stats.shed += 1
+            return False
+
+        # Commands run in the same task as this check, so they see the deadline and trace through context variables.
+        current_deadline.set(deadline)
+        # Autocomplete is answered without completing a command, so nothing would ever finish its trace.
+        if interaction.type != discord.InteractionType.autocomplete:
+            tracing.start_trace(interaction)
+        return True
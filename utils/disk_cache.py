@@ -0,0 +1,216 @@
+import asyncio
+import configparser
+import hashlib
+import json
+import time
+import zlib
+from dataclasses import dataclass
+
+import aiosqlite
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+# How stale an entry's last use may be before a read records it again. Eviction does not need more precision.
+LAST_USED_RESOLUTION = 60
+# Reads recorded since the last write are written once this many pile up, even if nothing else is written.
+MAX_PENDING_LAST_USED = 1000
+
+
+@dataclass
+class DiskEntry:
+    status: int
+    body: bytes
+    headers: list
+    stored_at: float  # Wall-clock time, since entries outlive the process
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+
+@dataclass
+class DiskCacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+    errors: int = 0
+
+
+class DiskCache:
+    """
+    A persistent second tier behind the in-memory response cache, so a restart does not start cold.
+
+    Responses are kept in a local SQLite file. Bodies are stored once per SHA-256 digest, so identical payloads
+    fetched from different URLs share storage, and bodies over `compress_threshold` bytes are zlib-compressed.
+    Once the stored bodies exceed `max_bytes`, the least recently used URLs are evicted.
+
+    Reads are not written back one by one: when an entry was last used, to the nearest minute, is noted in memory and
+    written with the next write. Compression runs on a worker thread, so large bodies do not block the event loop.
+    """
+
+    def __init__(self, path: str, max_bytes: int, compress_threshold: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.compress_threshold = compress_threshold
+        self.connection = None
+        self.total_bytes = 0
+        self.stats = DiskCacheStats()
+        self._last_used = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.connection is not None
+
+    async def start(self):
+        try:
+            self.connection = await aiosqlite.connect(self.path)
+            await self.connection.execute("PRAGMA journal_mode=WAL")
+            await self.connection.execute("PRAGMA synchronous=NORMAL")
+            await self.connection.execute("CREATE TABLE IF NOT EXISTS blobs "
+                                          "(digest TEXT PRIMARY KEY, body BLOB NOT NULL, compressed INTEGER NOT NULL)")
+            await self.connection.execute("CREATE TABLE IF NOT EXISTS responses "
+                                          "(url TEXT PRIMARY KEY, digest TEXT NOT NULL, status INTEGER NOT NULL, "
+                                          "headers TEXT NOT NULL, stored_at REAL NOT NULL, last_used REAL NOT NULL)")
+            await self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            await self.connection.commit()
+            self.total_bytes = await self._stored_bytes()
+        except Exception as e:
+            print(f'Could not open the disk cache at {self.path}: {e}')
+            self.connection = None
+
+    async def close(self):
+        if self.connection is not None:
+            try:
+                async with self._lock:
+                    await self._write_last_used()
+                    await self.connection.commit()
+            except Exception as e:
+                print(f'Failed to record the last use of disk cache entries: {e}')
+            await self.connection.close()
+            self.connection = None
+
+    async def get(self, url: str) -> DiskEntry:
+        if self.connection is None:
+            return None
+
+        try:
+            async with self._lock:
+                async with self.connection.execute("SELECT r.status, r.headers, r.stored_at, r.last_used, b.body, "
+                                                   "b.compressed FROM responses r JOIN blobs b ON b.digest = r.digest "
+                                                   "WHERE r.url = ?", (url,)) as cursor:
+                    row = await cursor.fetchone()
+                if row is None:
+                    self.stats.misses += 1
+                    return None
+
+                status, headers, stored_at, last_used, body, compressed = row
+                now = time.time()
+                if now - last_used >= LAST_USED_RESOLUTION:
+                    self._last_used[url] = now
+                if len(self._last_used) >= MAX_PENDING_LAST_USED:
+                    await self._write_last_used()
+                    await self.connection.commit()
+        except Exception as e:
+            self.stats.errors += 1
+            print(f'Failed to read {url} from the disk cache: {e}')
+            return None
+
+        self.stats.hits += 1
+        if compressed:
+            body = await asyncio.to_thread(zlib.decompress, body)
+        return DiskEntry(status=status, body=body, headers=json.loads(headers), stored_at=stored_at)
+
+    async def put(self, url: str, status: int, body: bytes, headers: list):
+        """ Stores a response. How long it stays fresh is decided by the response cache when it is loaded again. """
+        if self.connection is None:
+            return
+
+        digest = hashlib.sha256(body).hexdigest()
+        compressed = len(body) > self.compress_threshold
+        stored_body = await asyncio.to_thread(zlib.compress, body) if compressed else body
+        now = time.time()
+
+        try:
+            async with self._lock:
+                cursor = await self.connection.execute("INSERT OR IGNORE INTO blobs (digest, body, compressed) VALUES (?, ?, ?)",
+                                                       (digest, stored_body, int(compressed)))
+                if cursor.rowcount:
+                    self.total_bytes += len(stored_body)
+                await self.connection.execute("INSERT OR REPLACE INTO responses "
+                                              "(url, digest, status, headers, stored_at, last_used) "
+                                              "VALUES (?, ?, ?, ?, ?, ?)",
+                                              (url, digest, status, json.dumps(headers), now, now))
+                self._last_used.pop(url, None)
+                await self._write_last_used()
+                await self.connection.commit()
+                self.stats.writes += 1
+                if self.total_bytes > self.max_bytes:
+                    await self._evict()
+        except Exception as e:
+            self.stats.errors += 1
+            print(f'Failed to write {url} to the disk cache: {e}')
+
+    async def refresh(self, url: str):
+        """ Resets the age of an entry after the upstream confirmed it is unchanged. """
+        if self.connection is None:
+            return
+
+        try:
+            async with self._lock:
+                await self.connection.execute("UPDATE responses SET stored_at = ?, last_used = ? WHERE url = ?",
+                                              (time.time(), time.time(), url))
+                self._last_used.pop(url, None)
+                await self._write_last_used()
+                await self.connection.commit()
+        except Exception as e:
+            self.stats.errors += 1
+            print(f'Failed to refresh {url} in the disk cache: {e}')
+
+    async def _write_last_used(self):
+        """ Writes the last use of the entries read since the last write. The caller commits. """
+        if not self._last_used:
+            return
+        pending = [(last_used, url) for url, last_used in self._last_used.items()]
+        self._last_used.clear()
+        await self.connection.executemany("UPDATE responses SET last_used = ? WHERE url = ?", pending)
+
+    async def _evict(self):
+        # Evict a little below the budget, so that the next few writes do not each trigger another pass.
+        target = self.max_bytes * 0.9
+        victims = []
+        freed = 0
+        async with self.connection.execute("SELECT r.url, LENGTH(b.body) FROM responses r "
+                                           "JOIN blobs b ON b.digest = r.digest ORDER BY r.last_used") as cursor:
+            async for url, size in cursor:
+                if self.total_bytes - freed <= target:
+                    break
+                victims.append((url,))
+                freed += size
+
+        await self.connection.executemany("DELETE FROM responses WHERE url = ?", victims)
+        await self.connection.execute("DELETE FROM blobs WHERE digest NOT IN (SELECT digest FROM responses)")
+        await self.connection.commit()
+        self.stats.evictions += len(victims)
+        self.total_bytes = await self._stored_bytes()
+
+    async def _stored_bytes(self) -> int:
+        async with self.connection.execute("SELECT COALESCE(SUM(LENGTH(body)), 0) FROM blobs") as cursor:
+            return (await cursor.fetchone())[0]
+
+    def get_stats(self) -> dict:
+        return {
+            'open': self.is_open,
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            **vars(self.stats),
+        }
+
+
+disk_cache = DiskCache(
+    path=config.get('Disk Cache', 'path', fallback='response_cache.db'),
+    max_bytes=config.getint('Disk Cache', 'max_bytes', fallback=256 * 1024 * 1024),
+    compress_threshold=config.getint('Disk Cache', 'compress_threshold', fallback=1024),
+)
@@ -14,6 +14,8 @@ class ErrorMessage(Enum):
     INVALID_ARABIC_TAFSIR = ":warning: **Invalid tafsir!** List of tafasir: <https://github.com/galacticwarrior9/IslamBot/wiki/Tafsir-List#arabic-tafsir>"
     DATABASE_UNREACHABLE = "Could not contact database. Please report this on the support server!"
     ADMINISTRATOR_REQUIRED = "🔒 You need the **Administrator** permission to use this command."
+    DEADLINE_EXCEEDED = ":hourglass: **This took too long to answer.** Please try again."
+    UPSTREAM_UNAVAILABLE = ":warning: **{0}** is not responding at the moment. Please try again in a few minutes."
 
 
 async def respond_to_interaction_error(interaction: discord.Interaction, error: discord.app_commands.AppCommandError):
@@ -29,6 +31,10 @@ async def respond_to_interaction_error(interaction: discord.Interaction, error:
         await reply_to_interaction(interaction, ErrorMessage.INVALID_TAFSIR.value)
     elif isinstance(error, InvalidArabicTafsir):
         await reply_to_interaction(interaction, ErrorMessage.INVALID_ARABIC_TAFSIR.value)
+    elif isinstance(error, DeadlineExceeded):
+        await reply_to_interaction(interaction, ErrorMessage.DEADLINE_EXCEEDED.value)
+    elif isinstance(error, UpstreamUnavailable):
+        await reply_to_interaction(interaction, ErrorMessage.UPSTREAM_UNAVAILABLE.value.format(error.host))
     elif isinstance(error, MissingPermissions):
         await reply_to_interaction(interaction, ErrorMessage.ADMINISTRATOR_REQUIRED.value)
     elif isinstance(error, pymysql.err.OperationalError):
@@ -75,4 +81,15 @@ class InvalidArabicTafsir(discord.app_commands.AppCommandError):
 
 class InvalidTafsir(discord.app_commands.AppCommandError):
     def __init__(self, *args, **kwargs):
-        super().__init__(*args)
\ No newline at end of file
+        super().__init__(*args)
+
+
+class UpstreamUnavailable(discord.app_commands.AppCommandError):
+    def __init__(self, host, *args, **kwargs):
+        self.host = host
+        super().__init__(*args)
+
+
+class DeadlineExceeded(discord.app_commands.AppCommandError):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args)
@@ -0,0 +1,327 @@
+import asyncio
+import configparser
+import json
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+import aiohttp
+from multidict import CIMultiDict
+from yarl import URL
+
+from utils.circuit_breaker import CircuitBreaker, CircuitBreakers
+from utils.disk_cache import disk_cache
+from utils import deadlines, tracing
+from utils.errors import DeadlineExceeded, UpstreamUnavailable
+from utils.metrics import UPSTREAM_LATENCY
+from utils.response_cache import response_cache
+from utils.singleflight import SingleFlight
+from utils.upstream_gateway import Lane, UpstreamGateway
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+USER_AGENT = 'IslamBot (https://github.com/galacticwarrior9/IslamBot)'
+
+
+@dataclass
+class UpstreamResponse:
+    url: str
+    status: int
+    body: bytes
+    headers: CIMultiDict
+
+    def json(self):
+        return json.loads(self.body)
+
+    def text(self) -> str:
+        return self.body.decode('utf-8', 'ignore')
+
+
+@dataclass
+class HostStats:
+    requests: int = 0
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    connections_created: int = 0
+    connections_reused: int = 0
+    errors: int = 0
+
+
+class UpstreamClient:
+    """
+    Owns the single aiohttp session used for every upstream request the bot makes.
+
+    One TCPConnector holds a keep-alive pool per host, so repeated requests to the same API reuse
+    an open TLS connection instead of paying for a new handshake every time.
+    """
+
+    def __init__(self):
+        self.session = None
+        self.host_stats = defaultdict(HostStats)
+        self.flights = SingleFlight()
+        self.gateway = UpstreamGateway()
+        self.breakers = CircuitBreakers()
+
+        self.connection_limit = config.getint('HTTP', 'connection_limit', fallback=100)
+        self.connection_limit_per_host = config.getint('HTTP', 'connection_limit_per_host', fallback=20)
+        self.keepalive_timeout = config.getfloat('HTTP', 'keepalive_timeout', fallback=60)
+        self.dns_cache_ttl = config.getint('HTTP', 'dns_cache_ttl', fallback=300)
+        self.use_disk_cache = config.getboolean('Disk Cache', 'enabled', fallback=True)
+        self.default_timeout = config.getfloat('HTTP', 'timeout', fallback=15)
+        self.retries = config.getint('HTTP', 'retries', fallback=2)
+        self.retry_backoff = config.getfloat('HTTP', 'retry_backoff', fallback=0.25)
+
+        # Per-host overrides, e.g. "altafsir.com = 10" in the [HTTP Timeouts] section.
+        self.timeouts = {}
+        if config.has_section('HTTP Timeouts'):
+            self.timeouts = {host: float(seconds) for host, seconds in config['HTTP Timeouts'].items()}
+
+        self.default_headers = {
+            'api.sunnah.com': {'X-API-Key': config['APIs']['sunnah.com']},
+        }
+
+        # Used by the benchmarks: a function mapping each URL to the one actually requested (e.g. a local stand-in
+        # for the upstream), and functions called with every response received over the network.
+        self.url_rewriter = None
+        self.response_hooks = []
+
+    async def start(self):
+        if self.use_disk_cache:
+            await disk_cache.start()
+
+        connector = aiohttp.TCPConnector(
+            limit=self.connection_limit,
+            limit_per_host=self.connection_limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+            use_dns_cache=True,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers={'User-Agent': USER_AGENT},
+            timeout=aiohttp.ClientTimeout(total=self.default_timeout),
+            trace_configs=[self._make_trace_config()],
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        await disk_cache.close()
+
+    def get_timeout(self, host: str) -> float:
+        return self.timeouts.get(host, self.default_timeout)
+
+    async def fetch(self, url: str, *, headers: dict = None, params: dict = None,
+                    lane: Lane = Lane.INTERACTIVE) -> UpstreamResponse:
+        """
+        GETs a URL, going through the response cache. Responses are cached by URL alone, so callers must not
+        pass headers that change what the upstream returns. Concurrent fetches of the same URL share one request.
+
+        Work that no user is waiting on should pass `lane=Lane.BACKGROUND`, so it queues behind commands.
+
+        If the host is failing, or the interaction being handled has run out of time, an expired cached response
+        is returned when there is one. Otherwise UpstreamUnavailable is raised straight away while the host's
+        circuit breaker is open, and DeadlineExceeded once there is no time left for another attempt.
+        """
+        url = URL(url)
+        if params:
+            url = url.update_query(params)
+
+        with tracing.span('http.fetch', url=str(url)) as span:
+            cached = response_cache.get(url)
+            if cached is not None and cached.is_fresh():
+                response_cache.record_hit(url, cached)
+                span.set(cache='memory')
+                return cached.response
+
+            request_headers = {**self.default_headers.get(url.host, {}), **(headers or {})}
+            return await self.flights.run(str(url), lambda: self._fetch_uncached(url, request_headers, lane),
+                                         label=url.host)
+
+    async def _fetch_uncached(self, url: URL, request_headers: dict, lane: Lane) -> UpstreamResponse:
+        cached = response_cache.get(url)
+        if cached is None:
+            cached = await self._load_from_disk(url)
+        if cached is not None and cached.is_fresh():
+            response_cache.record_hit(url, cached)
+            return cached.response
+
+        if cached is not None:
+            request_headers.update(cached.conditional_headers())
+
+        try:
+            response = await self._request_with_retries(url, request_headers, lane)
+        except (aiohttp.ClientError, asyncio.TimeoutError, UpstreamUnavailable, DeadlineExceeded):
+            if cached is None:
+                raise
+            return self._serve_stale(url, cached)
+
+        if response.status >= 500 and cached is not None:
+            return self._serve_stale(url, cached)
+        if response.status == 304 and cached is not None:
+            response_cache.refresh(url, cached)
+            await disk_cache.refresh(str(url))
+            return cached.response
+
+        response_cache.record_miss(url)
+        # Only successful responses are persisted; cached 404s are short-lived and not worth keeping across restarts.
+        if response_cache.put(url, response) and response.status == 200:
+            await disk_cache.put(str(url), response.status, response.body, list(response.headers.items()))
+        return response
+
+    @staticmethod
+    def _serve_stale(url: URL, cached) -> UpstreamResponse:
+        response_cache.record_stale_hit(url)
+        return cached.response
+
+    async def _request_with_retries(self, url: URL, headers: dict, lane: Lane) -> UpstreamResponse:
+        """
+        Sends a request, retrying connection errors, timeouts and 5xx responses with exponential backoff.
+        An attempt is only started if the host's breaker allows it and the deadline leaves time for it.
+        """
+        breaker = self.breakers.get(url.host)
+        last_error = None
+        out_of_time = False
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = self.retry_backoff * 2 ** (attempt - 1)
+                if not deadlines.can_attempt(delay):
+                    out_of_time = True
+                    break
+                await asyncio.sleep(delay)
+
+            if not breaker.allow():
+                if last_error is None:
+                    raise UpstreamUnavailable(url.host)
+                break
+            if not deadlines.can_attempt():
+                breaker.record_cancelled()
+                out_of_time = True
+                break
+
+            try:
+                response = await self._request(url, headers, lane, breaker)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = e
+                continue
+            if response.status < 500:
+                return response
+            last_error = response
+
+        if isinstance(last_error, UpstreamResponse):
+            return last_error
+        if out_of_time:
+            raise deadlines.exceeded() from last_error
+        raise last_error
+
+    async def _load_from_disk(self, url: URL):
+        with tracing.span('cache.disk') as span:
+            entry = await disk_cache.get(str(url))
+            span.set(hit=entry is not None)
+        if entry is None:
+            return None
+        response = UpstreamResponse(url=str(url), status=entry.status, body=entry.body, headers=CIMultiDict(entry.headers))
+        return response_cache.restore(url, response, age=entry.age)
+
+    async def _request(self, url: URL, headers: dict, lane: Lane, breaker: CircuitBreaker) -> UpstreamResponse:
+        with tracing.span('http.request', host=url.host) as span:
+            host_timeout = self.get_timeout(url.host)
+            cut_short = False
+            start = None
+            try:
+                async with self.gateway.slot(url.host, lane):
+                    # The wait for a slot may have used up the deadline, in which case the request is not worth
+                    # sending.
+                    deadlines.check()
+                    # Never wait past the deadline. A timeout it caused says nothing about the host's health.
+                    cut_short = deadlines.remaining() < host_timeout
+                    timeout = aiohttp.ClientTimeout(total=min(host_timeout, deadlines.remaining()))
+                    # Time only the request itself, not the wait for a slot.
+                    start = time.monotonic()
+                    span.set(attempt_timeout=timeout.total)
+                    target = self.url_rewriter(url) if self.url_rewriter is not None else url
+                    async with self.session.get(target, headers=headers, timeout=timeout) as resp:
+                        body = await resp.read()
+                        if resp.status == 429:
+                            retry_after = resp.headers.get('Retry-After', '')
+                            self.gateway.back_off(url.host, float(retry_after) if retry_after.isdigit() else 1)
+                        response = UpstreamResponse(url=str(url), status=resp.status, body=body,
+                                                    headers=CIMultiDict(resp.headers))
+            except asyncio.TimeoutError:
+                if cut_short:
+                    breaker.record_cancelled()
+                else:
+                    breaker.record_failure()
+                UPSTREAM_LATENCY.observe(time.monotonic() - start, host=url.host, status='timeout')
+                raise
+            except aiohttp.ClientError:
+                breaker.record_failure()
+                if start is not None:
+                    UPSTREAM_LATENCY.observe(time.monotonic() - start, host=url.host, status='error')
+                raise
+            except (asyncio.CancelledError, DeadlineExceeded):
+                breaker.record_cancelled()
+                raise
+
+            elapsed = time.monotonic() - start
+            UPSTREAM_LATENCY.observe(elapsed, host=url.host, status=response.status)
+            span.set(status=response.status, bytes=len(response.body))
+            for hook in self.response_hooks:
+                hook(response)
+            if response.status >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success(elapsed)
+            return response
+
+    def pool_usage(self) -> dict:
+        """ Returns a snapshot of request and connection counters, keyed by host. """
+        return {
+            host: {
+                'limit': self.connection_limit_per_host,
+                'in_flight': stats.in_flight,
+                'peak_in_flight': stats.peak_in_flight,
+                'requests': stats.requests,
+                'connections_created': stats.connections_created,
+                'connections_reused': stats.connections_reused,
+                'errors': stats.errors,
+            }
+            for host, stats in self.host_stats.items()
+        }
+
+    def _make_trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig(trace_config_ctx_factory=lambda trace_request_ctx: SimpleNamespace(host=None))
+
+        async def on_request_start(session, ctx, params):
+            ctx.host = params.url.host
+            stats = self.host_stats[ctx.host]
+            stats.requests += 1
+            stats.in_flight += 1
+            stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+
+        async def on_request_end(session, ctx, params):
+            self.host_stats[ctx.host].in_flight -= 1
+
+        async def on_request_exception(session, ctx, params):
+            stats = self.host_stats[ctx.host]
+            stats.in_flight -= 1
+            stats.errors += 1
+
+        async def on_connection_create_end(session, ctx, params):
+            self.host_stats[ctx.host].connections_created += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self.host_stats[ctx.host].connections_reused += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+
+upstream = UpstreamClient()
@@ -0,0 +1,99 @@
+"""
+Records anonymised traces of the interactions the bot receives, for benchmarks/replay.py to play back.
+
+Each application command and autocomplete interaction is appended to `path` as a JSON line: when it arrived
+(seconds since recording began), its type, the command data with its options, and the locale. Guild and user IDs
+are replaced by buckets from a keyed hash whose key is never written down, so a trace keeps the shape of the load
+(how many guilds, how spread out) without identifying anyone. Options that hold IDs are dropped, along with any
+resolved users, channels and messages, and the values of the options named in `redact_options` are blanked.
+
+Only a `sample_rate` share of interactions is recorded. Replaying at 1 / sample_rate speed restores the real rate.
+"""
+import asyncio
+import configparser
+import hashlib
+import json
+import os
+import random
+import time
+
+import discord
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+enabled = config.getboolean('Interaction Recording', 'enabled', fallback=False)
+path = config.get('Interaction Recording', 'path', fallback='interactions.jsonl')
+sample_rate = config.getfloat('Interaction Recording', 'sample_rate', fallback=1)
+guild_buckets = config.getint('Interaction Recording', 'guild_buckets', fallback=1000)
+user_buckets = config.getint('Interaction Recording', 'user_buckets', fallback=10000)
+redact_options = {name.strip() for name in
+                  config.get('Interaction Recording', 'redact_options', fallback='location').split(',') if name.strip()}
+
+REDACTED = '<redacted>'
+# Options of these types are user, channel, role, mentionable and attachment IDs.
+ID_OPTION_TYPES = {6, 7, 8, 9, 11}
+
+_key = os.urandom(16)
+_started_at = time.monotonic()
+recorded = 0
+
+
+def bucket(snowflake: int, buckets: int):
+    if snowflake is None:
+        return None
+    digest = hashlib.blake2b(str(snowflake).encode(), key=_key, digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % buckets
+
+
+def anonymise_options(options: list) -> list:
+    cleaned = []
+    for option in options:
+        if option.get('type') in ID_OPTION_TYPES:
+            continue
+        option = dict(option)
+        if 'options' in option:
+            option['options'] = anonymise_options(option['options'])
+        if option['name'] in redact_options and isinstance(option.get('value'), str):
+            option['value'] = REDACTED
+        cleaned.append(option)
+    return cleaned
+
+
+def record(interaction: discord.Interaction):
+    """ Appends the interaction to the trace, if recording is enabled and it is sampled. """
+    global recorded
+    if not enabled or interaction.type not in (discord.InteractionType.application_command,
+                                               discord.InteractionType.autocomplete):
+        return
+    if random.random() >= sample_rate:
+        return
+
+    data = interaction.data or {}
+    line = json.dumps({
+        't': round(time.monotonic() - _started_at, 4),
+        'type': interaction.type.value,
+        'data': {
+            'name': data.get('name'),
+            'type': data.get('type', 1),
+            'options': anonymise_options(data.get('options', [])),
+        },
+        'guild': bucket(interaction.guild_id, guild_buckets),
+        'user': bucket(interaction.user.id, user_buckets),
+        'locale': interaction.locale.value,
+    }, ensure_ascii=False)
+    recorded += 1
+
+    try:
+        # Keep the file write off the event loop.
+        asyncio.get_running_loop().run_in_executor(None, _append, line)
+    except RuntimeError:
+        _append(line)
+
+
+def _append(line: str):
+    try:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    except OSError as e:
+        print(f'Failed to record interaction to {path}: {e}')
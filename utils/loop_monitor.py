@@ -0,0 +1,162 @@
+import asyncio
+import configparser
+import os
+import statistics
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from dataclasses import dataclass
+
+from utils.metrics import LOOP_BLOCKS, LOOP_LAG, LOOP_LAG_QUANTILES
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+# Frames from files under here are our code, as opposed to the standard library or a dependency.
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ASYNCIO_ROOT = os.path.dirname(asyncio.__file__)
+
+
+@dataclass
+class BlockingEvent:
+    """ A stall of the event loop, with the stack of the main thread as it was while blocked. """
+
+    detected_at: float
+    task: str
+    site: str
+    stack: list
+    duration: float = None  # Filled in once the loop runs again
+
+    def describe(self) -> str:
+        duration = f'{self.duration:.2f}s' if self.duration is not None else 'still blocked'
+        return f'Event loop blocked ({duration}) in {self.site}, task {self.task}:\n' + ''.join(self.stack)
+
+
+class LoopMonitor:
+    """
+    Measures event loop lag and catches whatever blocks the loop.
+
+    A probe task sleeps for `interval` seconds at a time and records how late it wakes up. A watchdog thread
+    checks that the probe keeps running; once it has not run for `threshold` seconds the loop is blocked, and
+    the watchdog captures the main thread's stack, which shows the call that is blocking it.
+    """
+
+    def __init__(self, interval: float, threshold: float, window: int, stack_depth: int):
+        self.interval = interval
+        self.threshold = threshold
+        self.stack_depth = stack_depth
+        self.lags = deque(maxlen=window)
+        self.events = deque(maxlen=20)
+        self.sites = Counter()
+
+        self.heartbeat = time.monotonic()
+        self.pending_event = None
+        self._lock = threading.Lock()
+        self._loop = None
+        self._loop_thread_id = None
+        self._task = None
+        self._stopping = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._probe())
+        threading.Thread(target=self._watch, name='loop-watchdog', daemon=True).start()
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _probe(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self.heartbeat = now
+            self.lags.append(lag)
+            LOOP_LAG.observe(lag)
+
+            with self._lock:
+                event, self.pending_event = self.pending_event, None
+            if event is not None:
+                event.duration = lag
+                print(event.describe())
+
+    def _watch(self):
+        captured_for = None
+        while not self._stopping.wait(self.threshold / 4):
+            heartbeat = self.heartbeat
+            if time.monotonic() - heartbeat < self.threshold + self.interval or captured_for == heartbeat:
+                continue
+            # Only capture each stall once, however long it lasts.
+            captured_for = heartbeat
+            self._capture()
+
+    def _capture(self):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame, limit=self.stack_depth)
+        # Drop the event loop's own frames, which are the same for every stall.
+        loop_frames = [i for i, entry in enumerate(stack) if entry.filename.startswith(ASYNCIO_ROOT)]
+        if loop_frames and loop_frames[-1] + 1 < len(stack):
+            stack = traceback.StackSummary.from_list(stack[loop_frames[-1] + 1:])
+        ours = [entry for entry in stack
+                if entry.filename.startswith(PROJECT_ROOT) and 'site-packages' not in entry.filename]
+        site_frame = ours[-1] if ours else stack[-1]
+        site = f'{os.path.relpath(site_frame.filename, PROJECT_ROOT)}:{site_frame.lineno} ({site_frame.name})'
+
+        # Reading the loop's current task from another thread is racy, but only ever used for the report.
+        task = asyncio.current_task(self._loop)
+        task_name = f'{task.get_name()} ({task.get_coro().__qualname__})' if task is not None else 'none'
+
+        event = BlockingEvent(time.time(), task_name, site, traceback.format_list(stack))
+        with self._lock:
+            self.sites[site] += 1
+            self.events.append(event)
+            self.pending_event = event
+
+    def blocking_sites(self) -> Counter:
+        """ How many times the loop was caught blocked at each site. """
+        with self._lock:
+            return self.sites.copy()
+
+    def lag_quantiles(self) -> dict:
+        if len(self.lags) < 2:
+            return {}
+        lags = sorted(self.lags)
+        percentiles = statistics.quantiles(lags, n=100, method='inclusive')
+        return {'p50': percentiles[49], 'p90': percentiles[89], 'p99': percentiles[98], 'max': lags[-1]}
+
+    def get_stats(self) -> dict:
+        return {
+            'lag': self.lag_quantiles(),
+            'blocked': sum(self.blocking_sites().values()),
+            'sites': dict(self.blocking_sites().most_common(10)),
+        }
+
+
+loop_monitor = LoopMonitor(
+    interval=config.getfloat('Loop Monitor', 'interval', fallback=0.1),
+    threshold=config.getfloat('Loop Monitor', 'threshold', fallback=0.25),
+    window=config.getint('Loop Monitor', 'window', fallback=3000),
+    stack_depth=config.getint('Loop Monitor', 'stack_depth', fallback=20),
+)
+
+LOOP_LAG_QUANTILES.set_callback('loop_monitor', lambda: {(q,): lag for q, lag in loop_monitor.lag_quantiles().items()})
+LOOP_BLOCKS.set_callback('loop_monitor', lambda: {(site,): count for site, count in loop_monitor.blocking_sites().items()})
@@ -0,0 +1,149 @@
+import bisect
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Event loop lag is normally well under a millisecond, so its buckets start lower.
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+def _format_labels(labelnames, values, extra: dict = None) -> str:
+    pairs = list(zip(labelnames, values)) + list((extra or {}).items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: a count per bucket (plus one for +Inf), the sum and the total count.
+        self.series = defaultdict(lambda: [[0] * (len(self.buckets) + 1), 0.0, 0])
+
+    def observe(self, value: float, **labels):
+        series = self.series[tuple(str(labels[name]) for name in self.labelnames)]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def quantile(self, q: float, **labels) -> float:
+        """ Estimates a quantile as the upper bound of the bucket it falls in. """
+        counts, _, total = self.series[tuple(str(labels[name]) for name in self.labelnames)]
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def summaries(self) -> dict:
+        """ Returns (count, mean) for every label set. """
+        return {labels: (total, sum_ / total if total else 0) for labels, (_, sum_, total) in self.series.items()}
+
+    def render(self) -> list:
+        lines = []
+        for values, (counts, sum_, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, values, {"le": bound})} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, values, {"le": "+Inf"})} {total}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, values)} {sum_}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, values)} {total}')
+        return lines
+
+
+class CallbackGauge:
+    """
+    A gauge whose values are read when the metrics are scraped, from callbacks that each return a dict mapping
+    a tuple of label values to a number. Callbacks are stored by name, so registering one again replaces it.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callbacks = {}
+
+    def set_callback(self, source: str, callback):
+        self.callbacks[source] = callback
+
+    def collect(self) -> dict:
+        values = {}
+        for source, callback in list(self.callbacks.items()):
+            try:
+                values.update(callback())
+            except Exception as e:
+                print(f'Failed to collect {self.name} from {source}: {e}')
+        return values
+
+    def render(self) -> list:
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {value}' for labels, value in self.collect().items()]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, documentation, labelnames, buckets))
+
+    def callback_gauge(self, name: str, documentation: str, labelnames=()) -> CallbackGauge:
+        return self.metrics.setdefault(name, CallbackGauge(name, documentation, labelnames))
+
+    def render(self) -> str:
+        """ Renders every metric in the Prometheus text exposition format. """
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+COMMAND_LATENCY = registry.histogram('islambot_command_duration_seconds',
+                                     'Time from an interaction being created to its command finishing.',
+                                     ['command', 'outcome'])
+UPSTREAM_LATENCY = registry.histogram('islambot_upstream_request_duration_seconds',
+                                      'Duration of requests to upstream APIs.', ['host', 'status'])
+DB_LATENCY = registry.histogram('islambot_db_query_duration_seconds', 'Duration of settings storage operations.',
+                                ['operation'])
+CACHE_LOOKUPS = registry.callback_gauge('islambot_cache_lookups', 'Cache lookups since startup, by result.',
+                                        ['cache', 'result'])
+CACHE_HIT_RATIO = registry.callback_gauge('islambot_cache_hit_ratio', 'Share of cache lookups that were hits.',
+                                          ['cache'])
+PAGE_CACHE_ENTRIES = registry.callback_gauge('islambot_page_cache_entries',
+                                            'Paginated messages whose content is cached for their buttons.')
+SHARD_LATENCY = registry.callback_gauge('islambot_shard_latency_seconds', 'Gateway heartbeat latency per shard.',
+                                        ['shard'])
+UPSTREAM_QUEUE = registry.callback_gauge('islambot_upstream_queued_requests',
+                                         'Requests waiting for an upstream slot.', ['host', 'lane'])
+UPSTREAM_BREAKER_OPEN = registry.callback_gauge('islambot_upstream_breaker_open',
+                                                'Whether the circuit breaker for a host is open.', ['host'])
+LOOP_LAG = registry.histogram('islambot_event_loop_lag_seconds', 'How late the event loop ran a scheduled callback.',
+                              buckets=LAG_BUCKETS)
+LOOP_LAG_QUANTILES = registry.callback_gauge('islambot_event_loop_lag_quantile_seconds',
+                                             'Event loop lag percentiles over the recent window.', ['quantile'])
+LOOP_BLOCKS = registry.callback_gauge('islambot_event_loop_blocked', 'Times the event loop was caught blocked, by site.',
+                                      ['site'])
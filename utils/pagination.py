@@ -0,0 +1,364 @@
+"""
+Stateless page navigation for long responses.
+
+The buttons of a paginated message carry everything needed to turn its page in their custom_id: the kind of content,
+the key it was built from and the page on show. Nothing is kept per message, so memory does not grow with the number
+of open messages, no timeouts fire to edit them, and the buttons keep working after a restart. When one is pressed,
+the content is taken from a shared LRU cache, or rebuilt from its key by the loader of its kind, which fetches through
+the upstream client and so is usually answered from the response cache.
+
+Each cog registers the kinds of content it paginates when it loads, and sends its first page with the view from
+`paginate`, which also caches the content for the presses that follow. Long texts are split into pages by Paginator.
+"""
+import configparser
+import hashlib
+import re
+import sys
+import unicodedata
+from collections import OrderedDict
+from collections.abc import Sequence
+from dataclasses import dataclass
+from types import ModuleType
+from typing import Awaitable, Callable
+
+import discord
+
+from utils.singleflight import SingleFlight
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+# Discord's limit on the length of a custom_id.
+MAX_CUSTOM_ID = 100
+EXPIRED = ":warning: This message has expired. Please run the command again."
+LOAD_FAILED = ":warning: Could not load this page. Please try again later."
+NOT_OWNER = "Only the sender of the command can change the page."
+
+# As textwrap does, tabs are expanded and then every whitespace character is turned into a space.
+WHITESPACE = '\t\n\x0b\x0c\r'
+TAB_SIZE = 8
+NOT_SPACE = re.compile(r'[^ ]')
+CHUNK = re.compile(r' +|[^ ]+')
+
+
+def is_mark(character: str) -> bool:
+    """ Whether a character attaches to the one before it, like Arabic harakat or a zero-width joiner. """
+    return unicodedata.category(character) in ('Mn', 'Me', 'Cf')
+
+
+class Paginator(Sequence):
+    """
+    The pages of a text, each at most `width` characters, the same as textwrap.wrap with break_on_hyphens=False.
+    Pages are kept as offsets into the one text, found only as far as the page asked for, and sliced out when they
+    are read. Counting the pages finds all of their offsets, which is still far cheaper than wrapping.
+
+    Words longer than a page are split if `break_long_words` is set, never between a letter and the marks on it, and
+    otherwise get a longer page to themselves.
+    """
+
+    def __init__(self, text: str, width: int, break_long_words: bool = True):
+        if '\t' in text:
+            text = text.expandtabs(TAB_SIZE)
+        for character in WHITESPACE:
+            # Much faster than a regular expression or str.translate over non-ASCII text.
+            text = text.replace(character, ' ')
+        self.text = text
+        self.width = width
+        self.break_long_words = break_long_words
+        self.bounds = []
+        # Like textwrap, keeps the spaces the text starts with, unless it is all spaces.
+        self.next_start = None if self._skip_spaces(0) is None else 0
+
+    def _skip_spaces(self, position: int):
+        """ The offset of the first character from `position` that is not a space, or None at the end of the text. """
+        match = NOT_SPACE.search(self.text, position)
+        return match.start() if match else None
+
+    def _find_page(self, start: int) -> tuple:
+        """ Returns where the page from `start` starts and ends once spaces are trimmed, and where the next starts. """
+        text = self.text
+        if start == 0 and text[0] == ' ':
+            return self._find_first_page()
+
+        limit = start + self.width
+        if limit >= len(text):
+            return start, len(text[start:].rstrip(' ')) + start, None
+        if text[limit] == ' ':
+            return start, len(text[start:limit].rstrip(' ')) + start, self._skip_spaces(limit)
+
+        space = text.rfind(' ', start, limit)
+        end = len(text[start:space].rstrip(' ')) + start if space != -1 else start
+        word_end = text.find(' ', limit)
+        if word_end == -1:
+            word_end = len(text)
+        # A word that fits on a page of its own goes to the next one, as in textwrap.
+        if end > start and (word_end - space - 1 <= self.width or not self.break_long_words):
+            return start, end, self._skip_spaces(space)
+        if not self.break_long_words:
+            # The word gets a page to itself, without the spaces the text may start with.
+            return self._skip_spaces(start), word_end, self._skip_spaces(word_end)
+
+        end = limit
+        while end > start + 1 and is_mark(text[end]):
+            end -= 1
+        return start, end, end
+
+    def _find_first_page(self) -> tuple:
+        """
+        The first page of a text that starts with spaces, found as textwrap finds it. Unlike later pages, it keeps
+        those spaces, but drops them when the first word does not fit after them, and splits them like a word if they
+        are wider than a page. This walks the words of the page one at a time, as textwrap does.
+        """
+        text = self.text
+        chunks = (match.span() for match in CHUNK.finditer(text))
+        chunk = next(chunks)
+        while chunk is not None:
+            line = []
+            length = 0
+            while chunk is not None and length + chunk[1] - chunk[0] <= self.width:
+                line.append(chunk)
+                length += chunk[1] - chunk[0]
+                chunk = next(chunks, None)
+            if chunk is not None and chunk[1] - chunk[0] > self.width:
+                if self.break_long_words:
+                    end = chunk[0] + self.width - length
+                    while end > (line[0][0] if line else chunk[0]) + 1 and is_mark(text[end]):
+                        end -= 1
+                    line.append((chunk[0], end))
+                    chunk = (end, chunk[1])
+                elif not line:
+                    line.append(chunk)
+                    chunk = next(chunks, None)
+            # Spaces (or nothing at all) at the end of the line are dropped, which may leave no line.
+            if line and not text[line[-1][0]:line[-1][1]].strip(' '):
+                line.pop()
+            if line:
+                return line[0][0], line[-1][1], self._skip_spaces(chunk[0]) if chunk is not None else None
+
+    def _find_pages(self, count: int):
+        while len(self.bounds) < count and self.next_start is not None:
+            start, end, self.next_start = self._find_page(self.next_start)
+            self.bounds.append((start, end))
+
+    def __len__(self) -> int:
+        self._find_pages(len(self.text))
+        return len(self.bounds)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        self._find_pages(index + 1)
+        if not 0 <= index < len(self.bounds):
+            raise IndexError('page index out of range')
+        start, end = self.bounds[index]
+        return self.text[start:end]
+
+
+@dataclass
+class PageSource:
+    kind: str
+    # Rebuilds the content for a key, e.g. by fetching it again.
+    load: Callable[[str], Awaitable[object]]
+    render: Callable[[object, int], discord.Embed]
+    page_count: Callable[[object], int]
+    previous_style: discord.ButtonStyle = discord.ButtonStyle.grey
+
+
+def document_size(document) -> int:
+    """
+    Roughly the bytes a document holds: its strings and containers, followed through its attributes. Text is nearly
+    all of it, and each string is counted once however many attributes share it.
+    """
+    size = 0
+    seen = set()
+    stack = [document]
+    while stack:
+        value = stack.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        if isinstance(value, (str, bytes)):
+            size += sys.getsizeof(value)
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            size += sys.getsizeof(value)
+            stack.extend(value)
+        elif isinstance(value, dict):
+            size += sys.getsizeof(value)
+            stack.extend(value.keys())
+            stack.extend(value.values())
+        elif hasattr(value, '__dict__') and not isinstance(value, (type, ModuleType)) and not callable(value):
+            stack.extend(vars(value).values())
+        elif hasattr(type(value), '__slots__'):
+            stack.extend(getattr(value, name, None) for name in type(value).__slots__)
+    return size
+
+
+class ContentCache:
+    """
+    The content of recently paginated messages, keyed by kind and key, evicting the least recently used. Bounded by
+    entry count and by the total size of the content, as tafsir documents can each hold megabytes of text.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kind: str, key: str):
+        document = self.entries.get((kind, key))
+        if document is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end((kind, key))
+        return document
+
+    def put(self, kind: str, key: str, document) -> bool:
+        """ Caches a document, unless it is larger than the whole cache. Returns whether it was cached. """
+        size = document_size(document)
+        self._remove((kind, key))
+        if size > self.max_bytes:
+            return False
+
+        self.entries[(kind, key)] = document
+        self.sizes[(kind, key)] = size
+        self.total_bytes += size
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+        return True
+
+    def clear(self):
+        self.entries.clear()
+        self.sizes.clear()
+        self.total_bytes = 0
+
+    def _remove(self, entry_key: tuple):
+        if self.entries.pop(entry_key, None) is not None:
+            self.total_bytes -= self.sizes.pop(entry_key)
+
+    def get_stats(self) -> dict:
+        return {'entries': len(self.entries), 'bytes': self.total_bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+content_cache = ContentCache(config.getint('Page Cache', 'max_entries', fallback=2000),
+                             config.getint('Page Cache', 'max_bytes', fallback=64 * 1024 * 1024))
+sources = {}
+_loads = SingleFlight()
+
+
+def register(bot, source: PageSource):
+    sources[source.kind] = source
+    bot.add_dynamic_items(PageButton)
+
+
+def unregister(kind: str):
+    sources.pop(kind, None)
+
+
+def fit_key(kind: str, key: str, owner: int = None) -> str:
+    """
+    Returns the key if it fits in a custom_id. Otherwise, returns a hash of it, which can only find the content while
+    it is still cached.
+    """
+    longest = len(f'page:{kind}:p:99999:{owner or ""}:') + len(key)
+    if longest <= MAX_CUSTOM_ID:
+        return key
+    return '#' + hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def page_view(kind: str, key: str, page: int, owner: int = None) -> discord.ui.View:
+    """
+    The buttons for a message on `page`. The view is stopped before it is sent, so that discord.py does not keep it:
+    presses reach PageButton through its custom_id template instead.
+    """
+    view = discord.ui.View(timeout=None)
+    view.add_item(PageButton(kind, 'p', page, owner, key))
+    view.add_item(PageButton(kind, 'n', page, owner, key))
+    view.stop()
+    return view
+
+
+def paginate(kind: str, key: str, document, page: int = 1, owner: int = None) -> discord.ui.View:
+    """ Caches a message's content and returns its buttons. If `owner` is given, only they can turn the pages. """
+    key = fit_key(kind, key, owner)
+    content_cache.put(kind, key, document)
+    return page_view(kind, key, page, owner)
+
+
+class PageButton(discord.ui.DynamicItem[discord.ui.Button],
+                 template=r'page:(?P<kind>[a-z]+):(?P<direction>[pn]):(?P<page>[0-9]+):(?P<owner>[0-9]*):(?P<key>.*)'):
+    def __init__(self, kind: str, direction: str, page: int, owner: int, key: str):
+        self.kind = kind
+        self.previous = direction == 'p'
+        self.page = page
+        self.owner = owner
+        self.key = key
+
+        source = sources.get(kind)
+        if not self.previous:
+            style = discord.ButtonStyle.green
+        else:
+            style = source.previous_style if source is not None else discord.ButtonStyle.grey
+        super().__init__(discord.ui.Button(
+            label='Previous Page' if self.previous else 'Next Page',
+            style=style,
+            emoji='⬅' if self.previous else '➡',
+            custom_id=f'page:{kind}:{direction}:{page}:{owner or ""}:{key}',
+        ))
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        owner = int(match['owner']) if match['owner'] else None
+        return cls(match['kind'], match['direction'], int(match['page']), owner, match['key'])
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if self.owner is not None and interaction.user.id != self.owner:
+            await interaction.response.send_message(content=NOT_OWNER, ephemeral=True)
+            return False
+        return True
+
+    async def callback(self, interaction: discord.Interaction):
+        source = sources.get(self.kind)
+        # The kind's cog was unloaded, so its content can be neither rendered nor rebuilt.
+        if source is None:
+            return await interaction.response.send_message(content=EXPIRED, ephemeral=True)
+
+        document = content_cache.get(self.kind, self.key)
+        if document is None and self.key.startswith('#'):
+            return await interaction.response.send_message(content=EXPIRED, ephemeral=True)
+
+        # A rebuilt document may have no pages, e.g. if the upstream returned an error page, so it is only cached once
+        # a page of it has been rendered.
+        rebuilt = document is None
+        try:
+            if rebuilt:
+                # Rebuilding may mean fetching, which can take longer than Discord waits for a response.
+                await interaction.response.defer()
+                document = await _loads.run((self.kind, self.key), lambda: source.load(self.key), label=self.kind)
+
+            num_pages = source.page_count(document)
+            page = self.page - 1 if self.previous else self.page + 1
+            if page < 1:
+                page = num_pages
+            elif page > num_pages:
+                page = 1
+            embed = source.render(document, page)
+        except Exception as e:
+            print(f'Failed to load {self.kind} {self.key} for pagination: {type(e).__name__}: {e}')
+            if interaction.response.is_done():
+                return await interaction.followup.send(content=LOAD_FAILED, ephemeral=True)
+            return await interaction.response.send_message(content=LOAD_FAILED, ephemeral=True)
+
+        if rebuilt:
+            content_cache.put(self.kind, self.key, document)
+        view = page_view(self.kind, self.key, page, self.owner)
+        if interaction.response.is_done():
+            await interaction.edit_original_response(embed=embed, view=view)
+        else:
+            await interaction.response.edit_message(embed=embed, view=view)
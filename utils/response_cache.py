@@ -0,0 +1,196 @@
+import configparser
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from fnmatch import fnmatch
+
+from yarl import URL
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+FOREVER = float('inf')
+
+
+def parse_ttl(value: str) -> float:
+    """ Reads a TTL from the config. 'forever' is accepted for content that never changes. """
+    if value.strip().lower() in ('forever', 'inf', 'infinite'):
+        return FOREVER
+    return float(value)
+
+
+@dataclass
+class CachedResponse:
+    response: object  # UpstreamResponse
+    stored_at: float
+    ttl: float
+
+    @property
+    def size(self) -> int:
+        return len(self.response.body)
+
+    @property
+    def etag(self) -> str:
+        return self.response.headers.get('ETag')
+
+    @property
+    def last_modified(self) -> str:
+        return self.response.headers.get('Last-Modified')
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.stored_at
+
+    def is_fresh(self) -> bool:
+        return self.age < self.ttl
+
+    def can_revalidate(self) -> bool:
+        return self.response.status == 200 and (self.etag is not None or self.last_modified is not None)
+
+    def conditional_headers(self) -> dict:
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+@dataclass
+class SourceStats:
+    hits: int = 0
+    negative_hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    revalidated: int = 0
+    stored: int = 0
+    evictions: int = 0
+
+
+class ResponseCache:
+    """
+    An in-memory LRU cache for upstream GET responses, bounded by entry count and total body size.
+
+    How long a response is kept depends on where it came from. TTLs are set per host or per URL pattern
+    in the [Response Cache TTLs] section, e.g. "api.sunnah.com = forever" or "api.aladhan.com/v1/methods = 3600";
+    the longest matching pattern wins and URLs that match nothing use `default_ttl`. 404s are kept for
+    `negative_ttl` seconds, so repeated bad references do not reach the upstream each time.
+
+    Expired entries with an ETag or Last-Modified header are kept so they can be revalidated with a
+    conditional request instead of being downloaded again. Other expired entries are kept for `max_stale`
+    seconds, to be served if their upstream is down.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, default_ttl: float, negative_ttl: float, max_stale: float,
+                 ttls: dict):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self.max_stale = max_stale
+        # Longest patterns first, so that a path-specific TTL overrides the one for its host.
+        self.ttls = dict(sorted(ttls.items(), key=lambda item: len(item[0]), reverse=True))
+
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.source_stats = defaultdict(SourceStats)
+
+    def ttl_for(self, url: URL) -> float:
+        target = f'{url.host}{url.path}'.lower()
+        for pattern, ttl in self.ttls.items():
+            if fnmatch(target, pattern) or fnmatch(target, f"{pattern.rstrip('/')}/*"):
+                return ttl
+        return self.default_ttl
+
+    def get(self, url: URL) -> CachedResponse:
+        """ Returns the entry for a URL whether or not it has expired, or None if nothing usable is cached. """
+        entry = self.entries.get(str(url))
+        if entry is None:
+            return None
+        if not self.is_usable(entry):
+            self._remove(str(url))
+            return None
+        self.entries.move_to_end(str(url))
+        return entry
+
+    def put(self, url: URL, response) -> bool:
+        """ Stores a response if it is cacheable. Returns whether it was stored. """
+        if response.status == 200:
+            ttl = self.ttl_for(url)
+        elif response.status == 404:
+            ttl = min(self.negative_ttl, self.ttl_for(url))
+        else:
+            return False
+
+        if ttl <= 0 or len(response.body) > self.max_bytes:
+            return False
+
+        self._add(url, CachedResponse(response=response, stored_at=time.monotonic(), ttl=ttl))
+        self.source_stats[url.host].stored += 1
+        return True
+
+    def restore(self, url: URL, response, age: float) -> CachedResponse:
+        """ Adds a response loaded from the disk cache, which was fetched `age` seconds ago. """
+        entry = CachedResponse(response=response, stored_at=time.monotonic() - age, ttl=self.ttl_for(url))
+        if entry.ttl <= 0 or not self.is_usable(entry):
+            return None
+        self._add(url, entry)
+        return entry
+
+    def is_usable(self, entry: CachedResponse) -> bool:
+        return entry.age < entry.ttl + self.max_stale or entry.can_revalidate()
+
+    def _add(self, url: URL, entry: CachedResponse):
+        self._remove(str(url))
+        self.entries[str(url)] = entry
+        self.total_bytes += entry.size
+
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            key, evicted = self.entries.popitem(last=False)
+            self.total_bytes -= evicted.size
+            self.source_stats[URL(key).host].evictions += 1
+
+    def refresh(self, url: URL, entry: CachedResponse):
+        """ Marks an entry as fresh again after the upstream confirmed it is unchanged. """
+        entry.stored_at = time.monotonic()
+        self.source_stats[url.host].revalidated += 1
+
+    def record_hit(self, url: URL, entry: CachedResponse):
+        stats = self.source_stats[url.host]
+        if entry.response.status == 404:
+            stats.negative_hits += 1
+        else:
+            stats.hits += 1
+
+    def record_stale_hit(self, url: URL):
+        self.source_stats[url.host].stale_hits += 1
+
+    def record_miss(self, url: URL):
+        self.source_stats[url.host].misses += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+
+    def get_stats(self) -> dict:
+        return {
+            'entries': len(self.entries),
+            'bytes': self.total_bytes,
+            'sources': {host: vars(stats).copy() for host, stats in self.source_stats.items()},
+        }
+
+
+response_cache = ResponseCache(
+    max_entries=config.getint('Response Cache', 'max_entries', fallback=5000),
+    max_bytes=config.getint('Response Cache', 'max_bytes', fallback=64 * 1024 * 1024),
+    default_ttl=parse_ttl(config.get('Response Cache', 'default_ttl', fallback='0')),
+    negative_ttl=parse_ttl(config.get('Response Cache', 'negative_ttl', fallback='300')),
+    max_stale=parse_ttl(config.get('Response Cache', 'max_stale', fallback='86400')),
+    ttls={pattern: parse_ttl(ttl) for pattern, ttl in config['Response Cache TTLs'].items()}
+    if config.has_section('Response Cache TTLs') else {},
+)
@@ -0,0 +1,139 @@
+"""
+An always-on sampling profiler.
+
+A background thread samples the main thread's stack every `interval` seconds and writes the counts of each
+collapsed stack to a new file in `directory` every `window` seconds, keeping the newest `keep` files. The files
+can be fed to flamegraph.pl or speedscope as they are. To see how time is split between our modules, or compare
+two sets of files (e.g. from before and after a deploy), run:
+
+    python -m utils.sampling_profiler profiles/20240101-*.collapsed --against profiles/20240102-*.collapsed
+"""
+import argparse
+import configparser
+import glob
+import os
+import time
+from collections import Counter
+
+from utils.metrics import registry
+from utils.stack_sampler import StackSampler, format_collapsed
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+PROFILER_OVERHEAD = registry.callback_gauge('islambot_sampling_profiler_overhead_ratio',
+                                            'Share of wall time the sampling profiler spends taking samples.')
+
+
+class SamplingProfiler(StackSampler):
+    def __init__(self, interval: float, window: float, directory: str, keep: int):
+        super().__init__(interval)
+        self.window = window
+        self.directory = directory
+        self.keep = keep
+        self.sampling_time = 0
+        self.started_at = None
+        self.files_written = 0
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.started_at = time.perf_counter()
+        super().start()
+
+    def _run(self):
+        # Everything, including writing files, happens on this thread, so it carries on while the loop is blocked.
+        window_ends = time.monotonic() + self.window
+        while not self._stopping.wait(self.interval):
+            start = time.perf_counter()
+            self.sample()
+            if time.monotonic() >= window_ends:
+                window_ends += self.window
+                self.write_window()
+            self.sampling_time += time.perf_counter() - start
+        self.write_window()
+
+    def write_window(self):
+        samples = self.take_samples()
+        if not samples:
+            return
+        path = os.path.join(self.directory, time.strftime('%Y%m%d-%H%M%S') + '.collapsed')
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(format_collapsed(samples))
+            self.files_written += 1
+            self._rotate()
+        except OSError as e:
+            print(f'Failed to write profile samples to {path}: {e}')
+
+    def _rotate(self):
+        files = sorted(glob.glob(os.path.join(self.directory, '*.collapsed')))
+        # Not files[:-self.keep], which is empty when keep is 0.
+        for path in files[:max(len(files) - self.keep, 0)]:
+            os.remove(path)
+
+    def overhead(self) -> float:
+        if self.started_at is None:
+            return 0
+        return self.sampling_time / (time.perf_counter() - self.started_at)
+
+    def get_stats(self) -> dict:
+        return {
+            'running': self.running,
+            'overhead': self.overhead(),
+            'files_written': self.files_written,
+        }
+
+
+sampling_profiler = SamplingProfiler(
+    interval=config.getfloat('Sampling Profiler', 'interval', fallback=0.02),
+    window=config.getfloat('Sampling Profiler', 'window', fallback=60),
+    directory=config.get('Sampling Profiler', 'directory', fallback='profiles'),
+    keep=config.getint('Sampling Profiler', 'keep', fallback=1440),
+)
+
+PROFILER_OVERHEAD.set_callback('sampling_profiler', lambda: {(): sampling_profiler.overhead()})
+
+
+def read_collapsed(paths: list) -> Counter:
+    samples = Counter()
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                samples[stack] += int(count)
+    return samples
+
+
+def module_shares(samples: Counter) -> dict:
+    """ The share of samples in which each of our modules was on the stack, i.e. its inclusive time. """
+    total = sum(samples.values())
+    modules = Counter()
+    for stack, count in samples.items():
+        for module in {frame.partition(':')[0] for frame in stack.split(';')}:
+            modules[module] += count
+    return {module: count / total for module, count in modules.items()} if total else {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarises collapsed stack files by module.')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--against', nargs='+', help='Files to compare with, e.g. from before a deploy.')
+    parser.add_argument('--top', type=int, default=30)
+    parser.add_argument('--prefix', default='', help='Only show modules starting with this, e.g. "quran".')
+    args = parser.parse_args()
+
+    shares = module_shares(read_collapsed(args.files))
+    baseline = module_shares(read_collapsed(args.against)) if args.against else {}
+    rows = sorted(((m, s) for m, s in shares.items() if m.startswith(args.prefix)), key=lambda r: r[1], reverse=True)
+
+    print(f'{"module":<50} {"share":>8}' + (f' {"before":>8} {"change":>8}' if baseline else ''))
+    for module, share in rows[:args.top]:
+        line = f'{module:<50} {share:>8.2%}'
+        if baseline:
+            before = baseline.get(module, 0)
+            line += f' {before:>8.2%} {share - before:>+8.2%}'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
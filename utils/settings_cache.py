@@ -0,0 +1,130 @@
+import configparser
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+# Stored in place of a value when the database has no row for a key, so that lookups for
+# guilds/users without a custom setting are cached too.
+ABSENT = object()
+
+
+@dataclass
+class CacheEntry:
+    value: object
+    stored_at: float
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.stored_at
+
+
+class SettingsCache:
+    """
+    An in-process TTL + LRU cache for guild and user settings read through DBHandler.
+
+    Entries older than `ttl` are refetched from the database. If the database cannot be reached, entries
+    up to `ttl + max_stale` seconds old are still served.
+
+    Tables can also be preloaded in full at startup. Preloaded tables are authoritative: their rows never
+    expire or get evicted, a missing key means there is no row, and writes update them in place.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, max_stale: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.entries = OrderedDict()
+        self.preloaded = {}
+        self.preload_stats = {}
+        # Bumped on every invalidation, so a read that raced with a write can tell not to cache its result.
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+
+    def get(self, table: str, key) -> CacheEntry:
+        """ Returns the entry for a key whether or not it has expired, or None if it has never been cached. """
+        entry = self.entries.get((table, key))
+        if entry is not None:
+            self.entries.move_to_end((table, key))
+        return entry
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return entry.age < self.ttl
+
+    def is_servable_when_stale(self, entry: CacheEntry) -> bool:
+        return entry.age < self.ttl + self.max_stale
+
+    def put(self, table: str, key, value, generation: int = None):
+        if generation is not None and generation != self.generation:
+            return
+        self.entries[(table, key)] = CacheEntry(value=value, stored_at=time.monotonic())
+        self.entries.move_to_end((table, key))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, table: str, key):
+        self.generation += 1
+        self.entries.pop((table, key), None)
+
+    def is_preloaded(self, table: str) -> bool:
+        return table in self.preloaded
+
+    def get_preloaded(self, table: str, key):
+        return self.preloaded[table].get(key, ABSENT)
+
+    def load_table(self, table: str, rows: dict, seconds: float):
+        self.preloaded[table] = rows
+        self.preload_stats[table] = {
+            'rows': len(rows),
+            'seconds': seconds,
+            'bytes': self.estimate_size(rows),
+        }
+
+    def apply_update(self, table: str, key, values: dict, columns):
+        """ Records a write that has been made to the database. """
+        if table not in self.preloaded:
+            return self.invalidate(table, key)
+
+        row = self.preloaded[table].get(key)
+        if row is None:
+            row = self.preloaded[table][key] = dict.fromkeys(columns)
+        row.update(values)
+
+    def apply_delete(self, table: str, key):
+        if table not in self.preloaded:
+            return self.invalidate(table, key)
+        self.preloaded[table].pop(key, None)
+
+    @staticmethod
+    def estimate_size(rows: dict) -> int:
+        """ Approximates the memory held by a preloaded table: the map itself, its keys and every row. """
+        size = sys.getsizeof(rows)
+        for key, row in rows.items():
+            size += sys.getsizeof(key) + sys.getsizeof(row)
+            size += sum(sys.getsizeof(value) for value in row.values())
+        return size
+
+    def get_stats(self) -> dict:
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_hits': self.stale_hits,
+            'evictions': self.evictions,
+            'preloaded': self.preload_stats,
+        }
+
+
+settings_cache = SettingsCache(
+    max_entries=config.getint('Settings Cache', 'max_entries', fallback=50000),
+    ttl=config.getfloat('Settings Cache', 'ttl', fallback=600),
+    max_stale=config.getfloat('Settings Cache', 'max_stale', fallback=3600),
+)
@@ -0,0 +1,168 @@
+import asyncio
+import configparser
+from collections import defaultdict
+from dataclasses import dataclass
+
+from utils.metrics import DB_LATENCY
+from utils.settings_cache import ABSENT, settings_cache
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+
+@dataclass
+class PendingWrite:
+    table: str
+    key_column: str
+    key: object
+    columns: dict
+    values: dict = None  # None means the whole row is to be deleted
+
+    def merge_newer(self, newer: 'PendingWrite') -> 'PendingWrite':
+        """ Combines this write with a later one to the same row, the later one taking precedence. """
+        if newer.values is None:
+            return newer
+        if self.values is None:
+            # The row is deleted and then recreated, so columns that were not set again must be cleared.
+            newer.values = {**dict.fromkeys(self.columns), **newer.values}
+        else:
+            newer.values = {**self.values, **newer.values}
+        return newer
+
+
+class SettingsWriteQueue:
+    """
+    Buffers settings writes so that commands only wait for the in-memory update.
+
+    Writes to the same row are coalesced, and pending writes are flushed as multi-row upserts and deletes
+    every `flush_interval` seconds, or sooner once `max_pending` rows are waiting. Reads overlay pending
+    writes through `overlay`, so they never see a value older than the latest write.
+    """
+
+    def __init__(self, flush_interval: float, max_pending: int):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = {}
+        self.flushing = {}
+        self.writer = None
+
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = None
+
+        self.enqueued = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self, writer):
+        """ Starts the background flush loop. `writer` is the storage backend that executes the batched writes. """
+        self.writer = writer
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """ Stops the flush loop, then writes out everything still pending. """
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        await self.flush()
+
+    def enqueue_update(self, table: str, key_column: str, key, columns: dict, values: dict):
+        self._enqueue(PendingWrite(table, key_column, key, columns, dict(values)))
+
+    def enqueue_delete(self, table: str, key_column: str, key, columns: dict):
+        self._enqueue(PendingWrite(table, key_column, key, columns))
+
+    def _enqueue(self, write: PendingWrite):
+        self.enqueued += 1
+        existing = self.pending.get((write.table, write.key))
+        if existing is not None:
+            self.coalesced += 1
+            write = existing.merge_newer(write)
+        self.pending[(write.table, write.key)] = write
+
+        if len(self.pending) >= self.max_pending:
+            self._wakeup.set()
+
+    def overlay(self, table: str, key, row, columns: dict):
+        """ Applies any unflushed write for this row on top of the row read from the cache or database. """
+        for writes in (self.flushing, self.pending):
+            write = writes.get((table, key))
+            if write is None:
+                continue
+            if write.values is None:
+                row = ABSENT
+            else:
+                row = {**(dict.fromkeys(columns) if row is ABSENT else row), **write.values}
+        return row
+
+    async def flush(self):
+        if not self.pending:
+            return
+
+        batch, self.pending = self.pending, {}
+        self.flushing = batch
+        try:
+            with DB_LATENCY.time(operation='flush'):
+                await self._write(batch.values())
+            self.flushes += 1
+            self.flushed_rows += len(batch)
+        except Exception as e:
+            self.failures += 1
+            print(f'Failed to write {len(batch)} settings rows, will retry: {e}')
+            for row_key, write in batch.items():
+                newer = self.pending.get(row_key)
+                self.pending[row_key] = write if newer is None else write.merge_newer(newer)
+        finally:
+            self.flushing = {}
+            # Reads that ran during the flush may have cached the row as it was before the write landed.
+            for table, key in batch:
+                settings_cache.invalidate(table, key)
+
+    async def _write(self, writes):
+        upserts = defaultdict(list)
+        deletes = defaultdict(list)
+        for write in writes:
+            if write.values is None:
+                deletes[(write.table, write.key_column)].append(write.key)
+            else:
+                upserts[(write.table, write.key_column, tuple(write.values))].append((write.key, *write.values.values()))
+
+        for (table, key_column, columns), rows in upserts.items():
+            await self.writer.upsert_rows(table, key_column, columns, rows)
+        for (table, key_column), keys in deletes.items():
+            await self.writer.delete_rows(table, key_column, keys)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def get_stats(self) -> dict:
+        return {
+            'pending': len(self.pending),
+            'enqueued': self.enqueued,
+            'coalesced': self.coalesced,
+            'flushes': self.flushes,
+            'flushed_rows': self.flushed_rows,
+            'failures': self.failures,
+        }
+
+
+settings_writer = SettingsWriteQueue(
+    flush_interval=config.getfloat('Settings Writes', 'flush_interval', fallback=5),
+    max_pending=config.getint('Settings Writes', 'max_pending', fallback=500),
+)
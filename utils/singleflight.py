@@ -0,0 +1,71 @@
+import asyncio
+import contextvars
+from collections import defaultdict
+from dataclasses import dataclass
+
+from utils import deadlines
+
+
+@dataclass
+class FlightStats:
+    executed: int = 0
+    shared: int = 0  # Callers that joined a call already in flight, i.e. upstream calls saved
+
+
+@dataclass
+class Flight:
+    task: asyncio.Task
+    deadline: deadlines.SharedDeadline
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key, so that a burst of identical requests runs the work once.
+
+    The first caller for a key starts the call as a task and later callers await that same task. Each caller
+    awaits it through `asyncio.shield`, so a caller that is cancelled (e.g. an abandoned interaction) only
+    stops waiting; the call itself carries on for everyone else.
+
+    The call runs in a context of its own rather than the first caller's, so it is not cut short by that caller's
+    deadline or recorded in its trace. Its deadline is the latest of its callers', and each caller stops waiting
+    when its own deadline passes.
+    """
+
+    def __init__(self):
+        self.in_flight = {}
+        self.stats = defaultdict(FlightStats)
+
+    async def run(self, key, factory, label: str = None):
+        """ Returns the result of `factory()`, sharing one call between everyone asking for `key` at the same time. """
+        flight = self.in_flight.get(key)
+        if flight is None:
+            shared_deadline = deadlines.SharedDeadline([deadlines.current_deadline.get()])
+            context = contextvars.Context()
+            context.run(deadlines.current_deadline.set, shared_deadline)
+            flight = Flight(asyncio.create_task(factory(), context=context), shared_deadline)
+            self.in_flight[key] = flight
+            flight.task.add_done_callback(lambda done: self._finish(key, flight))
+            self.stats[label].executed += 1
+        else:
+            flight.deadline.deadlines.append(deadlines.current_deadline.get())
+            self.stats[label].shared += 1
+
+        remaining = deadlines.remaining()
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight.task),
+                                          None if remaining == float('inf') else max(remaining, 0))
+        except asyncio.TimeoutError:
+            if flight.task.done():
+                # The call itself timed out.
+                raise
+            raise deadlines.exceeded()
+
+    def _finish(self, key, flight: Flight):
+        if self.in_flight.get(key) is flight:
+            del self.in_flight[key]
+        # Mark the exception as retrieved, in case every caller was cancelled before the call failed.
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def get_stats(self) -> dict:
+        return {label: vars(stats).copy() for label, stats in self.stats.items()}
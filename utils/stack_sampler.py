@@ -0,0 +1,85 @@
+import os
+import sys
+import threading
+from collections import Counter
+
+# Frames from files under here are labelled with their module path, e.g. quran.quran_info.
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_labels = {}
+
+
+def frame_label(code) -> str:
+    """ Names a code object as module:function, for collapsed stacks. """
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if filename.startswith(PROJECT_ROOT) and 'site-packages' not in filename:
+            module = os.path.splitext(os.path.relpath(filename, PROJECT_ROOT))[0].replace(os.sep, '.')
+        else:
+            # Dependencies and the standard library, by the package directory and file name.
+            module = '.'.join(os.path.normpath(os.path.splitext(filename)[0]).split(os.sep)[-2:])
+        label = _labels[code] = f'{module}:{getattr(code, "co_qualname", code.co_name)}'
+    return label
+
+
+def collapse(frame) -> str:
+    """ Returns a frame's stack as semicolon-separated labels, outermost first, as flame graph tools expect. """
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+def format_collapsed(samples: Counter) -> str:
+    return ''.join(f'{stack} {count}\n' for stack, count in samples.most_common())
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread (by default the one that creates the sampler) from a background thread,
+    every `interval` seconds, and counts how often each collapsed stack was seen.
+    """
+
+    def __init__(self, interval: float, thread_id: int = None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.samples = Counter()
+        self.lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        stack = collapse(frame)
+        del frame
+        with self.lock:
+            self.samples[stack] += 1
+
+    def take_samples(self) -> Counter:
+        """ Returns the samples counted so far and starts counting afresh. """
+        with self.lock:
+            samples, self.samples = self.samples, Counter()
+        return samples
@@ -0,0 +1,340 @@
+import asyncio
+import configparser
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+import aiomysql
+import aiosqlite
+import pymysql
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+health_check_interval = config.getint('MySQL', 'health_check_interval', fallback=60)
+
+
+@dataclass
+class PoolStats:
+    acquisitions: int = 0
+    total_wait: float = 0
+    max_wait: float = 0
+    health_checks: int = 0
+    health_check_failures: int = 0
+    healthy: bool = False
+
+    def record_wait(self, seconds: float):
+        self.acquisitions += 1
+        self.total_wait += seconds
+        self.max_wait = max(self.max_wait, seconds)
+
+
+class StorageBackend:
+    """
+    Where DBHandler keeps settings. Every table is a key column plus value columns, so backends only need
+    to look up, upsert, delete and scan rows by key.
+    """
+
+    name = None
+
+    def __init__(self):
+        self.stats = PoolStats()
+        self._unavailable_until = 0
+        self._health_check_task = None
+        # Awaited after every successful health check, e.g. to create tables that could not be created at startup.
+        self.on_healthy = None
+
+    async def start(self):
+        raise NotImplementedError
+
+    async def close(self):
+        if self._health_check_task is not None:
+            self._health_check_task.cancel()
+            self._health_check_task = None
+
+    async def ensure_table(self, table_name: str, key_column: str, columns):
+        """ Creates a settings table if it does not exist yet. """
+        raise NotImplementedError
+
+    async def table_exists(self, table_name: str) -> bool:
+        raise NotImplementedError
+
+    async def fetch_row(self, table_name: str, key_column: str, key, columns) -> tuple:
+        raise NotImplementedError
+
+    async def upsert_rows(self, table_name: str, key_column: str, columns, rows: list):
+        """ Inserts or updates many rows at once. Each row is a tuple of the key followed by a value per column. """
+        raise NotImplementedError
+
+    async def delete_rows(self, table_name: str, key_column: str, keys: list):
+        raise NotImplementedError
+
+    async def iterate_rows(self, table_name: str, key_column: str, columns, chunk_size: int):
+        """ Yields every row of a table, a chunk of `chunk_size` rows at a time. """
+        raise NotImplementedError
+        yield
+
+    async def ping(self):
+        raise NotImplementedError
+
+    def is_available(self) -> bool:
+        return time.monotonic() >= self._unavailable_until
+
+    def is_connection_error(self, error: Exception) -> bool:
+        """
+        Whether an error means the backend could not be reached, rather than that a query was wrong (e.g. a missing
+        table), which says nothing about other tables.
+        """
+        return isinstance(error, (asyncio.TimeoutError, OSError))
+
+    def mark_unavailable(self, seconds: float):
+        """ Skips this backend for a while after a failure instead of waiting on it again for every command. """
+        self._unavailable_until = time.monotonic() + seconds
+
+    def start_health_check(self):
+        self._health_check_task = asyncio.create_task(self._health_check_loop())
+
+    async def _health_check_loop(self):
+        while True:
+            await asyncio.sleep(health_check_interval)
+            self.stats.health_checks += 1
+            try:
+                await self.ping()
+                self.stats.healthy = True
+                self._unavailable_until = 0
+                if self.on_healthy is not None:
+                    await self.on_healthy()
+            except Exception as e:
+                self.stats.health_check_failures += 1
+                self.stats.healthy = False
+                print(f'{self.name} health check failed: {e}')
+
+    def get_stats(self) -> dict:
+        stats = self.stats
+        return {
+            'backend': self.name,
+            'acquisitions': stats.acquisitions,
+            'average_wait': stats.total_wait / stats.acquisitions if stats.acquisitions else 0,
+            'max_wait': stats.max_wait,
+            'health_checks': stats.health_checks,
+            'health_check_failures': stats.health_check_failures,
+            'healthy': stats.healthy,
+        }
+
+
+class MySQLBackend(StorageBackend):
+    name = 'mysql'
+
+    def __init__(self):
+        super().__init__()
+        self.pool = None
+        self.host = config['MySQL']['host']
+        self.user = config['MySQL']['user']
+        self.password = config['MySQL']['password']
+        self.database = config['MySQL']['database']
+        self.pool_minsize = config.getint('MySQL', 'pool_minsize', fallback=1)
+        self.pool_maxsize = config.getint('MySQL', 'pool_maxsize', fallback=10)
+        self.pool_recycle = config.getint('MySQL', 'pool_recycle', fallback=3600)
+        self.connect_timeout = config.getfloat('MySQL', 'connect_timeout', fallback=5)
+
+    async def start(self):
+        try:
+            await self._open_pool()
+        except Exception as e:
+            # The bot can run without the database; reads fall back to defaults until the health check reconnects.
+            print(f'Could not create the MySQL connection pool: {e}')
+        self.start_health_check()
+
+    async def _open_pool(self):
+        self.pool = await aiomysql.create_pool(host=self.host, user=self.user, password=self.password, db=self.database,
+                                               minsize=self.pool_minsize, maxsize=self.pool_maxsize,
+                                               pool_recycle=self.pool_recycle, connect_timeout=self.connect_timeout,
+                                               autocommit=True)
+        self.stats.healthy = True
+
+    async def close(self):
+        await super().close()
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self.pool is None:
+            raise pymysql.err.OperationalError(2003, "The database connection pool is not available")
+
+        start = time.perf_counter()
+        async with self.pool.acquire() as connection:
+            self.stats.record_wait(time.perf_counter() - start)
+            yield connection
+
+    async def ping(self):
+        if self.pool is None:
+            await self._open_pool()
+        async with self.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute("SELECT 1")
+
+    def is_connection_error(self, error: Exception) -> bool:
+        # Client errors (2000 and up) are the ones about the connection, e.g. 2003 "Can't connect" or 2013 "Lost
+        # connection"; server errors such as 1146 "Table doesn't exist" are not.
+        if isinstance(error, pymysql.err.InterfaceError):
+            return True
+        if isinstance(error, pymysql.err.OperationalError):
+            return bool(error.args) and isinstance(error.args[0], int) and error.args[0] >= 2000
+        return super().is_connection_error(error)
+
+    async def ensure_table(self, table_name: str, key_column: str, columns):
+        # Numeric settings (e.g. a calculation method ID) get an integer column, everything else a short string.
+        defaults = columns if isinstance(columns, dict) else dict.fromkeys(columns)
+        column_definitions = ', '.join(f"{column} {'INT' if isinstance(default, int) else 'VARCHAR(64)'} NULL"
+                                       for column, default in defaults.items())
+        async with self.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(f"CREATE TABLE IF NOT EXISTS {table_name} "
+                                     f"({key_column} BIGINT NOT NULL PRIMARY KEY, {column_definitions})")
+
+    async def table_exists(self, table_name: str) -> bool:
+        async with self.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute("SHOW TABLES LIKE %s", (table_name,))
+                return await cursor.fetchone() is not None
+
+    async def fetch_row(self, table_name: str, key_column: str, key, columns) -> tuple:
+        async with self.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(f"SELECT {', '.join(columns)} "
+                                     f"FROM {table_name} "
+                                     f"WHERE {key_column} = %s", (key,))
+                return await cursor.fetchone()
+
+    async def upsert_rows(self, table_name: str, key_column: str, columns, rows: list):
+        async with self.acquire() as connection:
+            async with connection.cursor() as cursor:
+                # executemany rewrites this into multi-row INSERT statements.
+                create_sql = f"INSERT INTO {table_name} ({key_column}, {', '.join(columns)}) " \
+                             f"VALUES (%s, {', '.join(['%s'] * len(columns))}) " \
+                             f"ON DUPLICATE KEY UPDATE {', '.join(f'{column}=VALUES({column})' for column in columns)}"
+                await cursor.executemany(create_sql, rows)
+
+    async def delete_rows(self, table_name: str, key_column: str, keys: list):
+        async with self.acquire() as connection:
+            async with connection.cursor() as cursor:
+                for i in range(0, len(keys), 500):
+                    chunk = keys[i:i + 500]
+                    delete_sql = f"DELETE FROM {table_name} WHERE {key_column} IN ({', '.join(['%s'] * len(chunk))})"
+                    await cursor.execute(delete_sql, chunk)
+
+    async def iterate_rows(self, table_name: str, key_column: str, columns, chunk_size: int):
+        async with self.acquire() as connection:
+            # A server-side cursor, so the driver does not buffer the whole result set.
+            async with connection.cursor(aiomysql.SSCursor) as cursor:
+                await cursor.execute(f"SELECT {key_column}, {', '.join(columns)} FROM {table_name}")
+                while chunk := await cursor.fetchmany(chunk_size):
+                    yield chunk
+
+    def get_stats(self) -> dict:
+        return {
+            **super().get_stats(),
+            'size': self.pool.size if self.pool else 0,
+            'free': self.pool.freesize if self.pool else 0,
+            'minsize': self.pool_minsize,
+            'maxsize': self.pool_maxsize,
+        }
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Keeps settings in a local SQLite file, for deployments that do not want to run MySQL.
+
+    A single connection in WAL mode is used through aiosqlite, which runs it on its own thread. Writes
+    arrive in batches from the settings write queue and each batch is committed once.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self):
+        super().__init__()
+        self.path = config.get('Storage', 'sqlite_path', fallback='islambot.db')
+        self.connection = None
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        self.connection = await aiosqlite.connect(self.path)
+        await self.connection.execute("PRAGMA journal_mode=WAL")
+        await self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.stats.healthy = True
+        self.start_health_check()
+
+    async def close(self):
+        await super().close()
+        if self.connection is not None:
+            await self.connection.close()
+            self.connection = None
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self.connection is None:
+            raise aiosqlite.OperationalError("The SQLite database is not open")
+
+        start = time.perf_counter()
+        async with self._lock:
+            self.stats.record_wait(time.perf_counter() - start)
+            yield self.connection
+
+    async def ping(self):
+        async with self.acquire() as connection:
+            await connection.execute("SELECT 1")
+
+    async def ensure_table(self, table_name: str, key_column: str, columns):
+        async with self.acquire() as connection:
+            await connection.execute(f"CREATE TABLE IF NOT EXISTS {table_name} "
+                                     f"({key_column} INTEGER PRIMARY KEY, {', '.join(columns)})")
+            await connection.commit()
+
+    async def table_exists(self, table_name: str) -> bool:
+        async with self.acquire() as connection:
+            async with connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                          (table_name,)) as cursor:
+                return await cursor.fetchone() is not None
+
+    def is_connection_error(self, error: Exception) -> bool:
+        return self.connection is None or super().is_connection_error(error)
+
+    async def fetch_row(self, table_name: str, key_column: str, key, columns) -> tuple:
+        async with self.acquire() as connection:
+            async with connection.execute(f"SELECT {', '.join(columns)} "
+                                          f"FROM {table_name} "
+                                          f"WHERE {key_column} = ?", (key,)) as cursor:
+                return await cursor.fetchone()
+
+    async def upsert_rows(self, table_name: str, key_column: str, columns, rows: list):
+        async with self.acquire() as connection:
+            await connection.executemany(f"INSERT INTO {table_name} ({key_column}, {', '.join(columns)}) "
+                                         f"VALUES (?, {', '.join(['?'] * len(columns))}) "
+                                         f"ON CONFLICT({key_column}) DO UPDATE SET "
+                                         f"{', '.join(f'{column}=excluded.{column}' for column in columns)}", rows)
+            await connection.commit()
+
+    async def delete_rows(self, table_name: str, key_column: str, keys: list):
+        async with self.acquire() as connection:
+            await connection.executemany(f"DELETE FROM {table_name} WHERE {key_column} = ?", [(key,) for key in keys])
+            await connection.commit()
+
+    async def iterate_rows(self, table_name: str, key_column: str, columns, chunk_size: int):
+        async with self.acquire() as connection:
+            async with connection.execute(f"SELECT {key_column}, {', '.join(columns)} FROM {table_name}") as cursor:
+                while chunk := await cursor.fetchmany(chunk_size):
+                    yield chunk
+
+
+BACKENDS = {
+    'mysql': MySQLBackend,
+    'sqlite': SQLiteBackend,
+}
+
+
+def create_backend(name: str = None) -> StorageBackend:
+    name = name or config.get('Storage', 'backend', fallback='mysql')
+    return BACKENDS[name.lower()]()
@@ -0,0 +1,174 @@
+"""
+Lightweight tracing of interactions.
+
+Each interaction gets a tree of spans, kept in a context variable so that any code running on its behalf (including
+tasks it starts) can add to it with `with tracing.span('name'):`. Outside of a trace, spans cost next to nothing and
+record nothing. Traces slower than `slow_threshold` are written to `path` as JSON lines, along with their critical
+path: the chain of spans that the interaction actually had to wait on.
+"""
+import asyncio
+import configparser
+import json
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+import discord
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+enabled = config.getboolean('Tracing', 'enabled', fallback=True)
+path = config.get('Tracing', 'path', fallback='slow_traces.jsonl')
+slow_threshold = config.getfloat('Tracing', 'slow_threshold', fallback=2)
+# The share of slow traces that are exported, and of all other traces, for a baseline to compare against.
+slow_sample_rate = config.getfloat('Tracing', 'slow_sample_rate', fallback=1)
+sample_rate = config.getfloat('Tracing', 'sample_rate', fallback=0)
+
+current_span = ContextVar('current_span', default=None)
+current_trace = ContextVar('current_trace', default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    attributes: dict = field(default_factory=dict)
+    start: float = field(default_factory=time.perf_counter)
+    end: float = None
+    children: list = field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self, origin: float) -> dict:
+        return {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round(self.duration * 1000, 3),
+            **({'attributes': self.attributes} if self.attributes else {}),
+            **({'children': [child.to_dict(origin) for child in self.children]} if self.children else {}),
+        }
+
+
+class _NoSpan:
+    """ Stands in for a span outside of a trace, so callers can set attributes without checking. """
+
+    def set(self, **attributes):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+@dataclass
+class TraceStats:
+    started: int = 0
+    finished: int = 0
+    slow: int = 0
+    exported: int = 0
+
+
+stats = TraceStats()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """ Times the enclosed block as a child of the current span. Yields the span, or NO_SPAN outside of a trace. """
+    parent = current_span.get()
+    if parent is None:
+        yield NO_SPAN
+        return
+
+    child = Span(name, attributes)
+    parent.children.append(child)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.set(error=type(e).__name__)
+        raise
+    finally:
+        child.end = time.perf_counter()
+        current_span.reset(token)
+
+
+def start_trace(interaction: discord.Interaction):
+    """ Makes a new root span current, for the rest of the task handling this interaction. """
+    if not enabled:
+        return
+    stats.started += 1
+    root = Span('interaction', {
+        'interaction_id': interaction.id,
+        'guild_id': interaction.guild_id,
+        'created_at': interaction.created_at.isoformat(),
+        # Time spent reaching us over the gateway, before the trace starts.
+        'queued_ms': round((discord.utils.utcnow() - interaction.created_at).total_seconds() * 1000),
+    })
+    current_trace.set(root)
+    current_span.set(root)
+
+
+def finish_trace(command: str, outcome: str):
+    """ Ends the trace of the interaction being handled, and exports it if it was slow or sampled. """
+    root = current_trace.get()
+    if root is None or root.end is not None:
+        return
+
+    root.end = time.perf_counter()
+    root.name = command
+    root.set(outcome=outcome)
+    stats.finished += 1
+
+    slow = root.duration >= slow_threshold
+    stats.slow += slow
+    if random.random() < (slow_sample_rate if slow else sample_rate):
+        stats.exported += 1
+        export(root, slow)
+
+
+def critical_path(span_: Span, depth: int = 0) -> list:
+    """
+    Returns the spans that the trace had to wait on, in order. Working back from the end of each span, the child
+    that finished last is on the path, then whichever finished last before that child started, and so on.
+    """
+    chain = []
+    cursor = span_.end if span_.end is not None else float('inf')
+    for child in sorted(span_.children, key=lambda c: c.end or 0, reverse=True):
+        if child.end is not None and child.end <= cursor:
+            chain.append(child)
+            cursor = child.start
+
+    steps = [{'name': span_.name, 'depth': depth, 'duration_ms': round(span_.duration * 1000, 3)}]
+    for child in reversed(chain):
+        steps += critical_path(child, depth + 1)
+    return steps
+
+
+def export(root: Span, slow: bool):
+    line = json.dumps({
+        'time': discord.utils.utcnow().isoformat(),
+        'slow': slow,
+        'duration_ms': round(root.duration * 1000, 3),
+        'critical_path': critical_path(root),
+        'trace': root.to_dict(root.start),
+    }, ensure_ascii=False, default=str)
+
+    try:
+        # Keep the file write off the event loop.
+        asyncio.get_running_loop().run_in_executor(None, _append, line)
+    except RuntimeError:
+        _append(line)
+
+
+def _append(line: str):
+    try:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    except OSError as e:
+        print(f'Failed to export trace to {path}: {e}')
@@ -0,0 +1,224 @@
+import asyncio
+import configparser
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+
+from utils import deadlines, tracing
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+
+class Lane(IntEnum):
+    INTERACTIVE = 0  # Requests a user is waiting on
+    BACKGROUND = 1   # Refresh loops, warmers and prefetchers
+
+
+@dataclass
+class LaneStats:
+    requests: int = 0
+    total_wait: float = 0
+    max_wait: float = 0
+    peak_depth: int = 0
+
+    def record_wait(self, seconds: float):
+        self.requests += 1
+        self.total_wait += seconds
+        self.max_wait = max(self.max_wait, seconds)
+
+
+@dataclass
+class HostLimits:
+    max_concurrent: int
+    background_max_concurrent: int
+    rate: float  # Requests per second; 0 means unlimited
+    burst: int
+
+    @classmethod
+    def from_config(cls, host: str) -> 'HostLimits':
+        # A [Upstream Limits <host>] section overrides the defaults in [Upstream Limits].
+        section = f'Upstream Limits {host}' if config.has_section(f'Upstream Limits {host}') else 'Upstream Limits'
+
+        def get(option, fallback):
+            return config.get(section, option, fallback=config.get('Upstream Limits', option, fallback=fallback))
+
+        return cls(
+            max_concurrent=int(get('max_concurrent', 8)),
+            background_max_concurrent=int(get('background_max_concurrent', 2)),
+            rate=float(get('rate', 10)),
+            burst=int(get('burst', 20)),
+        )
+
+
+@dataclass
+class HostGate:
+    """
+    Admission control for one upstream host: at most `max_concurrent` requests at once, started no faster
+    than the token bucket allows. Waiting interactive requests are always admitted before background ones,
+    and background requests may only hold `background_max_concurrent` of the slots, so the rest stay free
+    for commands.
+    """
+
+    limits: HostLimits
+    active: list = field(default_factory=lambda: [0, 0])
+    queues: list = field(default_factory=lambda: [deque(), deque()])
+    lane_stats: list = field(default_factory=lambda: [LaneStats(), LaneStats()])
+    tokens: float = 0
+    refilled_at: float = field(default_factory=time.monotonic)
+    paused_until: float = 0
+    throttled: int = 0
+    rate_limited: int = 0
+    _retry_handle: asyncio.TimerHandle = None
+
+    def __post_init__(self):
+        self.tokens = self.limits.burst
+
+    async def acquire(self, lane: Lane):
+        start = time.monotonic()
+        if not any(self.queues[l] for l in range(lane + 1)) and self._has_capacity(lane) and self._take_token():
+            self._grant(lane, start)
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue = self.queues[lane]
+        queue.append(waiter)
+        self.lane_stats[lane].peak_depth = max(self.lane_stats[lane].peak_depth, len(queue))
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted just as the caller gave up, so hand it on.
+                self.release(lane)
+            elif waiter in queue:
+                # A release may have dropped it from the queue already, when it found it cancelled.
+                queue.remove(waiter)
+            raise
+        self.lane_stats[lane].record_wait(time.monotonic() - start)
+
+    def release(self, lane: Lane):
+        self.active[lane] -= 1
+        self._dispatch()
+
+    def back_off(self, seconds: float):
+        """ Stops admitting requests for `seconds`, after the host has told us to slow down. """
+        self.rate_limited += 1
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _grant(self, lane: Lane, start: float = None):
+        self.active[lane] += 1
+        if start is not None:
+            self.lane_stats[lane].record_wait(time.monotonic() - start)
+
+    def _has_capacity(self, lane: Lane) -> bool:
+        if sum(self.active) >= self.limits.max_concurrent:
+            return False
+        return lane == Lane.INTERACTIVE or self.active[Lane.BACKGROUND] < self.limits.background_max_concurrent
+
+    def _next_lane(self):
+        for lane in Lane:
+            queue = self.queues[lane]
+            while queue and queue[0].done():
+                queue.popleft()
+            if queue:
+                return lane if self._has_capacity(lane) else None
+        return None
+
+    def _dispatch(self):
+        while (lane := self._next_lane()) is not None:
+            if not self._take_token():
+                self._schedule_retry()
+                return
+            self._grant(lane)
+            self.queues[lane].popleft().set_result(None)
+
+    def _take_token(self) -> bool:
+        now = time.monotonic()
+        if now < self.paused_until:
+            return False
+        if not self.limits.rate:
+            return True
+
+        self.tokens = min(self.limits.burst, self.tokens + (now - self.refilled_at) * self.limits.rate)
+        self.refilled_at = now
+        if self.tokens < 1:
+            self.throttled += 1
+            return False
+        self.tokens -= 1
+        return True
+
+    def _schedule_retry(self):
+        if self._retry_handle is not None and not self._retry_handle.cancelled():
+            return
+
+        now = time.monotonic()
+        if now < self.paused_until:
+            delay = self.paused_until - now
+        else:
+            delay = (1 - self.tokens) / self.limits.rate
+
+        def retry():
+            self._retry_handle = None
+            self._dispatch()
+
+        self._retry_handle = asyncio.get_running_loop().call_later(max(delay, 0), retry)
+
+    def get_stats(self) -> dict:
+        return {
+            'max_concurrent': self.limits.max_concurrent,
+            'rate': self.limits.rate,
+            'throttled': self.throttled,
+            'rate_limited': self.rate_limited,
+            **{
+                lane.name.lower(): {
+                    'active': self.active[lane],
+                    'queued': len(self.queues[lane]),
+                    'peak_queued': self.lane_stats[lane].peak_depth,
+                    'requests': self.lane_stats[lane].requests,
+                    'average_wait': self.lane_stats[lane].total_wait / self.lane_stats[lane].requests
+                    if self.lane_stats[lane].requests else 0,
+                    'max_wait': self.lane_stats[lane].max_wait,
+                }
+                for lane in Lane
+            },
+        }
+
+
+class UpstreamGateway:
+    """ Schedules upstream requests through one HostGate per host. """
+
+    def __init__(self):
+        self.gates = {}
+
+    def gate(self, host: str) -> HostGate:
+        gate = self.gates.get(host)
+        if gate is None:
+            gate = self.gates[host] = HostGate(HostLimits.from_config(host))
+        return gate
+
+    @asynccontextmanager
+    async def slot(self, host: str, lane: Lane = Lane.INTERACTIVE):
+        """
+        Holds a slot at the host for the duration. Waits for one only while the deadline leaves time for a request
+        after it, and raises DeadlineExceeded once it does not.
+        """
+        gate = self.gate(host)
+        wait = deadlines.remaining() - deadlines.min_attempt
+        with tracing.span('http.queue', lane=lane.name.lower()):
+            try:
+                await asyncio.wait_for(gate.acquire(lane), None if wait == float('inf') else max(wait, 0))
+            except asyncio.TimeoutError:
+                raise deadlines.exceeded() from None
+        try:
+            yield
+        finally:
+            gate.release(lane)
+
+    def back_off(self, host: str, seconds: float):
+        self.gate(host).back_off(seconds)
+
+    def get_stats(self) -> dict:
+        return {host: gate.get_stats() for host, gate in self.gates.items()}
@@ -1,10 +1,12 @@
 import configparser
 
-import aiohttp
 from bs4 import BeautifulSoup
 from discord import Embed
 import re
 
+from utils import tracing
+from utils.http_client import upstream
+
 config = configparser.ConfigParser()
 config.read('config.ini')
 
@@ -86,17 +88,14 @@ def make_embed(**kwargs):
 
 
 async def get_site_source(url) -> BeautifulSoup:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            text = await resp.read()
-    return BeautifulSoup(text.decode('utf-8', 'ignore'), 'html5lib')
+    response = await upstream.fetch(url)
+    with tracing.span('parse.html', bytes=len(response.body)):
+        return BeautifulSoup(response.text(), 'html5lib')
 
 
 async def get_site_json(url):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as r:
-            data = await r.json()
-    return data
+    response = await upstream.fetch(url)
+    return response.json()
 
 def find_url(link, message):
     urls = re.findall(r'(https?://\S+)', message)